@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+#
+#   Copyright 2026 Valory AG
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+# ------------------------------------------------------------------------------
+
+"""Utilities to fetch IPFS contents from several gateways and cache them locally."""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+from scripts.predict_trader import metrics
+
+SCRIPT_PATH = Path(__file__).resolve().parent
+IPFS_CACHE_PATH = Path(SCRIPT_PATH.parents[1], "data", "ipfs_cache")
+IPFS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Eviction frees space down to this fraction of the cap, so that a full cache
+# does not trigger a directory scan on every subsequent write.
+IPFS_CACHE_EVICTION_RATIO = 0.9
+_CID_RE = re.compile(r"^[A-Za-z0-9]+$")
+IPFS_GATEWAYS = [
+    "https://gateway.autonolas.tech/ipfs/",
+    "https://ipfs.io/ipfs/",
+    "https://dweb.link/ipfs/",
+]
+# Environment variable overriding the gateways, as a comma-separated list.
+IPFS_GATEWAYS_ENV_VAR = "IPFS_GATEWAYS"
+IPFS_REQUEST_TIMEOUT = 30
+# Statuses answering that there is no such path. Any other error (e.g. rate
+# limits or timeouts) is transient, and the path is fetched again later.
+IPFS_NOT_FOUND_STATUS_CODES = (404, 410)
+# A request to another gateway is raced against a request still pending after
+# this percentile of the recent latencies of the gateway serving it.
+IPFS_HEDGE_PERCENTILE = 0.9
+IPFS_HEDGE_DEFAULT_DELAY = 2.0
+IPFS_HEDGE_MIN_SAMPLES = 5
+IPFS_HEDGE_MAX_WORKERS = 32
+IPFS_GATEWAY_STATS_WINDOW = 100
+
+
+class IpfsFetchError(Exception):
+    """Raised when no IPFS gateway returned valid JSON contents.
+
+    `not_found` tells whether the gateways answered that there is no JSON
+    document at the path, as opposed to failing to answer at all.
+    """
+
+    def __init__(self, message: str, not_found: bool = False) -> None:
+        """Initialize the error."""
+        super().__init__(message)
+        self.not_found = not_found
+
+
+class IpfsCache:
+    """Content-addressed on-disk cache of IPFS JSON documents.
+
+    IPFS contents are immutable by CID, so an entry never needs to be
+    invalidated; it is only evicted (least recently used first) once the
+    cache grows beyond `max_bytes`. Besides contents, an entry may record
+    the paths of the CID known not to hold a JSON document, so that they
+    are never probed again. Each entry is stored in its own file, which
+    makes the cache safe to share between senders, runs and processes.
+    """
+
+    def __init__(
+        self, path: Path = IPFS_CACHE_PATH, max_bytes: int = IPFS_CACHE_MAX_BYTES
+    ) -> None:
+        """Initialize the cache."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+
+    def _entry_path(self, cid: str) -> Optional[Path]:
+        if not _CID_RE.match(cid):
+            return None
+        return self.path / f"{cid}.json"
+
+    def get(self, cid: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for the CID, if any."""
+        entry_path = self._entry_path(cid)
+        if entry_path is None:
+            return None
+
+        try:
+            with open(entry_path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+            # The modification time tracks the last access for the LRU policy.
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+
+        return entry
+
+    def put(self, cid: str, entry: Dict[str, Any]) -> None:
+        """Store the entry for the CID, evicting old entries if needed."""
+        entry_path = self._entry_path(cid)
+        if entry_path is None:
+            return
+
+        data = json.dumps(entry).encode("utf-8")
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_name(
+            f"{entry_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, entry_path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, _, size in self._scan())
+            else:
+                self._total_bytes += len(data)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self) -> List[Tuple[float, Path, int]]:
+        entries = []
+        for entry_path in self.path.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, entry_path, stat.st_size))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        total_bytes = sum(size for _, _, size in entries)
+        target_bytes = self.max_bytes * IPFS_CACHE_EVICTION_RATIO
+
+        for _, entry_path, size in entries:
+            if total_bytes <= target_bytes:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= size
+
+        self._total_bytes = total_bytes
+
+
+class IpfsGatewayStats:
+    """Outcomes of the recent requests to an IPFS gateway."""
+
+    def __init__(self) -> None:
+        """Initialize the stats."""
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[bool, float]] = deque(
+            maxlen=IPFS_GATEWAY_STATS_WINDOW
+        )
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Record the outcome of a request."""
+        with self._lock:
+            self._outcomes.append((ok, latency))
+            self.requests += 1
+            self.errors += not ok
+
+    def error_rate(self) -> float:
+        """Return the rate of failed recent requests."""
+        with self._lock:
+            outcomes = list(self._outcomes)
+        if not outcomes:
+            return 0.0
+        return sum(not ok for ok, _ in outcomes) / len(outcomes)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Return a percentile of the latencies of the recent successful requests."""
+        with self._lock:
+            latencies = sorted(latency for ok, latency in self._outcomes if ok)
+        if len(latencies) < IPFS_HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[
+            min(len(latencies) - 1, math.ceil(percentile * len(latencies)) - 1)
+        ]
+
+
+class IpfsGateways:
+    """Hedged retrieval of IPFS JSON documents from several gateways.
+
+    Gateways are tried in order of their recent error rate and median
+    latency. If the request to a gateway fails, or is still pending after
+    `IPFS_HEDGE_PERCENTILE` of its recent latencies, a request to the next
+    gateway is raced against it, and the first valid JSON wins.
+    """
+
+    def __init__(self, gateways: Optional[List[str]] = None) -> None:
+        """Initialize the gateways."""
+        if gateways is None and os.getenv(IPFS_GATEWAYS_ENV_VAR):
+            gateways = os.environ[IPFS_GATEWAYS_ENV_VAR].split(",")
+        self.gateways = list(gateways or IPFS_GATEWAYS)
+        self.stats = {gateway: IpfsGatewayStats() for gateway in self.gateways}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def ranked(self) -> List[str]:
+        """Return the gateways, best first."""
+
+        def _score(gateway: str) -> Tuple[float, float]:
+            stats = self.stats[gateway]
+            median = stats.latency_percentile(0.5)
+            return (
+                stats.error_rate(),
+                IPFS_HEDGE_DEFAULT_DELAY if median is None else median,
+            )
+
+        return sorted(self.gateways, key=_score)
+
+    def hedge_delay(self, gateway: str) -> float:
+        """Return how long to wait for the gateway before racing another one."""
+        delay = self.stats[gateway].latency_percentile(IPFS_HEDGE_PERCENTILE)
+        return IPFS_HEDGE_DEFAULT_DELAY if delay is None else delay
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=IPFS_HEDGE_MAX_WORKERS,
+                    thread_name_prefix="ipfs-gateway",
+                )
+            return self._executor
+
+    def _record(self, gateway: str, start: float, ok: bool) -> None:
+        latency = time.monotonic() - start
+        self.stats[gateway].record(latency, ok)
+        metrics.sync_metrics.record_ipfs_request(gateway, latency, ok)
+
+    def _fetch(self, gateway: str, path: str) -> Tuple[str, Any]:
+        url = f"{gateway}{path}"
+        start = time.monotonic()
+        try:
+            response = requests.get(url, timeout=IPFS_REQUEST_TIMEOUT)
+            response.raise_for_status()
+            contents = response.json()
+        except ValueError as e:
+            # The gateway is fine, the document is just not JSON.
+            self._record(gateway, start, ok=True)
+            raise IpfsFetchError(f"{url} is not a JSON document.", True) from e
+        except requests.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else 500
+            not_found = status_code in IPFS_NOT_FOUND_STATUS_CODES
+            self._record(gateway, start, ok=not_found)
+            raise IpfsFetchError(f"{url} could not be fetched: {e}", not_found) from e
+        except Exception as e:  # pylint: disable=broad-except
+            self._record(gateway, start, ok=False)
+            raise IpfsFetchError(f"{url} could not be fetched: {e}") from e
+
+        self._record(gateway, start, ok=True)
+        return url, contents
+
+    def fetch_json(self, path: str) -> Tuple[str, Any]:
+        """Return the URL and the contents of the first valid JSON found for the path."""
+        gateways = self.ranked()
+        executor = self._get_executor()
+        pending: Dict[Future, str] = {}
+        errors: List[IpfsFetchError] = []
+
+        def _race_next_gateway() -> None:
+            gateway = gateways[len(pending) + len(errors)]
+            pending[executor.submit(self._fetch, gateway, path)] = gateway
+
+        _race_next_gateway()
+        try:
+            while pending:
+                can_hedge = len(pending) + len(errors) < len(gateways)
+                done, _ = wait(
+                    pending,
+                    timeout=(
+                        min(self.hedge_delay(gateway) for gateway in pending.values())
+                        if can_hedge
+                        else None
+                    ),
+                    return_when=FIRST_COMPLETED,
+                )
+                if not done:
+                    _race_next_gateway()
+                    continue
+
+                for future in done:
+                    del pending[future]
+                    try:
+                        return future.result()
+                    except IpfsFetchError as e:
+                        errors.append(e)
+                        if len(pending) + len(errors) < len(gateways):
+                            _race_next_gateway()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        raise IpfsFetchError(
+            "; ".join(str(error) for error in errors),
+            all(error.not_found for error in errors),
+        )
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Return the request count, error count and latency percentiles of every gateway."""
+        return {
+            gateway: {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "latency_p50": stats.latency_percentile(0.5),
+                "latency_p90": stats.latency_percentile(0.9),
+            }
+            for gateway, stats in self.stats.items()
+        }
+
+
+ipfs_cache = IpfsCache()
+ipfs_gateways = IpfsGateways()
@@ -22,42 +22,79 @@
 
 import json
 import os
-import sys
+import re
 import time
 import traceback
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache, partial
 from pathlib import Path
 from string import Template
-from typing import Any, ClassVar, Dict, Optional
+from typing import Any, ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from gql import Client, gql
+from gql.client import SyncClientSession
 from gql.transport.requests import RequestsHTTPTransport
+from graphql import DocumentNode
+from scripts.predict_trader import ipfs, metrics
+from scripts.predict_trader.mech_events_db import (
+    MechEventsStore,
+    add_mech_db_arguments,
+    add_mech_request_keys,
+    open_mech_events_store,
+)
 from tqdm import tqdm
 from web3.datastructures import AttributeDict
 
 SCRIPT_PATH = Path(__file__).resolve().parent
-MECH_EVENTS_JSON_PATH = Path(SCRIPT_PATH.parents[1], "data", "mech_events.json")
 HTTP = "http://"
 HTTPS = HTTP[:4] + "s" + HTTP[4:]
 CID_PREFIX = "f01701220"
 IPFS_ADDRESS = f"{HTTPS}gateway.autonolas.tech/ipfs/"
-MECH_EVENTS_DB_VERSION = 3
 DEFAULT_MECH_FEE = 10000000000000000
 DEFAULT_FROM_TIMESTAMP = 0
 DEFAULT_TO_TIMESTAMP = 2147483647
 MECH_SUBGRAPH_URL_TEMPLATE = (
     "https://api.subgraph.autonolas.tech/api/proxy/marketplace-gnosis"
 )
+# Environment variable overriding the URL of the subgraph, e.g., to point the
+# sync at the local stand-in server of `standin_server.py`.
+MECH_SUBGRAPH_URL_ENV_VAR = "MECH_SUBGRAPH_URL"
 SUBGRAPH_HEADERS = {
     "Accept": "application/json, multipart/mixed",
     "Content-Type": "application/json",
 }
+MECH_SUBGRAPH_SCHEMA_PATH = Path(
+    SCRIPT_PATH.parents[1], "data", "mech_subgraph_schema.json"
+)
+MECH_SUBGRAPH_SCHEMA_TTL = 24 * 60 * 60
 QUERY_BATCH_SIZE = 1000
+IPFS_FETCH_MAX_WORKERS = 16
+MECH_FEES_RPC_BATCH_SIZE = 100
+MECH_FEES_RPC_MAX_WORKERS = 4
+SAFE_EXEC_TRANSACTION_SELECTOR = "0x6a761202"
+MULTI_SEND_SELECTOR = "8d80ff0a"
+MECH_SYNC_INTERVAL = 5 * 60
 MECH_EVENTS_SUBGRAPH_QUERY_TEMPLATE = Template("""
-    query mech_events_subgraph_query($sender: String, $id_gt: ID, $first: Int)  {
+    query mech_events_subgraph_query(
+        $senders: [String!],
+        $id_gt: ID,
+        $block_number_gte: BigInt,
+        $block_timestamp_gte: BigInt,
+        $block_timestamp_lte: BigInt,
+        $first: Int
+    )  {
         ${subgraph_event_set_name}(
-            where: {sender: $sender, id_gt: $id_gt}
+            where: {
+                sender_in: $senders,
+                id_gt: $id_gt,
+                blockNumber_gte: $block_number_gte,
+                blockTimestamp_gte: $block_timestamp_gte,
+                blockTimestamp_lte: $block_timestamp_lte
+            }
             first: $first
             orderBy: id
             orderDirection: asc
@@ -84,6 +121,16 @@ MECH_EVENTS_SUBGRAPH_QUERY_TEMPLATE = Template("""
     """)
 
 
+def _project_mech_event_data(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the compact record of a resolved event.
+
+    The IPFS payload is dropped, keeping the tool and the normalized question
+    of the request, which is all the statistics need. The full payload stays
+    in the IPFS cache.
+    """
+    return {key: value for key, value in event_data.items() if key != "ipfs_contents"}
+
+
 @dataclass
 class MechBaseEvent:  # pylint: disable=too-many-instance-attributes
     """Base class for mech's on-chain event representation."""
@@ -122,32 +169,74 @@ class MechBaseEvent:  # pylint: disable=too-many-instance-attributes
         self.block_timestamp = block_timestamp
         self.ipfs_link = ""
         self.ipfs_contents = {}
-        self._populate_ipfs_contents()
 
-    def _populate_ipfs_contents(self) -> None:
-        """Populate the IPFS contents."""
+    @classmethod
+    def from_dict(cls, event_data: Dict[str, Any]) -> "MechBaseEvent":
+        """Rebuild an event from its record in the local database."""
+        mech_event = cls.__new__(cls)
+        mech_event.__dict__.update(event_data)
+        return mech_event
+
+    @property
+    def cid(self) -> Optional[str]:
+        """The CID of the IPFS contents of the event."""
         if self.ipfs_hash:
-            url = f"{IPFS_ADDRESS}{self.ipfs_hash}"
-        elif self.ipfs_hash_bytes:
-            url = f"{IPFS_ADDRESS}{CID_PREFIX}{self.ipfs_hash_bytes}"
-        else:
+            return self.ipfs_hash
+        if self.ipfs_hash_bytes:
+            return f"{CID_PREFIX}{self.ipfs_hash_bytes}"
+        return None
+
+    def _populate_ipfs_contents(self) -> None:
+        """Populate the IPFS contents, from the local IPFS cache if possible.
+
+        Failures are reported without interrupting the sync: the contents are
+        left empty, and are fetched again on the next sync.
+        """
+        cid = self.cid
+        if not cid:
             print(
                 f"WARNING: No IPFS hash found for Mech event {self.event_name} with ID {self.event_id}."
             )
             return
 
-        for _url in [f"{url}/metadata.json", url]:
+        url = f"{IPFS_ADDRESS}{cid}"
+        cached = ipfs.ipfs_cache.get(cid) or {}
+        if "contents" in cached:
+            metrics.sync_metrics.record_ipfs_cache(hit=True)
+            path = cached["path"]
+            self.ipfs_contents = cached["contents"]
+            self.ipfs_link = f"{url}/{path}" if path else url
+            return
+
+        # Paths that the gateways answered not to hold a JSON document are
+        # remembered, so that they are never probed again for this CID.
+        missing = set(cached.get("missing", []))
+        paths = [path for path in ["metadata.json", ""] if path not in missing]
+        metrics.sync_metrics.record_ipfs_cache(hit=not paths)
+        errors = []
+        for path in paths:
             try:
-                response = requests.get(_url, timeout=30)
-                response.raise_for_status()
-                self.ipfs_contents = response.json()
-                self.ipfs_link = _url
-            except json.JSONDecodeError:
+                self.ipfs_link, self.ipfs_contents = ipfs.ipfs_gateways.fetch_json(
+                    f"{cid}/{path}" if path else cid
+                )
+            except ipfs.IpfsFetchError as e:
+                errors.append(str(e))
+                if e.not_found:
+                    missing.add(path)
                 continue
 
-            except Exception:  # pylint: disable=broad-except
-                print(traceback.format_exc())
-                input("Press Enter to continue...")
+            ipfs.ipfs_cache.put(cid, {"path": path, "contents": self.ipfs_contents})
+            return
+
+        if missing != set(cached.get("missing", [])):
+            ipfs.ipfs_cache.put(cid, {"missing": sorted(missing)})
+        if not errors:
+            # The CID is known to resolve to nothing.
+            return
+        print(
+            f"WARNING: Could not fetch the IPFS contents of Mech event {self.event_name} "
+            f"with ID {self.event_id}: {'; '.join(errors)}"
+        )
 
 
 @dataclass
@@ -180,126 +269,260 @@ class MechRequest(MechBaseEvent):
         )
 
         self.request_id = self.event_id
-        # TODO This should be updated to extract the fee from the transaction.
+        # Replaced by the fee paid on-chain once resolved by `_update_mech_fees`.
         self.fee = DEFAULT_MECH_FEE
 
 
-def _read_mech_events_data_from_file() -> Dict[str, Any]:
-    """Read Mech events data from the JSON file."""
+def _read_cached_mech_subgraph_introspection() -> Optional[Dict[str, Any]]:
+    """Return the cached introspection of the subgraph schema, unless expired."""
     try:
-        with open(MECH_EVENTS_JSON_PATH, "r", encoding="utf-8") as file:
-            mech_events_data = json.load(file)
-
-        # Check if it is an old DB version
-        if mech_events_data.get("db_version", 0) < MECH_EVENTS_DB_VERSION:
-            current_time = time.strftime("%Y-%m-%d_%H-%M-%S")
-            old_db_filename = f"mech_events.{current_time}.old.json"
-            os.rename(
-                MECH_EVENTS_JSON_PATH, MECH_EVENTS_JSON_PATH.parent / old_db_filename
-            )
-            mech_events_data = {}
-            mech_events_data["db_version"] = MECH_EVENTS_DB_VERSION
-    except FileNotFoundError:
-        mech_events_data = {}
-        mech_events_data["db_version"] = MECH_EVENTS_DB_VERSION
-    except json.decoder.JSONDecodeError:
-        print(
-            f'\nERROR: The local Mech events database "{MECH_EVENTS_JSON_PATH.resolve()}" is corrupted. Please try delete or rename the file, and run the script again.'
-        )
-        sys.exit(1)
-
-    return mech_events_data
-
-
-MINIMUM_WRITE_FILE_DELAY = 20
-last_write_time = 0.0
+        schema_age = time.time() - MECH_SUBGRAPH_SCHEMA_PATH.stat().st_mtime
+        if schema_age > MECH_SUBGRAPH_SCHEMA_TTL:
+            return None
+        with open(MECH_SUBGRAPH_SCHEMA_PATH, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached_mech_subgraph_introspection(introspection: Dict[str, Any]) -> None:
+    MECH_SUBGRAPH_SCHEMA_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MECH_SUBGRAPH_SCHEMA_PATH.with_name(
+        f"{MECH_SUBGRAPH_SCHEMA_PATH.name}.{os.getpid()}.tmp"
+    )
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(introspection, file)
+    os.replace(tmp_path, MECH_SUBGRAPH_SCHEMA_PATH)
+
+
+@lru_cache(maxsize=1)
+def _get_mech_subgraph_session() -> SyncClientSession:
+    """Return the session shared by all the queries to the mech subgraph.
+
+    The session keeps its HTTP connection alive between queries, and the
+    subgraph schema is only introspected once per `MECH_SUBGRAPH_SCHEMA_TTL`.
+    A subgraph overridden by `MECH_SUBGRAPH_URL_ENV_VAR` is queried without
+    its schema, which may differ from the cached one.
+    """
+    url = os.getenv(MECH_SUBGRAPH_URL_ENV_VAR)
+    if url:
+        return Client(transport=RequestsHTTPTransport(url)).connect_sync()
+
+    introspection = _read_cached_mech_subgraph_introspection()
+    client = Client(
+        transport=RequestsHTTPTransport(MECH_SUBGRAPH_URL_TEMPLATE),
+        introspection=introspection,
+        fetch_schema_from_transport=introspection is None,
+    )
+    session = client.connect_sync()
+    if introspection is None:
+        _write_cached_mech_subgraph_introspection(client.introspection)
+    return session
 
 
-def _write_mech_events_data_to_file(
-    mech_events_data: Dict[str, Any], force_write: bool = False
-) -> None:
-    global last_write_time  # pylint: disable=global-statement
-    now = time.time()
+@lru_cache(maxsize=None)
+def _parse_subgraph_query(query: str) -> DocumentNode:
+    """Parse a subgraph query, once per query string."""
+    return gql(query)
 
-    if force_write or (now - last_write_time) >= MINIMUM_WRITE_FILE_DELAY:
-        with open(MECH_EVENTS_JSON_PATH, "w", encoding="utf-8") as file:
-            json.dump(mech_events_data, file, indent=2)
-        last_write_time = now
 
+def _iter_mech_events_subgraph_pages(
+    senders: List[str],
+    event_cls: type[MechBaseEvent],
+    from_block: int = 0,
+    from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
+    to_timestamp: float = DEFAULT_TO_TIMESTAMP,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Query the subgraph for the events of the senders from the given block number onwards.
 
-def _query_mech_events_subgraph(
-    sender: str, event_cls: type[MechBaseEvent]
-) -> dict[str, Any]:
-    """Query the subgraph."""
+    Only the events within the (inclusive) timestamp range are queried. The
+    events of all the senders are paginated together. Pages are yielded as
+    soon as they are received, so that the caller can process a page while
+    the next one is being queried.
+    """
 
-    transport = RequestsHTTPTransport(MECH_SUBGRAPH_URL_TEMPLATE)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    session = _get_mech_subgraph_session()
 
     subgraph_event_set_name = f"{event_cls.subgraph_event_name}s"
-    all_results: dict[str, Any] = {"data": {subgraph_event_set_name: []}}
-    query = MECH_EVENTS_SUBGRAPH_QUERY_TEMPLATE.safe_substitute(
-        subgraph_event_set_name=subgraph_event_set_name
+    query = _parse_subgraph_query(
+        MECH_EVENTS_SUBGRAPH_QUERY_TEMPLATE.safe_substitute(
+            subgraph_event_set_name=subgraph_event_set_name
+        )
     )
     id_gt = ""
     while True:
         variables = {
-            "sender": sender,
+            "senders": senders,
             "id_gt": id_gt,
+            "block_number_gte": str(from_block),
+            "block_timestamp_gte": str(int(from_timestamp)),
+            "block_timestamp_lte": str(int(to_timestamp)),
             "first": QUERY_BATCH_SIZE,
         }
-        response = client.execute(gql(query), variable_values=variables)
+        start = time.monotonic()
+        response = session.execute(query, variable_values=variables)
         events = response.get(subgraph_event_set_name, [])
+        metrics.sync_metrics.record_subgraph_page(len(events), time.monotonic() - start)
 
         if not events:
-            break
+            return
 
-        all_results["data"][subgraph_event_set_name].extend(events)
+        yield events
         id_gt = events[len(events) - 1]["id"]
 
-    return all_results
+
+def _populate_ipfs_contents_concurrently(
+    batches: Iterable[List[MechBaseEvent]],
+    max_workers: int = IPFS_FETCH_MAX_WORKERS,
+) -> Iterator[MechBaseEvent]:
+    """Resolve the IPFS contents of batches of events using a bounded thread pool.
+
+    The contents of a batch are resolved while the next batch is being
+    produced, and the events of a batch are yielded once the next batch has
+    been submitted. At most two batches are held at any time, however many
+    batches there are.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        in_flight: List[Tuple[MechBaseEvent, Future]] = []
+        for batch in batches:
+            submitted = [
+                (mech_event, executor.submit(mech_event._populate_ipfs_contents))
+                for mech_event in batch
+            ]
+            for mech_event, future in in_flight:
+                future.result()
+                yield mech_event
+            in_flight = submitted
+
+        for mech_event, future in in_flight:
+            future.result()
+            yield mech_event
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 # pylint: disable=too-many-locals
 def _update_mech_events_db(
-    sender: str,
+    senders: List[str],
     event_cls: type[MechBaseEvent],
+    store: MechEventsStore,
+    ipfs_max_workers: int = IPFS_FETCH_MAX_WORKERS,
+    full_resync: bool = False,
+    compact: bool = False,
+    interactive: bool = True,
+    from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
+    to_timestamp: float = DEFAULT_TO_TIMESTAMP,
 ) -> None:
-    """Get the mech Events database."""
+    """Update the mech Events database of the senders in a single pass.
+
+    Only the events from the block of the earliest sync cursor of the senders
+    onwards are queried, unless `full_resync` is set. The cursors are
+    advanced once all of them are stored, and events of the cursor block are
+    queried again on the next run, so that none is missed if the subgraph
+    had only partially indexed the block.
+
+    If `compact` is set, resolved events are stored as their compact
+    projection, without their IPFS payload. Unless `interactive` is set, a
+    failed update does not wait for the user, and a cancelled one is raised.
+
+    Only the events within the (inclusive) timestamp range are queried. As
+    the events before `from_timestamp` are skipped, a windowed update leaves
+    the cursors in place, unless the window starts at the origin.
+    """
 
     print(
         f"Updating the local Mech events database. This may take a while.\n"
         f"             Event: {event_cls.event_name}\n"
-        f"    Sender address: {sender}"
+        f"    Sender address: {', '.join(senders)}"
     )
 
     try:
-        # Query the subgraph
-        query = _query_mech_events_subgraph(sender, event_cls)
-        subgraph_data = query["data"]
-
-        # Read the current Mech events database
-        mech_events_data = _read_mech_events_data_from_file()
-        stored_events = mech_events_data.setdefault(sender, {}).setdefault(
-            event_cls.event_name, {}
-        )
-
-        subgraph_event_set_name = f"{event_cls.subgraph_event_name}s"
-        for subgraph_event in tqdm(
-            subgraph_data[subgraph_event_set_name],
+        # Route the events by lowercase address, as the subgraph IDs and the
+        # given senders may not share the same checksum casing.
+        senders_by_id = {sender.lower(): sender for sender in senders}
+        cursors = {
+            sender: (
+                None if full_resync else store.get_cursor(sender, event_cls.event_name)
+            )
+            for sender in senders
+        }
+        from_block = min((cursor or 0 for cursor in cursors.values()), default=0)
+        last_block: Optional[int] = None
+
+        def _new_mech_events() -> Iterator[List[MechBaseEvent]]:
+            nonlocal last_block
+
+            # Events before the cursor are not queried again: retry the stored
+            # events whose IPFS contents could not be resolved, page by page.
+            retried_events = [
+                event_data
+                for sender in senders
+                for event_data in store.get_unresolved_events(
+                    sender, event_cls.event_name
+                )
+                if int(event_data["block_number"]) < from_block
+                and from_timestamp <= int(event_data["block_timestamp"]) <= to_timestamp
+            ]
+            for i in range(0, len(retried_events), QUERY_BATCH_SIZE):
+                yield [
+                    event_cls.from_dict(event_data)
+                    for event_data in retried_events[i : i + QUERY_BATCH_SIZE]
+                ]
+
+            for page in _iter_mech_events_subgraph_pages(
+                senders,
+                event_cls,
+                from_block,
+                from_timestamp=from_timestamp,
+                to_timestamp=to_timestamp,
+            ):
+                last_block = max(
+                    last_block or 0,
+                    *(int(subgraph_event["blockNumber"]) for subgraph_event in page),
+                )
+                page_ids = defaultdict(list)
+                for subgraph_event in page:
+                    page_ids[
+                        senders_by_id[subgraph_event["sender"]["id"].lower()]
+                    ].append(subgraph_event["id"])
+                resolved_ids = set().union(
+                    *(
+                        store.get_resolved_ids(sender, event_cls.event_name, event_ids)
+                        for sender, event_ids in page_ids.items()
+                    )
+                )
+                yield [
+                    event_cls(subgraph_event)  # type: ignore
+                    for subgraph_event in page
+                    if subgraph_event["id"] not in resolved_ids
+                ]
+
+        for mech_event in tqdm(
+            _populate_ipfs_contents_concurrently(_new_mech_events(), ipfs_max_workers),
             miniters=1,
             desc="        Processing",
         ):
-            if subgraph_event["id"] not in stored_events or not stored_events.get(
-                subgraph_event["id"], {}
-            ).get("ipfs_contents"):
-                mech_event = event_cls(subgraph_event)  # type: ignore
-                stored_events[mech_event.event_id] = mech_event.__dict__
+            event_data = add_mech_request_keys(mech_event.__dict__)
+            if compact and event_data["ipfs_contents"]:
+                event_data = _project_mech_event_data(event_data)
+            store.upsert_event(
+                senders_by_id[mech_event.sender.lower()],
+                event_cls.event_name,
+                event_data,
+            )
 
-                _write_mech_events_data_to_file(mech_events_data=mech_events_data)
+        # All the events of every sender from `from_block` up to `last_block`
+        # have been stored, unless the earliest ones were outside the window.
+        # The end of the window is not a concern: the events up to
+        # `last_block` are all before it.
+        if from_timestamp <= DEFAULT_FROM_TIMESTAMP:
+            for sender, cursor in cursors.items():
+                new_cursor = max(cursor or 0, last_block or 0)
+                if new_cursor and new_cursor != cursor:
+                    store.set_cursor(sender, event_cls.event_name, new_cursor)
 
-        _write_mech_events_data_to_file(
-            mech_events_data=mech_events_data, force_write=True
-        )
+        store.flush()
 
     except KeyboardInterrupt:
         print(
@@ -308,6 +531,8 @@ def _update_mech_events_db(
             "Therefore, the Mech calls and costs might not be reflected accurately. "
             "You may attempt to rerun this script to retry synchronizing the database."
         )
+        if not interactive:
+            raise
         input("Press Enter to continue...")
     except Exception:  # pylint: disable=broad-except
         print(traceback.format_exc())
@@ -316,32 +541,331 @@ def _update_mech_events_db(
             "Therefore, the Mech calls and costs might not be reflected accurately. "
             "You may attempt to rerun this script to retry synchronizing the database."
         )
-        input("Press Enter to continue...")
+        if interactive:
+            input("Press Enter to continue...")
 
     print("")
 
 
-def _get_mech_events(sender: str, event_cls: type[MechBaseEvent]) -> Dict[str, Any]:
-    """Updates the local database of Mech events and returns the Mech events."""
+def _get_transactions(
+    rpc: str, transaction_hashes: List[str]
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Fetch transactions with a single JSON-RPC batch call."""
+    response = requests.post(
+        rpc,
+        json=[
+            {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": "eth_getTransactionByHash",
+                "params": [transaction_hash],
+            }
+            for request_id, transaction_hash in enumerate(transaction_hashes)
+        ],
+        timeout=30,
+    )
+    response.raise_for_status()
+    results = response.json()
+    if not isinstance(results, list):
+        raise ValueError(f"The RPC does not support batch requests: {results}")
+
+    transactions = {result["id"]: result.get("result") for result in results}
+    return {
+        transaction_hash: transactions.get(request_id)
+        for request_id, transaction_hash in enumerate(transaction_hashes)
+    }
+
 
-    _update_mech_events_db(sender, event_cls)
-    mech_events_data = _read_mech_events_data_from_file()
-    sender_data = mech_events_data.get(sender, {})
-    return sender_data.get(event_cls.event_name, {})
+def _abi_word(arguments: str, index: int) -> int:
+    """Return a 32-byte word of hex ABI-encoded arguments as an integer."""
+    return int(arguments[64 * index : 64 * (index + 1)], 16)
+
+
+def _abi_bytes(arguments: str, index: int) -> str:
+    """Return a dynamic `bytes` argument of hex ABI-encoded arguments, as hex."""
+    offset = 2 * _abi_word(arguments, index)
+    length = 2 * int(arguments[offset : offset + 64], 16)
+    data = arguments[offset + 64 : offset + 64 + length]
+    if len(data) != length:
+        raise ValueError("Truncated ABI-encoded bytes.")
+    return data
+
+
+def _get_multi_send_value(transactions: str) -> int:
+    """Return the value paid by the calls packed in a MultiSend payload.
+
+    The payment of a Mech request cannot be told apart from other transfers
+    batched with it, so a payload paying more than one call is not decoded.
+    """
+    values = []
+    while transactions:
+        # operation (uint8), to (address), value (uint256), data length (uint256), data
+        if len(transactions) < 170:
+            raise ValueError("Truncated MultiSend transaction.")
+        operation = int(transactions[:2], 16)
+        value = int(transactions[42:106], 16)
+        if operation == 0 and value:
+            values.append(value)
+        transactions = transactions[170 + 2 * int(transactions[106:170], 16) :]
+    if len(values) > 1:
+        raise ValueError("MultiSend payload with several payments.")
+    return sum(values)
+
+
+def _get_transaction_value(transaction: Dict[str, Any]) -> Optional[int]:
+    """Return the value paid by a transaction, or by the Safe transaction it executes.
+
+    A Safe transaction either forwards a value, or delegatecalls MultiSend
+    with the payment encoded in its payload. Returns 0 if no value is paid,
+    and None if the calldata cannot be decoded.
+    """
+    value = int(transaction["value"], 16)
+    data = transaction.get("input", "")
+    if value or not data.startswith(SAFE_EXEC_TRANSACTION_SELECTOR):
+        return value
+
+    # execTransaction(address to, uint256 value, bytes data, uint8 operation, ...)
+    arguments = data[len(SAFE_EXEC_TRANSACTION_SELECTOR) :]
+    try:
+        value = _abi_word(arguments, 1)
+        safe_data = _abi_bytes(arguments, 2)
+        if not value and safe_data.startswith(MULTI_SEND_SELECTOR):
+            # multiSend(bytes transactions)
+            value = _get_multi_send_value(
+                _abi_bytes(safe_data[len(MULTI_SEND_SELECTOR) :], 0)
+            )
+    except ValueError:
+        return None
+    return value
+
+
+def _update_mech_fees(senders: List[str], store: MechEventsStore, rpc: str) -> None:
+    """Replace the default fee of the stored Mech requests by the fee paid on-chain.
+
+    The transactions of the requests are fetched with JSON-RPC batch calls, and
+    their value is split between the requests they made. Once its transaction
+    is fetched, the fee of a request is resolved, and its `fee_source` tells
+    whether it was paid by the `transaction`, from a `prepaid` balance (no
+    value), or is `unknown` (the transaction is not found, or its calldata
+    cannot be decoded); the latter two keep the default fee. Only requests
+    whose transaction could not be fetched are retried on the next run.
+    """
+    requests_by_transaction = defaultdict(list)
+    for sender in senders:
+        for event_data in store.get_unresolved_fee_events(
+            sender, MechRequest.event_name
+        ):
+            requests_by_transaction[event_data["transaction_hash"]].append(
+                (sender, event_data)
+            )
+    if not requests_by_transaction:
+        return
+
+    transaction_hashes = list(requests_by_transaction)
+    batches = [
+        transaction_hashes[i : i + MECH_FEES_RPC_BATCH_SIZE]
+        for i in range(0, len(transaction_hashes), MECH_FEES_RPC_BATCH_SIZE)
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=MECH_FEES_RPC_MAX_WORKERS) as executor:
+            for transactions in tqdm(
+                executor.map(partial(_get_transactions, rpc), batches),
+                total=len(batches),
+                miniters=1,
+                desc="    Fetching fees",
+            ):
+                for transaction_hash, transaction in transactions.items():
+                    value = (
+                        _get_transaction_value(transaction)
+                        if transaction is not None
+                        else None
+                    )
+                    if value is None:
+                        fee_source = "unknown"
+                    else:
+                        fee_source = "transaction" if value else "prepaid"
+                    mech_requests = requests_by_transaction[transaction_hash]
+                    for sender, event_data in mech_requests:
+                        store.upsert_event(
+                            sender,
+                            MechRequest.event_name,
+                            {
+                                **event_data,
+                                "fee": (
+                                    value // len(mech_requests)
+                                    if value
+                                    else event_data["fee"]
+                                ),
+                                "fee_resolved": True,
+                                "fee_source": fee_source,
+                            },
+                        )
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(
+            f"WARNING: Could not fetch the fees of the Mech requests: {e}. "
+            "The default fee is used for the remaining requests."
+        )
+    store.flush()
 
 
 def get_mech_requests(
     sender: str,
     from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
     to_timestamp: float = DEFAULT_TO_TIMESTAMP,
+    ipfs_max_workers: int = IPFS_FETCH_MAX_WORKERS,
+    backend: Optional[str] = None,
+    full_resync: bool = False,
+    compact: bool = False,
+    rpc: Optional[str] = None,
+    sync: bool = True,
+    windowed: bool = False,
 ) -> Dict[str, Any]:
-    """Returns the Mech requests."""
+    """Returns the Mech requests.
+
+    If an `rpc` is given, the default fee of the requests is replaced by the
+    fee paid on-chain. If `sync` is not set, the requests are read from the
+    local database as it is, e.g., when it is kept up to date by
+    `run_mech_sync`. If `windowed` is set, only the requests within the
+    timestamp range are queried from the subgraph.
+    """
+
+    with open_mech_events_store(backend, read_only=not sync) as store:
+        if sync:
+            window = (
+                (from_timestamp, to_timestamp)
+                if windowed
+                else (DEFAULT_FROM_TIMESTAMP, DEFAULT_TO_TIMESTAMP)
+            )
+            _update_mech_events_db(
+                [sender],
+                MechRequest,
+                store,
+                ipfs_max_workers,
+                full_resync,
+                compact,
+                from_timestamp=window[0],
+                to_timestamp=window[1],
+            )
+            if rpc:
+                _update_mech_fees([sender], store, rpc)
+        return store.get_events_in_range(
+            sender, MechRequest.event_name, from_timestamp, to_timestamp
+        )
+
+
+def sync_mech_requests(
+    senders: List[str],
+    ipfs_max_workers: int = IPFS_FETCH_MAX_WORKERS,
+    backend: Optional[str] = None,
+    full_resync: bool = False,
+    compact: bool = False,
+    rpc: Optional[str] = None,
+    interactive: bool = True,
+) -> None:
+    """Updates the Mech requests of several senders, querying the subgraph once for all."""
+
+    with open_mech_events_store(backend) as store:
+        _update_mech_events_db(
+            senders,
+            MechRequest,
+            store,
+            ipfs_max_workers,
+            full_resync,
+            compact,
+            interactive,
+        )
+        if rpc:
+            _update_mech_fees(senders, store, rpc)
+
+
+def run_mech_sync(
+    senders: List[str],
+    interval: float = MECH_SYNC_INTERVAL,
+    once: bool = False,
+    ipfs_max_workers: int = IPFS_FETCH_MAX_WORKERS,
+    backend: Optional[str] = None,
+    full_resync: bool = False,
+    compact: bool = False,
+    rpc: Optional[str] = None,
+    metrics_json: bool = False,
+    metrics_path: Optional[Path] = None,
+) -> None:
+    """Keep the Mech requests of the senders up to date until interrupted.
 
-    all_mech_events = _get_mech_events(sender, MechRequest)
-    filtered_mech_events = {}
-    for event_id, event_data in all_mech_events.items():
-        block_timestamp = int(event_data["block_timestamp"])
-        if from_timestamp <= block_timestamp <= to_timestamp:
-            filtered_mech_events[event_id] = event_data
+    The local database is updated every `interval` seconds, so that the
+    `trades` and `report` commands can read it with `--no-mech-sync`. A
+    `full_resync` only applies to the first update. After each update, the
+    sync metrics are printed as JSON and/or written as a Prometheus text
+    file, if requested.
+    """
 
-    return filtered_mech_events
+    try:
+        while True:
+            sync_mech_requests(
+                senders,
+                ipfs_max_workers,
+                backend,
+                full_resync,
+                compact,
+                rpc,
+                interactive=False,
+            )
+            metrics.sync_metrics.emit(metrics_json, metrics_path)
+            if once:
+                return
+            full_resync = False
+            print(f"Next update in {interval:g} seconds.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Mech events sync stopped.")
+
+
+def _parse_args() -> Any:
+    """Parse the script arguments."""
+    parser = ArgumentParser(
+        description="Keep the local Mech events database of Safe addresses up to date."
+    )
+    parser.add_argument(
+        "--sender",
+        action="append",
+        required=True,
+        help="Ethereum address of a service Safe; may be repeated",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=MECH_SYNC_INTERVAL,
+        help="Seconds between two updates of the database",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Update the database once and exit",
+    )
+    parser.add_argument(
+        "--rpc",
+        help="Gnosis RPC used to read the fee paid by each Mech request",
+    )
+    add_mech_db_arguments(parser, mech_sync=False)
+    args = parser.parse_args()
+
+    for sender in args.sender:
+        if not re.match(r"^0x[a-fA-F0-9]{40}$", sender):
+            parser.error(f"Invalid Ethereum address: {sender}")
+
+    return args
+
+
+if __name__ == "__main__":
+    user_args = _parse_args()
+    run_mech_sync(
+        user_args.sender,
+        user_args.interval,
+        user_args.once,
+        backend=user_args.mech_db_backend,
+        full_resync=user_args.full_resync,
+        compact=user_args.compact_mech_db,
+        rpc=user_args.rpc,
+        metrics_json=user_args.sync_metrics,
+        metrics_path=user_args.sync_metrics_file,
+    )
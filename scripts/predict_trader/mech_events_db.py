@@ -0,0 +1,879 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+#
+#   Copyright 2026 Valory AG
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+# ------------------------------------------------------------------------------
+
+"""Storage backends for the local Mech events database."""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+from scripts.predict_trader import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows: the database is not protected against concurrent processes.
+    fcntl = None  # type: ignore
+
+SCRIPT_PATH = Path(__file__).resolve().parent
+MECH_EVENTS_JSON_PATH = Path(SCRIPT_PATH.parents[1], "data", "mech_events.json")
+MECH_EVENTS_SQLITE_PATH = Path(SCRIPT_PATH.parents[1], "data", "mech_events.sqlite")
+MECH_EVENTS_DB_VERSION = 4
+MECH_EVENTS_DB_BACKEND = "json"
+# The JSON backend appends every change to a journal and folds the journal
+# back into the JSON file, in the background, once it grows beyond this size.
+MECH_EVENTS_JOURNAL_COMPACTION_BYTES = 16 * 1024 * 1024
+IRRELEVANT_TOOLS = frozenset(
+    {
+        "openai-text-davinci-002",
+        "openai-text-davinci-003",
+        "openai-gpt-3.5-turbo",
+        "openai-gpt-4",
+        "stabilityai-stable-diffusion-v1-5",
+        "stabilityai-stable-diffusion-xl-beta-v2-2-2",
+        "stabilityai-stable-diffusion-512-v2-1",
+        "stabilityai-stable-diffusion-768-v2-1",
+        "deepmind-optimization-strong",
+        "deepmind-optimization",
+    }
+)
+_WHITESPACE_RE = re.compile(r"\s+")
+_QUOTED_QUESTION_RE = re.compile(r"\"(.*)\"")
+
+
+def normalize_mech_question(prompt: str) -> str:
+    """Extract the question of a Mech request prompt."""
+    prompt = _WHITESPACE_RE.sub(" ", prompt).strip()
+    prompt_match = _QUOTED_QUESTION_RE.search(prompt)
+    if prompt_match:
+        return prompt_match.group(1)
+    return prompt
+
+
+def add_mech_request_keys(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the record of a resolved event with its statistics keys.
+
+    The tool, the normalized question and whether the request is relevant
+    to the statistics are computed once, when the IPFS contents of the event
+    are resolved, instead of on every report. Unresolved records are
+    returned as they are.
+    """
+    ipfs_contents = event_data.get("ipfs_contents")
+    if ipfs_contents:
+        contents = ipfs_contents if isinstance(ipfs_contents, dict) else {}
+        prompt = contents.get("prompt")
+        tool = contents.get("tool")
+        question = normalize_mech_question(prompt) if isinstance(prompt, str) else None
+    elif "question" in event_data:
+        tool = event_data["tool"]
+        question = event_data["question"]
+    else:
+        return event_data
+
+    return {
+        **event_data,
+        "tool": tool,
+        "question": question,
+        "relevant": (
+            tool is not None and question is not None and tool not in IRRELEVANT_TOOLS
+        ),
+    }
+
+
+def is_resolved_event(event_data: Dict[str, Any]) -> bool:
+    """Tell whether the IPFS contents of a stored event have been resolved."""
+    return bool(event_data.get("ipfs_contents")) or "question" in event_data
+
+
+# Migrations of an event record from a DB version to the next one. Databases
+# of a version from which there is no chain of migrations up to
+# `MECH_EVENTS_DB_VERSION` are archived and synced again from scratch.
+MECH_EVENTS_DB_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    3: add_mech_request_keys,
+}
+
+
+def _can_migrate(db_version: int) -> bool:
+    return all(
+        version in MECH_EVENTS_DB_MIGRATIONS
+        for version in range(db_version, MECH_EVENTS_DB_VERSION)
+    )
+
+
+def _migrate_event_data(event_data: Dict[str, Any], db_version: int) -> Dict[str, Any]:
+    """Upgrade an event record from the given DB version to the current one."""
+    for version in range(db_version, MECH_EVENTS_DB_VERSION):
+        event_data = MECH_EVENTS_DB_MIGRATIONS[version](event_data)
+    return event_data
+
+
+def _migrate_mech_events_data(mech_events_data: Dict[str, Any]) -> None:
+    """Upgrade all the event records of a JSON database in place."""
+    db_version = mech_events_data.get("db_version", 0)
+    print(
+        f"Upgrading the local Mech events database from version {db_version} "
+        f"to version {MECH_EVENTS_DB_VERSION}."
+    )
+    for sender, sender_data in mech_events_data.items():
+        if sender in ("db_version", "cursors"):
+            continue
+        for events in sender_data.values():
+            for event_id, event_data in events.items():
+                events[event_id] = _migrate_event_data(event_data, db_version)
+    mech_events_data["db_version"] = MECH_EVENTS_DB_VERSION
+
+
+def _journal_path(generation: int) -> Path:
+    return MECH_EVENTS_JSON_PATH.with_name(
+        f"{MECH_EVENTS_JSON_PATH.stem}.journal.{generation}.jsonl"
+    )
+
+
+def _journal_paths() -> List[Tuple[int, Path]]:
+    """Return the existing journals, sorted by generation."""
+    journal_paths = []
+    for path in MECH_EVENTS_JSON_PATH.parent.glob(
+        f"{MECH_EVENTS_JSON_PATH.stem}.journal.*.jsonl"
+    ):
+        generation = path.name.split(".")[-2]
+        if generation.isdigit():
+            journal_paths.append((int(generation), path))
+    return sorted(journal_paths)
+
+
+def _apply_journal_record(
+    mech_events_data: Dict[str, Any], record: Dict[str, Any]
+) -> None:
+    if "cursor" in record:
+        mech_events_data.setdefault("cursors", {}).setdefault(record["sender"], {})[
+            record["event_name"]
+        ] = record["cursor"]
+        return
+
+    event_data = record["event"]
+    mech_events_data.setdefault(record["sender"], {}).setdefault(
+        record["event_name"], {}
+    )[event_data["event_id"]] = event_data
+
+
+def _replay_journal(mech_events_data: Dict[str, Any], path: Path) -> None:
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn write of a process killed while appending.
+                continue
+            _apply_journal_record(mech_events_data, record)
+
+
+def _lock_path(name: str) -> Path:
+    return MECH_EVENTS_JSON_PATH.with_name(f"{MECH_EVENTS_JSON_PATH.stem}.{name}.lock")
+
+
+@contextmanager
+def _mech_events_lock(name: str, shared: bool = False) -> Iterator[None]:
+    """Hold a lock shared between the processes using the database.
+
+    The `files` lock is held shared while the JSON files are read, and
+    exclusively while they are replaced or removed. The `writer` lock is held
+    by the only store allowed to change the database.
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+
+    MECH_EVENTS_JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(_lock_path(name), "a", encoding="utf-8") as lock_file:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if name == "writer":
+                print(
+                    "Waiting for another process to finish updating the local "
+                    "Mech events database..."
+                )
+            fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_mech_events_data() -> Dict[str, Any]:
+    """Read Mech events data from the JSON file and replay its journals."""
+    try:
+        with open(MECH_EVENTS_JSON_PATH, "r", encoding="utf-8") as file:
+            mech_events_data = json.load(file)
+    except FileNotFoundError:
+        mech_events_data = {}
+        mech_events_data["db_version"] = MECH_EVENTS_DB_VERSION
+    except json.decoder.JSONDecodeError:
+        print(
+            f'\nERROR: The local Mech events database "{MECH_EVENTS_JSON_PATH.resolve()}" is corrupted. Please try delete or rename the file, and run the script again.'
+        )
+        sys.exit(1)
+
+    for _, path in _journal_paths():
+        _replay_journal(mech_events_data, path)
+
+    return mech_events_data
+
+
+def _upgrade_mech_events_data() -> Dict[str, Any]:
+    """Upgrade a JSON database of an old version, holding the files lock.
+
+    Databases are upgraded in place if possible: their journals are replayed,
+    their records migrated, and the result written back as a new base file.
+    Otherwise, they are archived.
+    """
+    # Another process may have upgraded the database in the meantime.
+    mech_events_data = _load_mech_events_data()
+    db_version = mech_events_data.get("db_version", 0)
+    if db_version >= MECH_EVENTS_DB_VERSION:
+        return mech_events_data
+
+    if _can_migrate(db_version):
+        _migrate_mech_events_data(mech_events_data)
+        _write_mech_events_data_to_file(mech_events_data)
+        _remove_journals(sys.maxsize)
+        return mech_events_data
+
+    current_time = time.strftime("%Y-%m-%d_%H-%M-%S")
+    old_db_filename = f"mech_events.{current_time}.old.json"
+    os.rename(MECH_EVENTS_JSON_PATH, MECH_EVENTS_JSON_PATH.parent / old_db_filename)
+    for generation, path in _journal_paths():
+        os.rename(
+            path,
+            path.with_name(
+                f"mech_events.{current_time}.old.journal.{generation}.jsonl"
+            ),
+        )
+    mech_events_data = {}
+    mech_events_data["db_version"] = MECH_EVENTS_DB_VERSION
+    return mech_events_data
+
+
+def _read_mech_events_data_from_file() -> Dict[str, Any]:
+    """Read Mech events data from the JSON file and replay its journals.
+
+    Files are read under the shared `files` lock, so that they are never
+    compacted midway. Databases of an old version are upgraded under the
+    exclusive lock.
+    """
+    with _mech_events_lock("files", shared=True):
+        mech_events_data = _load_mech_events_data()
+
+    if mech_events_data.get("db_version", 0) < MECH_EVENTS_DB_VERSION:
+        with _mech_events_lock("files"):
+            mech_events_data = _upgrade_mech_events_data()
+
+    return mech_events_data
+
+
+def _write_mech_events_data_to_file(mech_events_data: Dict[str, Any]) -> None:
+    """Atomically replace the JSON file with the given data."""
+    start = time.monotonic()
+    MECH_EVENTS_JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MECH_EVENTS_JSON_PATH.with_name(
+        f"{MECH_EVENTS_JSON_PATH.name}.{os.getpid()}.tmp"
+    )
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(mech_events_data, file)
+        file.flush()
+        os.fsync(file.fileno())
+        num_bytes = file.tell()
+    os.replace(tmp_path, MECH_EVENTS_JSON_PATH)
+    metrics.sync_metrics.record_db_write(num_bytes, time.monotonic() - start)
+
+
+def _remove_journals(last_generation: int) -> None:
+    """Remove the journals up to the given generation."""
+    for generation, path in _journal_paths():
+        if generation <= last_generation:
+            path.unlink(missing_ok=True)
+
+
+def _compact_mech_events_data(
+    mech_events_data: Dict[str, Any], last_generation: int
+) -> None:
+    """Write a snapshot of the database and drop the journals it includes."""
+    with _mech_events_lock("files"):
+        _write_mech_events_data_to_file(mech_events_data)
+        _remove_journals(last_generation)
+
+
+def _snapshot_mech_events_data(mech_events_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy the nested dictionaries of the database, sharing the event records.
+
+    Event records are replaced rather than mutated on upsert, so the copy can
+    be serialized from another thread while the database keeps changing.
+    """
+    return {
+        key: (
+            {name: dict(events) for name, events in value.items()}
+            if isinstance(value, dict)
+            else value
+        )
+        for key, value in mech_events_data.items()
+    }
+
+
+def _iter_mech_events_data(
+    mech_events_data: Dict[str, Any],
+) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """Iterate over the (sender, event name, event data) of a JSON database."""
+    for sender, sender_data in mech_events_data.items():
+        if sender in ("db_version", "cursors"):
+            continue
+        for event_name, events in sender_data.items():
+            for event_data in events.values():
+                yield sender, event_name, event_data
+
+
+def _to_sqlite_row(
+    sender: str, event_name: str, event_data: Dict[str, Any]
+) -> Tuple[str, str, str, int, str]:
+    return (
+        sender,
+        event_name,
+        event_data["event_id"],
+        int(event_data["block_timestamp"]),
+        json.dumps(event_data),
+    )
+
+
+class MechEventsStore(ABC):
+    """Interface of a Mech events database backend.
+
+    Any number of processes may read the database at the same time, but
+    only one store at a time may change it: unless it is `read_only`, a
+    store holds the `writer` lock until it is closed.
+    """
+
+    def __init__(self, read_only: bool = False) -> None:
+        """Take the writer lock, unless the store is read-only."""
+        self.read_only = read_only
+        self._locks = ExitStack()
+        if not read_only:
+            self._locks.enter_context(_mech_events_lock("writer"))
+
+    @abstractmethod
+    def get_events(self, sender: str, event_name: str) -> Dict[str, Any]:
+        """Return all the stored events of a sender, keyed by event ID."""
+
+    @abstractmethod
+    def get_events_in_range(
+        self,
+        sender: str,
+        event_name: str,
+        from_timestamp: float,
+        to_timestamp: float,
+    ) -> Dict[str, Any]:
+        """Return the events of a sender within the (inclusive) timestamp range."""
+
+    @abstractmethod
+    def get_resolved_ids(
+        self, sender: str, event_name: str, event_ids: Iterable[str]
+    ) -> Set[str]:
+        """Return which of the given events of a sender are stored and resolved."""
+
+    @abstractmethod
+    def get_unresolved_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose IPFS contents are not resolved."""
+
+    @abstractmethod
+    def get_unresolved_fee_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose fee is not resolved."""
+
+    @abstractmethod
+    def upsert_event(
+        self, sender: str, event_name: str, event_data: Dict[str, Any]
+    ) -> None:
+        """Insert or replace an event."""
+
+    @abstractmethod
+    def get_cursor(self, sender: str, event_name: str) -> Optional[int]:
+        """Return the block number up to which the events of a sender are synced."""
+
+    @abstractmethod
+    def set_cursor(self, sender: str, event_name: str, cursor: int) -> None:
+        """Record the block number up to which the events of a sender are synced."""
+
+    def flush(self) -> None:
+        """Persist any pending change."""
+
+    def close(self) -> None:
+        """Persist any pending change and release the backend resources."""
+        self.flush()
+        self._locks.close()
+
+    def __enter__(self) -> "MechEventsStore":
+        """Enter the store context."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Close the store."""
+        self.close()
+
+
+class JsonMechEventsStore(MechEventsStore):
+    """Mech events database kept in memory and persisted as a JSON document.
+
+    Changes are appended to a JSONL journal, so that persisting an event costs
+    O(event) and nothing is lost if the process is killed. Once the journals
+    grow beyond `MECH_EVENTS_JOURNAL_COMPACTION_BYTES` they are compacted into
+    the JSON document by a background thread. Journals are numbered by
+    generation: a compaction only removes the generations it has written.
+
+    Timestamp range queries scan the events of the sender, which are all in
+    memory anyway; only the SQLite backend answers them from an index.
+    """
+
+    def __init__(self, read_only: bool = False) -> None:
+        """Load the JSON database."""
+        super().__init__(read_only)
+        self._data = _read_mech_events_data_from_file()
+        journal_paths = _journal_paths()
+        self._generation = journal_paths[-1][0] + 1 if journal_paths else 0
+        self._journal_bytes = sum(path.stat().st_size for _, path in journal_paths)
+        self._journal: Optional[TextIO] = None
+        self._compaction: Optional[threading.Thread] = None
+
+        if (
+            not read_only
+            and self._journal_bytes >= MECH_EVENTS_JOURNAL_COMPACTION_BYTES
+        ):
+            self._start_compaction()
+
+    def get_events(self, sender: str, event_name: str) -> Dict[str, Any]:
+        """Return all the stored events of a sender, keyed by event ID."""
+        return self._data.get(sender, {}).get(event_name, {})
+
+    def get_events_in_range(
+        self,
+        sender: str,
+        event_name: str,
+        from_timestamp: float,
+        to_timestamp: float,
+    ) -> Dict[str, Any]:
+        """Return the events of a sender within the (inclusive) timestamp range."""
+        return {
+            event_id: event_data
+            for event_id, event_data in self.get_events(sender, event_name).items()
+            if from_timestamp <= int(event_data["block_timestamp"]) <= to_timestamp
+        }
+
+    def get_resolved_ids(
+        self, sender: str, event_name: str, event_ids: Iterable[str]
+    ) -> Set[str]:
+        """Return which of the given events of a sender are stored and resolved."""
+        events = self.get_events(sender, event_name)
+        return {
+            event_id
+            for event_id in event_ids
+            if event_id in events and is_resolved_event(events[event_id])
+        }
+
+    def get_unresolved_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose IPFS contents are not resolved."""
+        return [
+            event_data
+            for event_data in self.get_events(sender, event_name).values()
+            if not is_resolved_event(event_data)
+        ]
+
+    def get_unresolved_fee_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose fee is not resolved."""
+        return [
+            event_data
+            for event_data in self.get_events(sender, event_name).values()
+            if not event_data.get("fee_resolved")
+        ]
+
+    def upsert_event(
+        self, sender: str, event_name: str, event_data: Dict[str, Any]
+    ) -> None:
+        """Insert or replace an event, and append it to the journal."""
+        record = {"sender": sender, "event_name": event_name, "event": event_data}
+        _apply_journal_record(self._data, record)
+        self._append_to_journal(record)
+
+    def get_cursor(self, sender: str, event_name: str) -> Optional[int]:
+        """Return the block number up to which the events of a sender are synced."""
+        return self._data.get("cursors", {}).get(sender, {}).get(event_name)
+
+    def set_cursor(self, sender: str, event_name: str, cursor: int) -> None:
+        """Record the block number up to which the events of a sender are synced."""
+        record = {"sender": sender, "event_name": event_name, "cursor": cursor}
+        _apply_journal_record(self._data, record)
+        self._append_to_journal(record)
+
+    def _append_to_journal(self, record: Dict[str, Any]) -> None:
+        if self.read_only:
+            raise PermissionError("The Mech events database was opened read-only.")
+        if self._journal is None:
+            MECH_EVENTS_JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = open(  # pylint: disable=consider-using-with
+                _journal_path(self._generation), "a", encoding="utf-8"
+            )
+
+        start = time.monotonic()
+        line = json.dumps(record) + "\n"
+        self._journal.write(line)
+        self._journal.flush()
+        self._journal_bytes += len(line)
+        metrics.sync_metrics.record_db_write(len(line), time.monotonic() - start)
+
+        if self._journal_bytes >= MECH_EVENTS_JOURNAL_COMPACTION_BYTES:
+            self._start_compaction()
+
+    def _start_compaction(self) -> None:
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+
+        # Later changes go to a new journal generation, which the compaction
+        # leaves in place.
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        last_generation = self._generation
+        self._generation += 1
+        self._journal_bytes = 0
+
+        self._compaction = threading.Thread(
+            target=_compact_mech_events_data,
+            args=(_snapshot_mech_events_data(self._data), last_generation),
+            name="mech-events-compaction",
+        )
+        self._compaction.start()
+
+    def flush(self) -> None:
+        """Make sure the journal has reached the disk."""
+        if self._journal is not None:
+            start = time.monotonic()
+            os.fsync(self._journal.fileno())
+            metrics.sync_metrics.record_db_write(0, time.monotonic() - start)
+
+    def close(self) -> None:
+        """Wait for any ongoing compaction, close the journal and release the lock."""
+        self.flush()
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._locks.close()
+
+
+# The events whose IPFS contents are not resolved (see `is_resolved_event`).
+_SQLITE_UNRESOLVED = (
+    "json_type(data, '$.question') IS NULL "
+    "AND coalesce(json_extract(data, '$.ipfs_contents'), '{}') = '{}'"
+)
+# The events whose fee is not resolved (see `mech_events._update_mech_fees`).
+_SQLITE_FEE_UNRESOLVED = "coalesce(json_extract(data, '$.fee_resolved'), 0) = 0"
+_SQLITE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS mech_events (
+        sender TEXT NOT NULL,
+        event_name TEXT NOT NULL,
+        event_id TEXT NOT NULL,
+        block_timestamp INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (sender, event_name, event_id)
+    );
+    CREATE INDEX IF NOT EXISTS mech_events_by_timestamp
+        ON mech_events (sender, event_name, block_timestamp);
+    CREATE INDEX IF NOT EXISTS mech_events_unresolved
+        ON mech_events (sender, event_name) WHERE {_SQLITE_UNRESOLVED};
+    CREATE INDEX IF NOT EXISTS mech_events_fee_unresolved
+        ON mech_events (sender, event_name) WHERE {_SQLITE_FEE_UNRESOLVED};
+    CREATE TABLE IF NOT EXISTS mech_events_cursors (
+        sender TEXT NOT NULL,
+        event_name TEXT NOT NULL,
+        cursor INTEGER NOT NULL,
+        PRIMARY KEY (sender, event_name)
+    );
+"""
+
+
+class SqliteMechEventsStore(MechEventsStore):
+    """Mech events database stored in SQLite.
+
+    Events are indexed on `(sender, event_name, block_timestamp)`, so upserts
+    and timestamp range queries do not depend on the size of the database.
+    A new database is seeded once from the JSON database, if there is one.
+    """
+
+    def __init__(self, path: Optional[Path] = None, read_only: bool = False) -> None:
+        """Open (and create, if needed) the SQLite database."""
+        super().__init__(read_only)
+        path = path or MECH_EVENTS_SQLITE_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SQLITE_SCHEMA)
+
+        (user_version,) = self._connection.execute("PRAGMA user_version").fetchone()
+        if user_version == 0:
+            self.import_json()
+        elif user_version < MECH_EVENTS_DB_VERSION:
+            self.migrate(user_version)
+
+        if read_only:
+            self._connection.execute("PRAGMA query_only=ON")
+
+    def migrate(self, db_version: int) -> None:
+        """Upgrade the events of an old version of the database.
+
+        Databases that cannot be migrated are emptied and seeded again from
+        the JSON database.
+        """
+        if not _can_migrate(db_version):
+            with self._connection:
+                self._connection.execute("DELETE FROM mech_events")
+                self._connection.execute("DELETE FROM mech_events_cursors")
+            self.import_json()
+            return
+
+        rows = self._connection.execute(
+            "SELECT sender, event_name, data FROM mech_events"
+        ).fetchall()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO mech_events VALUES (?, ?, ?, ?, ?)",
+                (
+                    _to_sqlite_row(
+                        sender,
+                        event_name,
+                        _migrate_event_data(json.loads(data), db_version),
+                    )
+                    for sender, event_name, data in rows
+                ),
+            )
+            self._connection.execute(f"PRAGMA user_version={MECH_EVENTS_DB_VERSION}")
+
+    def import_json(self) -> None:
+        """Import the events of the JSON database."""
+        mech_events_data = _read_mech_events_data_from_file()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO mech_events VALUES (?, ?, ?, ?, ?)",
+                (
+                    _to_sqlite_row(sender, event_name, event_data)
+                    for sender, event_name, event_data in _iter_mech_events_data(
+                        mech_events_data
+                    )
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO mech_events_cursors VALUES (?, ?, ?)",
+                (
+                    (sender, event_name, cursor)
+                    for sender, cursors in mech_events_data.get("cursors", {}).items()
+                    for event_name, cursor in cursors.items()
+                ),
+            )
+            self._connection.execute(f"PRAGMA user_version={MECH_EVENTS_DB_VERSION}")
+
+    def get_events(self, sender: str, event_name: str) -> Dict[str, Any]:
+        """Return all the stored events of a sender, keyed by event ID."""
+        rows = self._connection.execute(
+            "SELECT event_id, data FROM mech_events WHERE sender = ? AND event_name = ?",
+            (sender, event_name),
+        )
+        return {event_id: json.loads(data) for event_id, data in rows}
+
+    def get_events_in_range(
+        self,
+        sender: str,
+        event_name: str,
+        from_timestamp: float,
+        to_timestamp: float,
+    ) -> Dict[str, Any]:
+        """Return the events of a sender within the (inclusive) timestamp range."""
+        rows = self._connection.execute(
+            "SELECT event_id, data FROM mech_events "
+            "WHERE sender = ? AND event_name = ? AND block_timestamp BETWEEN ? AND ? "
+            "ORDER BY block_timestamp",
+            (sender, event_name, from_timestamp, to_timestamp),
+        )
+        return {event_id: json.loads(data) for event_id, data in rows}
+
+    def get_resolved_ids(
+        self, sender: str, event_name: str, event_ids: Iterable[str]
+    ) -> Set[str]:
+        """Return which of the given events of a sender are stored and resolved."""
+        rows = self._connection.execute(
+            "SELECT event_id FROM mech_events "
+            "WHERE sender = ? AND event_name = ? "
+            "AND event_id IN (SELECT value FROM json_each(?)) "
+            f"AND NOT ({_SQLITE_UNRESOLVED})",
+            (sender, event_name, json.dumps(list(event_ids))),
+        )
+        return {event_id for (event_id,) in rows}
+
+    def get_unresolved_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose IPFS contents are not resolved."""
+        rows = self._connection.execute(
+            "SELECT data FROM mech_events "
+            f"WHERE sender = ? AND event_name = ? AND {_SQLITE_UNRESOLVED}",
+            (sender, event_name),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_unresolved_fee_events(
+        self, sender: str, event_name: str
+    ) -> List[Dict[str, Any]]:
+        """Return the stored events of a sender whose fee is not resolved."""
+        rows = self._connection.execute(
+            "SELECT data FROM mech_events "
+            f"WHERE sender = ? AND event_name = ? AND {_SQLITE_FEE_UNRESOLVED}",
+            (sender, event_name),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def upsert_event(
+        self, sender: str, event_name: str, event_data: Dict[str, Any]
+    ) -> None:
+        """Insert or replace an event."""
+        start = time.monotonic()
+        row = _to_sqlite_row(sender, event_name, event_data)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO mech_events VALUES (?, ?, ?, ?, ?)", row
+            )
+        metrics.sync_metrics.record_db_write(len(row[-1]), time.monotonic() - start)
+
+    def get_cursor(self, sender: str, event_name: str) -> Optional[int]:
+        """Return the block number up to which the events of a sender are synced."""
+        row = self._connection.execute(
+            "SELECT cursor FROM mech_events_cursors WHERE sender = ? AND event_name = ?",
+            (sender, event_name),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, sender: str, event_name: str, cursor: int) -> None:
+        """Record the block number up to which the events of a sender are synced."""
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO mech_events_cursors VALUES (?, ?, ?)",
+                (sender, event_name, cursor),
+            )
+
+    def close(self) -> None:
+        """Close the database connection and release the lock."""
+        self._connection.close()
+        super().close()
+
+
+MECH_EVENTS_DB_BACKENDS: Dict[str, type[MechEventsStore]] = {
+    "json": JsonMechEventsStore,
+    "sqlite": SqliteMechEventsStore,
+}
+
+
+def add_mech_db_arguments(parser: ArgumentParser, mech_sync: bool = True) -> None:
+    """Add the arguments of the local Mech events database to a script parser.
+
+    Unless `mech_sync` is unset, the parser also gets `--no-mech-sync`, to
+    read the database without updating it.
+    """
+    parser.add_argument(
+        "--mech-db-backend",
+        choices=list(MECH_EVENTS_DB_BACKENDS),
+        default=MECH_EVENTS_DB_BACKEND,
+        help="Storage backend of the local Mech events database",
+    )
+    parser.add_argument(
+        "--full-resync",
+        action="store_true",
+        help="Query the whole Mech events history instead of only the new events",
+    )
+    parser.add_argument(
+        "--compact-mech-db",
+        action="store_true",
+        help="Store only the tool and question of new Mech requests, leaving their IPFS contents in the IPFS cache",
+    )
+    if mech_sync:
+        parser.add_argument(
+            "--no-mech-sync",
+            action="store_true",
+            help="Read the local Mech events database without updating it, e.g., when it is kept up to date by the mech_events sync",
+        )
+    parser.add_argument(
+        "--sync-metrics",
+        action="store_true",
+        help="Print the metrics of the Mech events sync as JSON",
+    )
+    parser.add_argument(
+        "--sync-metrics-file",
+        type=Path,
+        help="Write the metrics of the Mech events sync to this Prometheus text file",
+    )
+
+
+def open_mech_events_store(
+    backend: Optional[str] = None, read_only: bool = False
+) -> MechEventsStore:
+    """Open the Mech events database with the given backend."""
+    backend = backend or MECH_EVENTS_DB_BACKEND
+    if backend not in MECH_EVENTS_DB_BACKENDS:
+        raise ValueError(
+            f"Unknown Mech events database backend {backend!r}. "
+            f"Available backends: {', '.join(MECH_EVENTS_DB_BACKENDS)}."
+        )
+    return MECH_EVENTS_DB_BACKENDS[backend](read_only=read_only)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+#
+#   Copyright 2026 Valory AG
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+# ------------------------------------------------------------------------------
+
+"""Metrics of the Mech events sync, as a JSON summary or a Prometheus text file."""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Upper bounds, in seconds, of the buckets of the IPFS latency histograms.
+IPFS_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_COUNTERS = (
+    ("subgraph_pages", "Pages queried from the subgraph."),
+    ("subgraph_rows", "Events received from the subgraph."),
+    ("subgraph_seconds", "Time spent querying the subgraph."),
+    ("ipfs_cache_hits", "Events whose IPFS contents were served from the cache."),
+    ("ipfs_cache_misses", "Events whose IPFS contents were fetched from a gateway."),
+    ("db_writes", "Writes to the local Mech events database."),
+    ("db_write_bytes", "Bytes written to the local Mech events database."),
+    ("db_write_seconds", "Time spent writing to the local Mech events database."),
+)
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+class _LatencyHistogram:
+    """Cumulative histogram of request latencies."""
+
+    def __init__(self) -> None:
+        """Initialize the histogram."""
+        self.buckets = [0] * len(IPFS_LATENCY_BUCKETS)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        """Record a request."""
+        for i, upper_bound in enumerate(IPFS_LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.errors += not ok
+        self.sum += seconds
+
+
+class SyncMetrics:  # pylint: disable=too-many-instance-attributes
+    """Counters of the subgraph queries, IPFS fetches and database writes of a sync.
+
+    Counters only grow, so that a long-running sync exposes them as
+    Prometheus counters; the JSON summary adds the derived rates.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+        self._lock = threading.Lock()
+        self.subgraph_pages = 0
+        self.subgraph_rows = 0
+        self.subgraph_seconds = 0.0
+        self.ipfs_cache_hits = 0
+        self.ipfs_cache_misses = 0
+        self.ipfs_latencies: Dict[str, _LatencyHistogram] = {}
+        self.db_writes = 0
+        self.db_write_bytes = 0
+        self.db_write_seconds = 0.0
+
+    def record_subgraph_page(self, rows: int, seconds: float) -> None:
+        """Record a page queried from the subgraph."""
+        with self._lock:
+            self.subgraph_pages += 1
+            self.subgraph_rows += rows
+            self.subgraph_seconds += seconds
+
+    def record_ipfs_request(self, gateway: str, seconds: float, ok: bool) -> None:
+        """Record a request to an IPFS gateway."""
+        with self._lock:
+            self.ipfs_latencies.setdefault(gateway, _LatencyHistogram()).observe(
+                seconds, ok
+            )
+
+    def record_ipfs_cache(self, hit: bool) -> None:
+        """Record whether the IPFS contents of an event were served from the cache."""
+        with self._lock:
+            if hit:
+                self.ipfs_cache_hits += 1
+            else:
+                self.ipfs_cache_misses += 1
+
+    def record_db_write(self, num_bytes: int, seconds: float) -> None:
+        """Record a write to the local Mech events database."""
+        with self._lock:
+            self.db_writes += 1
+            self.db_write_bytes += num_bytes
+            self.db_write_seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the metrics, with their derived rates."""
+        with self._lock:
+            return {
+                "subgraph": {
+                    "pages": self.subgraph_pages,
+                    "rows": self.subgraph_rows,
+                    "seconds": self.subgraph_seconds,
+                    "pages_per_second": _ratio(
+                        self.subgraph_pages, self.subgraph_seconds
+                    ),
+                    "rows_per_page": _ratio(self.subgraph_rows, self.subgraph_pages),
+                },
+                "ipfs": {
+                    "cache_hits": self.ipfs_cache_hits,
+                    "cache_misses": self.ipfs_cache_misses,
+                    "cache_hit_ratio": _ratio(
+                        self.ipfs_cache_hits,
+                        self.ipfs_cache_hits + self.ipfs_cache_misses,
+                    ),
+                    "gateways": {
+                        gateway: {
+                            "requests": histogram.count,
+                            "errors": histogram.errors,
+                            "latency_seconds_sum": histogram.sum,
+                            "latency_buckets": {
+                                str(upper_bound): count
+                                for upper_bound, count in zip(
+                                    IPFS_LATENCY_BUCKETS, histogram.buckets
+                                )
+                            },
+                        }
+                        for gateway, histogram in self.ipfs_latencies.items()
+                    },
+                },
+                "db": {
+                    "writes": self.db_writes,
+                    "bytes": self.db_write_bytes,
+                    "seconds": self.db_write_seconds,
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def _metric(name: str, kind: str, help_text: str, samples: List[str]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            for name, help_text in _COUNTERS:
+                _metric(
+                    f"mech_sync_{name}_total",
+                    "counter",
+                    help_text,
+                    [f"mech_sync_{name}_total {getattr(self, name)}"],
+                )
+
+            histograms = sorted(self.ipfs_latencies.items())
+            samples = []
+            errors = []
+            for gateway, histogram in histograms:
+                label = 'gateway="{}"'.format(
+                    gateway.replace("\\", "\\\\").replace('"', '\\"')
+                )
+                for upper_bound, count in zip(IPFS_LATENCY_BUCKETS, histogram.buckets):
+                    samples.append(
+                        f'mech_sync_ipfs_request_seconds_bucket{{{label},le="{upper_bound}"}} {count}'
+                    )
+                samples.append(
+                    f'mech_sync_ipfs_request_seconds_bucket{{{label},le="+Inf"}} {histogram.count}'
+                )
+                samples.append(
+                    f"mech_sync_ipfs_request_seconds_sum{{{label}}} {histogram.sum}"
+                )
+                samples.append(
+                    f"mech_sync_ipfs_request_seconds_count{{{label}}} {histogram.count}"
+                )
+                errors.append(
+                    f"mech_sync_ipfs_request_errors_total{{{label}}} {histogram.errors}"
+                )
+
+        _metric(
+            "mech_sync_ipfs_request_seconds",
+            "histogram",
+            "Latency of the requests to each IPFS gateway.",
+            samples,
+        )
+        _metric(
+            "mech_sync_ipfs_request_errors_total",
+            "counter",
+            "Failed requests to each IPFS gateway.",
+            errors,
+        )
+        return "\n".join(lines) + "\n"
+
+    def emit(
+        self, json_summary: bool = False, prometheus_path: Optional[Path] = None
+    ) -> None:
+        """Print the JSON summary and/or write the Prometheus text file.
+
+        The text file is replaced atomically, so that it can be read at any
+        time, e.g., by the textfile collector of the Prometheus node exporter.
+        """
+        if json_summary:
+            print(json.dumps(self.summary(), indent=4))
+        if prometheus_path is not None:
+            prometheus_path = Path(prometheus_path)
+            prometheus_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = prometheus_path.with_name(
+                f"{prometheus_path.name}.{os.getpid()}.tmp"
+            )
+            tmp_path.write_text(self.to_prometheus(), encoding="utf-8")
+            os.replace(tmp_path, prometheus_path)
+
+
+sync_metrics = SyncMetrics()
@@ -30,13 +30,15 @@ from operate.cli import OperateApp
 from operate.operate_types import Chain
 from operate.quickstart.run_service import load_local_config
 from scripts.predict_trader.trades import (
+    OMEN_SUBGRAPH_ID,
+    OMEN_SUBGRAPH_URL_ENV_VAR,
     MarketAttribute,
     MarketState,
+    _get_subgraph_url,
     _post_subgraph_query,
     parse_user,
     wei_to_xdai,
 )
-from scripts.utils import get_subgraph_api_key
 
 QUERY_BATCH_SIZE = 1000
 DUST_THRESHOLD = 10000000000000
@@ -173,8 +175,7 @@ def _query_omen_xdai_subgraph(
     fpmm_to_timestamp: float,
 ) -> dict[str, Any]:
     """Query the subgraph."""
-    subgraph_api_key = get_subgraph_api_key()
-    url = f"https://gateway-arbitrum.network.thegraph.com/api/{subgraph_api_key}/subgraphs/id/9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
+    url = _get_subgraph_url(OMEN_SUBGRAPH_URL_ENV_VAR, OMEN_SUBGRAPH_ID)
 
     grouped_results = defaultdict(list)
     batch_size = QUERY_BATCH_SIZE
@@ -49,6 +49,8 @@ from operate.quickstart.run_service import ask_password_if_needed, load_local_co
 from operate.quickstart.utils import print_title
 from operate.services.service import Service
 from psutil import pid_exists
+from scripts.predict_trader.mech_events_db import add_mech_db_arguments
+from scripts.predict_trader.metrics import sync_metrics
 from scripts.predict_trader.trades import (
     MarketAttribute,
     MarketState,
@@ -173,16 +175,6 @@ def _max_trades_per_market_since_message(filtered_trades: Counter[Any]) -> str:
     return f"{max_trades} trades per market"
 
 
-def _get_mech_requests_count(
-    mech_requests: dict[str, Any], timestamp: float = 0
-) -> int:
-    return sum(
-        1
-        for mech_request in mech_requests.values()
-        if mech_request.get("block_timestamp", 0) > timestamp
-    )
-
-
 def _print_section_header(header: str) -> None:
     print("\n\n" + header)
     print("=" * OUTPUT_WIDTH)
@@ -240,6 +232,7 @@ def _get_agent_status(service: Service) -> str:
 def _parse_args() -> Any:
     """Parse the script arguments."""
     parser = ArgumentParser(description="Get a report for a trader service.")
+    add_mech_db_arguments(parser)
     args = parser.parse_args()
     return args
 
@@ -274,9 +267,16 @@ if __name__ == "__main__":
     rpc = chain_config.ledger_config.rpc
 
     # Prediction market trading
-    mech_requests = trades.get_mech_requests(safe_address)
+    mech_requests = trades.get_mech_requests(
+        safe_address,
+        backend=user_args.mech_db_backend,
+        full_resync=user_args.full_resync,
+        compact=user_args.compact_mech_db,
+        rpc=rpc,
+        sync=not user_args.no_mech_sync,
+    )
     mech_statistics = trades.get_mech_statistics(mech_requests)
-    trades_json = trades._query_omen_xdai_subgraph(safe_address)
+    trades_json = trades.get_omen_trades(safe_address)
     _, statistics_table = trades.parse_user(
         rpc, safe_address, trades_json, mech_statistics
     )
@@ -581,3 +581,4 @@ if __name__ == "__main__":
         f"{wei_to_xdai(master_eoa_xdai)} {_warning_message(master_eoa_xdai, OPERATOR_XDAI_BALANCE_THRESHOLD)}",
     )
     print("")
+    sync_metrics.emit(user_args.sync_metrics, user_args.sync_metrics_file)
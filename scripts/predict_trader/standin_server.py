@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+#
+#   Copyright 2026 Valory AG
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+# ------------------------------------------------------------------------------
+
+"""Local stand-in for the subgraphs and the IPFS gateway, to benchmark the scripts offline.
+
+The server answers the GraphQL queries of the scripts from recorded or
+synthetic entities, applying The Graph filters (`where` with the `_gt`,
+`_gte`, `_lt`, `_lte`, `_in`, `_not`, `_not_in` suffixes and nested `_`
+filters), `orderBy`, `orderDirection`, `skip` and `first`. Subgraphs are
+served at `/subgraphs/<name>` and IPFS documents at `/ipfs/<path>`, with a
+configurable latency and rate of injected errors. The scripts are pointed
+at it with the environment variables returned by `env_overrides`.
+"""
+
+import json
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from graphql import FieldNode, GraphQLError, SelectionSetNode, Undefined, parse
+from graphql.utilities import value_from_ast_untyped
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_PAGE_SIZE = 100
+# Names of the subgraphs as served by the stand-in, by environment variable
+# overriding the URL of the real subgraph.
+SUBGRAPH_URL_OVERRIDES = {
+    "MECH_SUBGRAPH_URL": "mech",
+    "OMEN_SUBGRAPH_URL": "omen",
+    "CONDITIONAL_TOKENS_SUBGRAPH_URL": "conditional-tokens",
+}
+IPFS_GATEWAYS_OVERRIDE = "IPFS_GATEWAYS"
+_OPERATORS = {
+    "not_in": lambda value, expected: value not in expected,
+    "gte": lambda value, expected: value >= expected,
+    "lte": lambda value, expected: value <= expected,
+    "gt": lambda value, expected: value > expected,
+    "lt": lambda value, expected: value < expected,
+    "in": lambda value, expected: value in expected,
+    "not": lambda value, expected: value != expected,
+}
+
+
+def _sort_key(field: str, value: Any) -> Tuple[int, Any]:
+    """Return a key comparing BigInt strings as numbers, and anything else as strings."""
+    if isinstance(value, dict):
+        value = value.get("id")
+    if field != "id" and not isinstance(value, bool):
+        try:
+            return (0, int(value))
+        except (TypeError, ValueError):
+            pass
+    return (1, str(value).lower())
+
+
+def _matches(entity: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Tell whether an entity satisfies a `where` filter, ignoring unset values."""
+    for key, expected in where.items():
+        if expected is None or expected is Undefined:
+            continue
+        if key.endswith("_"):
+            nested = entity.get(key[:-1])
+            if not isinstance(nested, dict) or not _matches(nested, expected):
+                return False
+            continue
+
+        field, operator = key, None
+        for suffix in _OPERATORS:
+            if key.endswith(f"_{suffix}"):
+                field, operator = key[: -len(suffix) - 1], suffix
+                break
+
+        value = _sort_key(field, entity.get(field))
+        if operator in ("in", "not_in"):
+            matched = _OPERATORS[operator](
+                value, [_sort_key(field, item) for item in expected]
+            )
+        elif operator is not None:
+            matched = _OPERATORS[operator](value, _sort_key(field, expected))
+        else:
+            matched = value == _sort_key(field, expected)
+        if not matched:
+            return False
+    return True
+
+
+def _query_entities(
+    entities: List[Dict[str, Any]], arguments: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Filter, sort and paginate a collection of entities."""
+    where = arguments.get("where") or {}
+    order_by = arguments.get("orderBy") or "id"
+    results = sorted(
+        (entity for entity in entities if _matches(entity, where)),
+        key=lambda entity: _sort_key(order_by, entity.get(order_by)),
+        reverse=arguments.get("orderDirection") == "desc",
+    )
+    skip = int(arguments.get("skip") or 0)
+    first = int(arguments.get("first") or DEFAULT_PAGE_SIZE)
+    return results[skip : skip + first]
+
+
+def _select(
+    value: Any, selection_set: Optional[SelectionSetNode], variables: Dict[str, Any]
+) -> Any:
+    """Project an entity, or a list of entities, on the selected fields."""
+    if selection_set is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [_select(item, selection_set, variables) for item in value]
+
+    result = {}
+    for selection in selection_set.selections:
+        if not isinstance(selection, FieldNode) or selection.name.value.startswith(
+            "__"
+        ):
+            continue
+        result[(selection.alias or selection.name).value] = _resolve(
+            value.get(selection.name.value), selection, variables
+        )
+    return result
+
+
+def _resolve(value: Any, field: FieldNode, variables: Dict[str, Any]) -> Any:
+    """Resolve a field of an entity, querying it if it is a collection of entities."""
+    if isinstance(value, list) and field.selection_set is not None:
+        arguments = {
+            argument.name.value: value_from_ast_untyped(argument.value, variables)
+            for argument in field.arguments
+        }
+        value = _query_entities(value, arguments)
+    return _select(value, field.selection_set, variables)
+
+
+def execute_query(
+    entities: Dict[str, List[Dict[str, Any]]],
+    query: str,
+    variables: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Answer a GraphQL query from the entities of a subgraph, by collection name.
+
+    A singular root field with an `id` argument, such as `user(id: ...)`,
+    looks the entity up in the plural collection.
+    """
+    variables = variables or {}
+    data = {}
+    for definition in parse(query).definitions:
+        for field in definition.selection_set.selections:  # type: ignore
+            name = field.name.value
+            key = (field.alias or field.name).value
+            if name not in entities and f"{name}s" in entities:
+                entity_id = value_from_ast_untyped(field.arguments[0].value, variables)
+                entity = next(
+                    (
+                        entity
+                        for entity in entities[f"{name}s"]
+                        if entity["id"] == entity_id
+                    ),
+                    None,
+                )
+                data[key] = _select(entity, field.selection_set, variables)
+            else:
+                data[key] = _resolve(entities.get(name, []), field, variables)
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve the subgraphs and the IPFS documents of the stand-in server."""
+
+    server: "StandinServer"
+
+    def _reply(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_faults(self) -> bool:
+        """Wait for the configured latency, and tell whether to fail the request."""
+        time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self._reply(500, {"errors": [{"message": "Injected error"}]})
+            return True
+        return False
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Answer a GraphQL query."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self._inject_faults():
+            return
+
+        name = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if not self.path.startswith("/subgraphs/") or name not in self.server.subgraphs:
+            self._reply(404, {"errors": [{"message": f"Unknown subgraph {name}"}]})
+            return
+        try:
+            request = json.loads(body)
+            data = execute_query(
+                self.server.subgraphs[name], request["query"], request.get("variables")
+            )
+        except (ValueError, KeyError, GraphQLError) as e:
+            self._reply(400, {"errors": [{"message": str(e)}]})
+            return
+        self._reply(200, {"data": data})
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Serve an IPFS document."""
+        if self._inject_faults():
+            return
+
+        path = self.path[len("/ipfs/") :].rstrip("/")
+        if not self.path.startswith("/ipfs/") or path not in self.server.ipfs:
+            self._reply(404, {"error": f"{self.path} not found"})
+            return
+        self._reply(200, self.server.ipfs[path])
+
+    def log_message(self, *args: Any) -> None:
+        """Do not log every request."""
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Stand-in HTTP server for the subgraphs and the IPFS gateway.
+
+    `dataset` holds the entities of each subgraph by collection name, under
+    `subgraphs`, and the IPFS JSON documents by path, under `ipfs`. Every
+    request is delayed by `latency` seconds, and fails with a 500 error with
+    probability `error_rate`, drawn from a generator seeded with `seed`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        dataset: Dict[str, Any],
+        address: Tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """Initialize the server."""
+        super().__init__(address, _Handler)
+        self.subgraphs: Dict[str, Dict[str, List[Dict[str, Any]]]] = dataset.get(
+            "subgraphs", {}
+        )
+        self.ipfs: Dict[str, Any] = dataset.get("ipfs", {})
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self) -> bool:
+        """Draw whether the next request fails."""
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def env_overrides(self) -> Dict[str, str]:
+        """Return the environment variables pointing the scripts at the server."""
+        overrides = {
+            env_var: f"{self.url}/subgraphs/{name}"
+            for env_var, name in SUBGRAPH_URL_OVERRIDES.items()
+        }
+        overrides[IPFS_GATEWAYS_OVERRIDE] = f"{self.url}/ipfs/"
+        return overrides
+
+
+def synthetic_mech_dataset(
+    senders: List[str],
+    count: int,
+    start_block: int = 30000000,
+    start_timestamp: int = 1700000000,
+) -> Dict[str, Any]:
+    """Return `count` Mech requests, spread over the senders, with their IPFS metadata."""
+    requests = []
+    ipfs = {}
+    for i in range(count):
+        cid = f"Qm{i:044d}"
+        requests.append(
+            {
+                "id": f"0x{i:064x}",
+                "sender": {"id": senders[i % len(senders)].lower()},
+                "transactionHash": f"0x{i:064x}",
+                "blockNumber": str(start_block + i),
+                "blockTimestamp": str(start_timestamp + 5 * i),
+                "mechRequest": {"ipfsHash": cid},
+                "marketplaceRequest": None,
+            }
+        )
+        ipfs[f"{cid}/metadata.json"] = {
+            "tool": "prediction-online",
+            "prompt": f'Please answer the question "Will event {i} happen?"',
+            "nonce": str(i),
+        }
+    return {"subgraphs": {"mech": {"requests": requests}}, "ipfs": ipfs}
+
+
+def _parse_args() -> Any:
+    """Parse the script arguments."""
+    parser = ArgumentParser(
+        description="Serve recorded or synthetic subgraph pages and IPFS documents locally."
+    )
+    parser.add_argument(
+        "--data",
+        type=Path,
+        help='JSON file with the recorded "subgraphs" entities and "ipfs" documents',
+    )
+    parser.add_argument(
+        "--synthetic-mech-requests",
+        type=int,
+        default=0,
+        help="Number of synthetic Mech requests to serve",
+    )
+    parser.add_argument(
+        "--sender",
+        action="append",
+        default=[],
+        help="Sender of the synthetic Mech requests; may be repeated",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay every request"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability of failing a request with a 500 error",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the injected errors"
+    )
+    args = parser.parse_args()
+
+    if args.synthetic_mech_requests and not args.sender:
+        parser.error("--synthetic-mech-requests requires at least one --sender")
+
+    return args
+
+
+def main() -> None:
+    """Run the stand-in server until interrupted."""
+    args = _parse_args()
+    dataset: Dict[str, Any] = {"subgraphs": {}, "ipfs": {}}
+    if args.data:
+        with open(args.data, "r", encoding="utf-8") as file:
+            dataset = json.load(file)
+    if args.synthetic_mech_requests:
+        synthetic = synthetic_mech_dataset(args.sender, args.synthetic_mech_requests)
+        dataset.setdefault("subgraphs", {}).update(synthetic["subgraphs"])
+        dataset.setdefault("ipfs", {}).update(synthetic["ipfs"])
+
+    with StandinServer(
+        dataset, (args.host, args.port), args.latency, args.error_rate, args.seed
+    ) as server:
+        print(f"Serving the stand-in subgraphs and IPFS gateway at {server.url}.")
+        print("Point the scripts at it with:")
+        for env_var, url in server.env_overrides().items():
+            print(f"    export {env_var}={url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stand-in server stopped.")
+
+
+if __name__ == "__main__":
+    main()
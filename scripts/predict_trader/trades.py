@@ -21,37 +21,39 @@
 """This script queries the OMEN subgraph to obtain the trades of a given address."""
 
 import datetime
+import json
+import os
 import re
 import sys
 from argparse import Action, ArgumentError, ArgumentParser, Namespace
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 from string import Template
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import requests
 from operate.cli import OperateApp
 from operate.operate_types import Chain
 from operate.quickstart.run_service import ask_password_if_needed, load_local_config
+from requests.adapters import HTTPAdapter
 from scripts.predict_trader.mech_events import get_mech_requests
+from scripts.predict_trader.mech_events_db import add_mech_db_arguments
+from scripts.predict_trader.metrics import sync_metrics
+from scripts.predict_trader.trades_db import OmenTradesStore
 from scripts.utils import get_service_from_config, get_subgraph_api_key
 
-IRRELEVANT_TOOLS = [
-    "openai-text-davinci-002",
-    "openai-text-davinci-003",
-    "openai-gpt-3.5-turbo",
-    "openai-gpt-4",
-    "stabilityai-stable-diffusion-v1-5",
-    "stabilityai-stable-diffusion-xl-beta-v2-2-2",
-    "stabilityai-stable-diffusion-512-v2-1",
-    "stabilityai-stable-diffusion-768-v2-1",
-    "deepmind-optimization-strong",
-    "deepmind-optimization",
-]
 QUERY_BATCH_SIZE = 1000
+# Connections kept alive to each subgraph, shared by the concurrent queries.
+SUBGRAPH_POOL_MAXSIZE = 10
 DUST_THRESHOLD = 10000000000000
 INVALID_ANSWER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+# Position of the pagination of the trades in the markets of an FPMM creator:
+# all the trades before `creationTimestamp`, and those at `creationTimestamp`
+# up to `id` (in lexicographic order), have been queried.
+OmenTradesCursor = Tuple[int, str]
 FPMM_CREATORS = (
     "0x89c5cc945dd550BcFfb72Fe42BfF002429F46Fec",
     "0xFfc8029154ECD55ABED15BD428bA596E7D23f557",
@@ -61,6 +63,15 @@ DEFAULT_TO_DATE = "2038-01-19T03:14:07"
 DEFAULT_FROM_TIMESTAMP = 0
 DEFAULT_TO_TIMESTAMP = 2147483647
 SCRIPT_PATH = Path(__file__).resolve().parent
+SUBGRAPH_GATEWAY_URL_TEMPLATE = Template(
+    "https://gateway-arbitrum.network.thegraph.com/api/$api_key/subgraphs/id/$subgraph_id"
+)
+OMEN_SUBGRAPH_ID = "9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
+CONDITIONAL_TOKENS_SUBGRAPH_ID = "7s9rGBffUTL8kDZuxvvpuc46v44iuDarbrADBFw5uVp2"
+# Environment variables overriding the URLs of the subgraphs, e.g., to point
+# the scripts at the local stand-in server of `standin_server.py`.
+OMEN_SUBGRAPH_URL_ENV_VAR = "OMEN_SUBGRAPH_URL"
+CONDITIONAL_TOKENS_SUBGRAPH_URL_ENV_VAR = "CONDITIONAL_TOKENS_SUBGRAPH_URL"
 WXDAI_CONTRACT_ADDRESS = "0xe91D153E0b41518A2Ce8Dd3D7944Fa863463a97d"
 
 
@@ -83,10 +94,10 @@ omen_xdai_trades_query = Template("""
                 },
                 creationTimestamp_gte: "${creationTimestamp_gte}",
                 creationTimestamp_lte: "${creationTimestamp_lte}"
-                creationTimestamp_gt: "${creationTimestamp_gt}"
+                ${cursor_filter}
             }
             first: ${first}
-            orderBy: creationTimestamp
+            orderBy: ${order_by}
             orderDirection: asc
         ) {
             id
@@ -107,16 +118,31 @@ omen_xdai_trades_query = Template("""
             transactionHash
             fpmm {
                 id
-                outcomes
-                title
-                answerFinalizedTimestamp
-                currentAnswer
-                isPendingArbitration
-                arbitrationOccurred
-                openingTimestamp
-                condition {
-                    id
-                }
+            }
+        }
+    }
+    """)
+
+
+omen_xdai_markets_query = Template("""
+    {
+        fixedProductMarketMakers(
+            where: {
+                id_in: ${ids}
+            }
+            first: ${first}
+        ) {
+            id
+            outcomes
+            title
+            answerFinalizedTimestamp
+            currentAnswer
+            isPendingArbitration
+            arbitrationOccurred
+            openingTimestamp
+            creationTimestamp
+            condition {
+                id
             }
         }
     }
@@ -288,6 +314,7 @@ def _parse_args() -> Any:
         default=DEFAULT_TO_DATE,
         help="End date (UTC) in YYYY-MM-DD:HH:mm:ss format",
     )
+    add_mech_db_arguments(parser)
     args = parser.parse_args()
 
     if args.creator is None:
@@ -352,12 +379,26 @@ def _redact_subgraph_key(text: str) -> str:
     return _SUBGRAPH_KEY_RE.sub(r"\1<redacted>", text)
 
 
+@lru_cache(maxsize=1)
+def _get_subgraph_session() -> requests.Session:
+    """Return the HTTP session shared by all the subgraph queries.
+
+    The session keeps up to `SUBGRAPH_POOL_MAXSIZE` connections alive per
+    host, so that concurrent paginations do not reconnect on every page.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=SUBGRAPH_POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def _post_subgraph_query(
     url: str, payload: Dict[str, Any], *, label: str
 ) -> Dict[str, Any]:
     """POST a subgraph query and return its parsed JSON body.
 
-    Wraps `requests.post`, `raise_for_status`, and `.json()` in one
+    Wraps the POST on the shared session, `raise_for_status`, and `.json()` in one
     try-block so a network failure, a 4xx/5xx response (e.g. the gateway
     returning an HTML error page), or a malformed body all surface as a
     single `RuntimeError("<label> subgraph query failed for <url>: ...")`
@@ -379,7 +420,9 @@ def _post_subgraph_query(
     and the original exception's class name + str for debugging.
     """
     try:
-        res = requests.post(url, headers=headers, json=payload, timeout=30)
+        res = _get_subgraph_session().post(
+            url, headers=headers, json=payload, timeout=30
+        )
         res.raise_for_status()
         return res.json()
     except requests.RequestException as exc:
@@ -391,47 +434,214 @@ def _post_subgraph_query(
         ) from None
 
 
+def _get_subgraph_url(env_var: str, subgraph_id: str) -> str:
+    """Return the URL of a subgraph, unless overridden by the environment variable."""
+    url = os.getenv(env_var)
+    if url:
+        return url
+    return SUBGRAPH_GATEWAY_URL_TEMPLATE.substitute(
+        api_key=get_subgraph_api_key(), subgraph_id=subgraph_id
+    )
+
+
+def _query_omen_xdai_fpmm_creator_trades(  # pylint: disable=too-many-arguments,too-many-locals
+    url: str,
+    creator: str,
+    fpmm_creator: str,
+    from_timestamp: float,
+    to_timestamp: float,
+    fpmm_from_timestamp: float,
+    fpmm_to_timestamp: float,
+    cursor: Optional[OmenTradesCursor] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[OmenTradesCursor]]:
+    """Query the trades of a creator in the markets of an FPMM creator, after the cursor.
+
+    Pages are ordered by `creationTimestamp`, so a page may end in the
+    middle of the trades of a second. Whenever a page is full, the trades of
+    its last second are queried again by `id` before moving past it, so that
+    none is skipped, even if more than `QUERY_BATCH_SIZE` trades share it;
+    the trades already on the page are deduplicated.
+
+    Returns the trades, and the cursor to resume from: `cursor` itself if
+    there are no new trades.
+    """
+
+    def _query_page(cursor_filter: str, order_by: str) -> List[Dict[str, Any]]:
+        query = omen_xdai_trades_query.substitute(
+            creator=creator.lower(),
+            fpmm_creator=fpmm_creator.lower(),
+            creationTimestamp_gte=int(from_timestamp),
+            creationTimestamp_lte=int(to_timestamp),
+            fpmm_creationTimestamp_gte=int(fpmm_from_timestamp),
+            fpmm_creationTimestamp_lte=int(fpmm_to_timestamp),
+            first=QUERY_BATCH_SIZE,
+            cursor_filter=cursor_filter,
+            order_by=order_by,
+        )
+        content_json = _to_content(query)
+        result_json = _post_subgraph_query(url, content_json, label="omen")
+        return result_json.get("data", {}).get("fpmmTrades", [])
+
+    all_trades: List[Dict[str, Any]] = []
+    seen_ids = set()
+
+    def _add(trades: List[Dict[str, Any]]) -> None:
+        for trade in trades:
+            if trade["id"] not in seen_ids:
+                seen_ids.add(trade["id"])
+                all_trades.append(trade)
+
+    timestamp, id_gt = cursor if cursor is not None else (0, None)
+    while True:
+        # The rest of the trades of the second of the cursor, by id.
+        while id_gt is not None:
+            trades = _query_page(
+                f'creationTimestamp: "{timestamp}", id_gt: "{id_gt}"', "id"
+            )
+            _add(trades)
+            if trades:
+                cursor = (timestamp, trades[-1]["id"])
+            if len(trades) < QUERY_BATCH_SIZE:
+                break
+            id_gt = trades[-1]["id"]
+
+        trades = _query_page(
+            f'creationTimestamp_gt: "{timestamp}"', "creationTimestamp"
+        )
+        _add(trades)
+        if len(trades) < QUERY_BATCH_SIZE:
+            break
+        timestamp, id_gt = int(trades[-1]["creationTimestamp"]), ""
+
+    if trades:
+        # The last page holds all the trades of its last second.
+        last_timestamp = int(trades[-1]["creationTimestamp"])
+        cursor = (
+            last_timestamp,
+            max(
+                trade["id"]
+                for trade in trades
+                if int(trade["creationTimestamp"]) == last_timestamp
+            ),
+        )
+    return all_trades, cursor
+
+
 def _query_omen_xdai_subgraph(  # pylint: disable=too-many-locals
     creator: str,
     from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
     to_timestamp: float = DEFAULT_TO_TIMESTAMP,
     fpmm_from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
     fpmm_to_timestamp: float = DEFAULT_TO_TIMESTAMP,
+    cursors: Optional[Dict[str, OmenTradesCursor]] = None,
 ) -> Dict[str, Any]:
-    """Query the subgraph."""
-    subgraph_api_key = get_subgraph_api_key()
-    url = f"https://gateway-arbitrum.network.thegraph.com/api/{subgraph_api_key}/subgraphs/id/9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
+    """Query the subgraph.
+
+    The trades in the markets of each FPMM creator are paginated
+    concurrently, and merged in the order of `FPMM_CREATORS`. Only the
+    trades after the cursors of the FPMM creators, by lowercase address,
+    are queried; the cursors to resume from are returned under `cursors`.
+    """
+    url = _get_subgraph_url(OMEN_SUBGRAPH_URL_ENV_VAR, OMEN_SUBGRAPH_ID)
+    cursors = cursors or {}
+
+    with ThreadPoolExecutor(max_workers=len(FPMM_CREATORS)) as executor:
+        futures = {
+            fpmm_creator.lower(): executor.submit(
+                _query_omen_xdai_fpmm_creator_trades,
+                url,
+                creator,
+                fpmm_creator,
+                from_timestamp,
+                to_timestamp,
+                fpmm_from_timestamp,
+                fpmm_to_timestamp,
+                cursors.get(fpmm_creator.lower()),
+            )
+            for fpmm_creator in FPMM_CREATORS
+        }
+        results = {
+            fpmm_creator: future.result() for fpmm_creator, future in futures.items()
+        }
 
     grouped_results = defaultdict(list)
+    for trades, _ in results.values():
+        for trade in trades:
+            fpmm_id = trade.get("fpmm", {}).get("id")
+            grouped_results[fpmm_id].append(trade)
 
-    for fpmm_creator in FPMM_CREATORS:
-        creationTimestamp_gt = "0"
-
-        while True:
-            query = omen_xdai_trades_query.substitute(
-                creator=creator.lower(),
-                fpmm_creator=fpmm_creator.lower(),
-                creationTimestamp_gte=int(from_timestamp),
-                creationTimestamp_lte=int(to_timestamp),
-                fpmm_creationTimestamp_gte=int(fpmm_from_timestamp),
-                fpmm_creationTimestamp_lte=int(fpmm_to_timestamp),
-                first=QUERY_BATCH_SIZE,
-                creationTimestamp_gt=creationTimestamp_gt,
-            )
-            content_json = _to_content(query)
-            result_json = _post_subgraph_query(url, content_json, label="omen")
-            trades = result_json.get("data", {}).get("fpmmTrades", [])
+    all_results = {
+        "data": {
+            "fpmmTrades": [
+                trade
+                for trades_list in grouped_results.values()
+                for trade in trades_list
+            ]
+        },
+        "cursors": {
+            fpmm_creator: cursor
+            for fpmm_creator, (_, cursor) in results.items()
+            if cursor is not None
+        },
+    }
 
-            if not trades:
-                break
+    return all_results
 
-            for trade in trades:
-                fpmm_id = trade.get("fpmm", {}).get("id")
-                grouped_results[fpmm_id].append(trade)
 
-            creationTimestamp_gt = trades[len(trades) - 1]["creationTimestamp"]
+def _query_omen_xdai_markets(fpmm_ids: List[str]) -> List[Dict[str, Any]]:
+    """Query markets by ID, `QUERY_BATCH_SIZE` markets at a time."""
+    url = _get_subgraph_url(OMEN_SUBGRAPH_URL_ENV_VAR, OMEN_SUBGRAPH_ID)
 
-    all_results = {
+    markets: List[Dict[str, Any]] = []
+    for i in range(0, len(fpmm_ids), QUERY_BATCH_SIZE):
+        query = omen_xdai_markets_query.substitute(
+            ids=json.dumps(fpmm_ids[i : i + QUERY_BATCH_SIZE]),
+            first=QUERY_BATCH_SIZE,
+        )
+        result_json = _post_subgraph_query(url, _to_content(query), label="omen")
+        markets.extend(result_json.get("data", {}).get("fixedProductMarketMakers", []))
+    return markets
+
+
+def get_omen_trades(
+    creator: str,
+    from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
+    to_timestamp: float = DEFAULT_TO_TIMESTAMP,
+    fpmm_from_timestamp: float = DEFAULT_FROM_TIMESTAMP,
+    fpmm_to_timestamp: float = DEFAULT_TO_TIMESTAMP,
+) -> Dict[str, Any]:
+    """Sync the local Omen trades database of a creator, and return the trades within the ranges.
+
+    Only the trades after the stored cursors are queried, over the whole
+    history, so that the cursors stay valid for any range. The trades only
+    hold the ID of their market: the new markets, and those that are not
+    closed yet, are then queried in bulk. Closed markets are final, and are
+    served from the database.
+    """
+    creator = creator.lower()
+    with OmenTradesStore() as store:
+        result = _query_omen_xdai_subgraph(creator, cursors=store.get_cursors(creator))
+        store.add_trades(creator, result["data"]["fpmmTrades"], result["cursors"])
+
+        unresolved_ids = store.get_unresolved_market_ids(creator)
+        if unresolved_ids:
+            store.upsert_markets(
+                (market, _get_market_state(market) == MarketState.CLOSED)
+                for market in _query_omen_xdai_markets(unresolved_ids)
+            )
+
+        trades = store.get_trades(
+            creator,
+            from_timestamp,
+            to_timestamp,
+            fpmm_from_timestamp,
+            fpmm_to_timestamp,
+        )
+
+    grouped_results = defaultdict(list)
+    for trade in trades:
+        grouped_results[trade["fpmm"]["id"]].append(trade)
+    return {
         "data": {
             "fpmmTrades": [
                 trade
@@ -441,13 +651,12 @@ def _query_omen_xdai_subgraph(  # pylint: disable=too-many-locals
         }
     }
 
-    return all_results
-
 
 def _query_conditional_tokens_gc_subgraph(creator: str) -> Dict[str, Any]:
     """Query the subgraph."""
-    subgraph_api_key = get_subgraph_api_key()
-    url = f"https://gateway-arbitrum.network.thegraph.com/api/{subgraph_api_key}/subgraphs/id/7s9rGBffUTL8kDZuxvvpuc46v44iuDarbrADBFw5uVp2"
+    url = _get_subgraph_url(
+        CONDITIONAL_TOKENS_SUBGRAPH_URL_ENV_VAR, CONDITIONAL_TOKENS_SUBGRAPH_ID
+    )
 
     all_results: Dict[str, Any] = {"data": {"user": {"userPositions": []}}}
     userPositions_id_gt = ""
@@ -500,26 +709,32 @@ def wei_to_olas(wei: int) -> str:
     return "{:.2f} OLAS".format(wei_to_unit(wei))
 
 
-def _is_redeemed(user_json: Dict[str, Any], fpmmTrade: Dict[str, Any]) -> bool:
-    user_positions = user_json["data"]["user"]["userPositions"]
-    outcomes_tokens_traded = int(fpmmTrade["outcomeTokensTraded"])
-    condition_id = fpmmTrade["fpmm"]["condition"]["id"]
+def _index_user_positions(user_json: Dict[str, Any]) -> Dict[str, Set[int]]:
+    """Return the balances of the positions of a user, by condition ID.
 
-    for position in user_positions:
-        position_condition_ids = position["position"]["conditionIds"]
+    A user without positions is returned as `None` by the subgraph.
+    """
+    position_balances: Dict[str, Set[int]] = defaultdict(set)
+    user = user_json["data"]["user"] or {"userPositions": []}
+    for position in user["userPositions"]:
         balance = int(position["balance"])
+        for condition_id in position["position"]["conditionIds"]:
+            position_balances[condition_id].add(balance)
+    return position_balances
 
-        if condition_id in position_condition_ids and balance == outcomes_tokens_traded:
-            return False
-
-    for position in user_positions:
-        position_condition_ids = position["position"]["conditionIds"]
-        balance = int(position["balance"])
 
-        if condition_id in position_condition_ids and balance == 0:
-            return True
+def _is_redeemed(
+    position_balances: Dict[str, Set[int]], fpmmTrade: Dict[str, Any]
+) -> bool:
+    """Tell whether the tokens of a trade were redeemed, from the balances of `_index_user_positions`.
 
-    return False
+    They were not if a position of the condition still holds the traded
+    tokens, and were if a position of the condition is empty.
+    """
+    balances = position_balances.get(fpmmTrade["fpmm"]["condition"]["id"], set())
+    if int(fpmmTrade["outcomeTokensTraded"]) in balances:
+        return False
+    return 0 in balances
 
 
 def _compute_roi(initial_value: int, final_value: int) -> float:
@@ -749,7 +964,9 @@ def parse_user(  # pylint: disable=too-many-locals,too-many-statements
     """Parse the trades from the response."""
 
     _mech_statistics = dict(mech_statistics)
-    user_json = _query_conditional_tokens_gc_subgraph(creator)
+    position_balances = _index_user_positions(
+        _query_conditional_tokens_gc_subgraph(creator)
+    )
 
     statistics_table = {
         row: {col: 0 for col in STATS_TABLE_COLS} for row in STATS_TABLE_ROWS
@@ -759,6 +976,7 @@ def parse_user(  # pylint: disable=too-many-locals,too-many-statements
     output += "Trades\n"
     output += "------\n"
 
+    market_states: Dict[str, MarketState] = {}
     for fpmmTrade in creator_trades_json["data"]["fpmmTrades"]:
         try:
             collateral_amount = int(fpmmTrade["collateralAmount"])
@@ -777,7 +995,10 @@ def parse_user(  # pylint: disable=too-many-locals,too-many-statements
             )
             output += f'    Trade date: {creation_timestamp_utc.strftime("%Y-%m-%d %H:%M:%S %Z")}\n'
 
-            market_status = _get_market_state(fpmm)
+            # The state of a market is the same for all its trades.
+            if fpmm["id"] not in market_states:
+                market_states[fpmm["id"]] = _get_market_state(fpmm)
+            market_status = market_states[fpmm["id"]]
 
             statistics_table[MarketAttribute.NUM_TRADES][market_status] += 1
             statistics_table[MarketAttribute.INVESTMENT][
@@ -821,7 +1042,7 @@ def parse_user(  # pylint: disable=too-many-locals,too-many-statements
                     earnings = collateral_amount
                     output += "  Final answer: Market has been declared invalid.\n"
                     output += f"      Earnings: {wei_to_xdai(earnings)}\n"
-                    redeemed = _is_redeemed(user_json, fpmmTrade)
+                    redeemed = _is_redeemed(position_balances, fpmmTrade)
                     if redeemed:
                         statistics_table[MarketAttribute.NUM_INVALID_MARKET][
                             market_status
@@ -834,7 +1055,7 @@ def parse_user(  # pylint: disable=too-many-locals,too-many-statements
                     earnings = outcomes_tokens_traded
                     output += f"  Final answer: {fpmm['outcomes'][current_answer]!r} - Congrats! The trade was for the winner answer.\n"
                     output += f"      Earnings: {wei_to_xdai(earnings)}\n"
-                    redeemed = _is_redeemed(user_json, fpmmTrade)
+                    redeemed = _is_redeemed(position_balances, fpmmTrade)
                     output += f"      Redeemed: {redeemed}\n"
                     statistics_table[MarketAttribute.WINNER_TRADES][market_status] += 1
 
@@ -892,26 +1113,11 @@ def get_mech_statistics(mech_requests: Dict[str, Any]) -> Dict[str, Dict[str, in
     mech_statistics: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
 
     for mech_request in mech_requests.values():
-        if (
-            "ipfs_contents" not in mech_request
-            or "tool" not in mech_request["ipfs_contents"]
-            or "prompt" not in mech_request["ipfs_contents"]
-        ):
-            continue
-
-        if mech_request["ipfs_contents"]["tool"] in IRRELEVANT_TOOLS:
+        # The question and relevance of a request are computed when it is stored.
+        if not mech_request.get("relevant"):
             continue
 
-        prompt = mech_request["ipfs_contents"]["prompt"]
-        prompt = prompt.replace("\n", " ")
-        prompt = prompt.strip()
-        prompt = re.sub(r"\s+", " ", prompt)
-        prompt_match = re.search(r"\"(.*)\"", prompt)
-        if prompt_match:
-            question = prompt_match.group(1)
-        else:
-            question = prompt
-
+        question = mech_request["question"]
         mech_statistics[question]["count"] += 1
         mech_statistics[question]["fees"] += mech_request["fee"]
 
@@ -934,10 +1140,16 @@ if __name__ == "__main__":
         user_args.creator,
         user_args.from_date.timestamp(),
         user_args.to_date.timestamp(),
+        backend=user_args.mech_db_backend,
+        full_resync=user_args.full_resync,
+        compact=user_args.compact_mech_db,
+        rpc=rpc,
+        sync=not user_args.no_mech_sync,
+        windowed=True,
     )
     mech_statistics = get_mech_statistics(mech_requests)
 
-    trades_json = _query_omen_xdai_subgraph(
+    trades_json = get_omen_trades(
         user_args.creator,
         user_args.from_date.timestamp(),
         user_args.to_date.timestamp(),
@@ -946,3 +1158,4 @@ if __name__ == "__main__":
     )
     parsed_output, _ = parse_user(rpc, user_args.creator, trades_json, mech_statistics)
     print(parsed_output)
+    sync_metrics.emit(user_args.sync_metrics, user_args.sync_metrics_file)
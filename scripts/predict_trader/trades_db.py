@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# ------------------------------------------------------------------------------
+#
+#   Copyright 2026 Valory AG
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+# ------------------------------------------------------------------------------
+
+"""Local database of the Omen trades of each creator."""
+
+import json
+import sqlite3
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_PATH = Path(__file__).resolve().parent
+OMEN_TRADES_SQLITE_PATH = Path(SCRIPT_PATH.parents[1], "data", "omen_trades.sqlite")
+OMEN_TRADES_DB_VERSION = 2
+
+_SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS omen_trades (
+        creator TEXT NOT NULL,
+        trade_id TEXT NOT NULL,
+        fpmm_id TEXT NOT NULL,
+        creation_timestamp INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (creator, trade_id)
+    );
+    CREATE INDEX IF NOT EXISTS omen_trades_by_timestamp
+        ON omen_trades (creator, creation_timestamp);
+    CREATE TABLE IF NOT EXISTS omen_markets (
+        fpmm_id TEXT PRIMARY KEY,
+        creation_timestamp INTEGER NOT NULL,
+        closed INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS omen_trades_cursors (
+        creator TEXT NOT NULL,
+        fpmm_creator TEXT NOT NULL,
+        creation_timestamp INTEGER NOT NULL,
+        trade_id TEXT NOT NULL,
+        PRIMARY KEY (creator, fpmm_creator)
+    );
+"""
+_TABLES = ("omen_trades", "omen_markets", "omen_trades_cursors")
+
+
+class OmenTradesStore:
+    """Omen trades database stored in SQLite.
+
+    Trades never change once indexed, so they are stored keyed by creator
+    and trade ID, with only the ID of their market. Each market (the `fpmm`
+    of its trades) is stored once, so that refreshing it updates all its
+    trades; closed markets are final, and are never refreshed.
+    The cursors record, for each creator and FPMM creator, up to where the
+    trades have been synced. The database is a cache of the subgraph: a
+    database of another version is emptied and synced again.
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        """Open (and create, if needed) the SQLite database."""
+        path = path or OMEN_TRADES_SQLITE_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+
+        (user_version,) = self._connection.execute("PRAGMA user_version").fetchone()
+        if user_version != OMEN_TRADES_DB_VERSION:
+            with self._connection:
+                for table in _TABLES:
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self._connection.execute(
+                    f"PRAGMA user_version={OMEN_TRADES_DB_VERSION}"
+                )
+        self._connection.executescript(_SQLITE_SCHEMA)
+
+    def get_cursors(self, creator: str) -> Dict[str, Tuple[int, str]]:
+        """Return the cursors of the trades of a creator, by FPMM creator."""
+        rows = self._connection.execute(
+            "SELECT fpmm_creator, creation_timestamp, trade_id "
+            "FROM omen_trades_cursors WHERE creator = ?",
+            (creator,),
+        )
+        return {
+            fpmm_creator: (creation_timestamp, trade_id)
+            for fpmm_creator, creation_timestamp, trade_id in rows
+        }
+
+    def add_trades(
+        self,
+        creator: str,
+        trades: List[Dict[str, Any]],
+        cursors: Dict[str, Tuple[int, str]],
+    ) -> None:
+        """Store new trades of a creator, and the cursors they were synced to."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO omen_trades VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        creator,
+                        trade["id"],
+                        trade["fpmm"]["id"],
+                        int(trade["creationTimestamp"]),
+                        json.dumps(
+                            {
+                                key: value
+                                for key, value in trade.items()
+                                if key != "fpmm"
+                            }
+                        ),
+                    )
+                    for trade in trades
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO omen_trades_cursors VALUES (?, ?, ?, ?)",
+                (
+                    (creator, fpmm_creator, creation_timestamp, trade_id)
+                    for fpmm_creator, (creation_timestamp, trade_id) in cursors.items()
+                ),
+            )
+
+    def get_unresolved_market_ids(self, creator: str) -> List[str]:
+        """Return the IDs of the markets traded by a creator that are not stored, or not closed."""
+        rows = self._connection.execute(
+            "SELECT DISTINCT t.fpmm_id FROM omen_trades t "
+            "LEFT JOIN omen_markets m ON m.fpmm_id = t.fpmm_id "
+            "WHERE t.creator = ? AND (m.closed IS NULL OR NOT m.closed) "
+            "ORDER BY t.fpmm_id",
+            (creator,),
+        )
+        return [fpmm_id for (fpmm_id,) in rows]
+
+    def upsert_markets(self, markets: Iterable[Tuple[Dict[str, Any], bool]]) -> None:
+        """Insert or replace markets, with whether they are closed."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO omen_markets VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        market["id"],
+                        int(market["creationTimestamp"]),
+                        closed,
+                        json.dumps(market),
+                    )
+                    for market, closed in markets
+                ),
+            )
+
+    def get_trades(  # pylint: disable=too-many-arguments
+        self,
+        creator: str,
+        from_timestamp: float,
+        to_timestamp: float,
+        fpmm_from_timestamp: float,
+        fpmm_to_timestamp: float,
+    ) -> List[Dict[str, Any]]:
+        """Return the trades of a creator, with their market, as queried from the subgraph.
+
+        As in the subgraph query, the trades are created within the
+        (inclusive) timestamp range, and their markets from
+        `fpmm_from_timestamp` and before `fpmm_to_timestamp`. Trades whose
+        market is not stored are left out.
+        """
+        rows = self._connection.execute(
+            "SELECT t.data, m.data FROM omen_trades t "
+            "JOIN omen_markets m ON m.fpmm_id = t.fpmm_id "
+            "WHERE t.creator = ? AND t.creation_timestamp BETWEEN ? AND ? "
+            "AND m.creation_timestamp >= ? AND m.creation_timestamp < ? "
+            "ORDER BY t.creation_timestamp, t.trade_id",
+            (
+                creator,
+                int(from_timestamp),
+                int(to_timestamp),
+                int(fpmm_from_timestamp),
+                int(fpmm_to_timestamp),
+            ),
+        )
+        return [{**json.loads(trade), "fpmm": json.loads(fpmm)} for trade, fpmm in rows]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._connection.close()
+
+    def __enter__(self) -> "OmenTradesStore":
+        """Enter the store context."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Close the store."""
+        self.close()
@@ -0,0 +1,253 @@
+"""Unit tests for predict_trader.ipfs."""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from scripts.predict_trader import ipfs
+
+
+def test_cache_round_trip(tmp_path: Path) -> None:
+	"""Stored entries should be returned as-is."""
+
+	cache = ipfs.IpfsCache(tmp_path / "cache")
+
+	assert cache.get("QmA") is None
+	cache.put("QmA", {"path": "metadata.json", "contents": {"a": 1}})
+
+	assert cache.get("QmA") == {"path": "metadata.json", "contents": {"a": 1}}
+	assert json.loads((tmp_path / "cache" / "QmA.json").read_text()) == {
+		"path": "metadata.json",
+		"contents": {"a": 1},
+	}
+	assert not list((tmp_path / "cache").glob("*.tmp"))
+
+
+def test_cache_rejects_unsafe_cids(tmp_path: Path) -> None:
+	"""CIDs that are not plain alphanumeric strings must never touch the disk."""
+
+	cache = ipfs.IpfsCache(tmp_path / "cache")
+
+	cache.put("../escape", {"path": "", "contents": {}})
+
+	assert cache.get("../escape") is None
+	assert not (tmp_path / "escape.json").exists()
+	assert not (tmp_path / "cache").exists()
+
+
+def test_cache_ignores_corrupted_entries(tmp_path: Path) -> None:
+	"""A corrupted entry should behave as a cache miss."""
+
+	cache = ipfs.IpfsCache(tmp_path)
+	(tmp_path / "QmA.json").write_text("{broken", encoding="utf-8")
+
+	assert cache.get("QmA") is None
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path: Path) -> None:
+	"""Going over the size cap should evict the entries accessed least recently."""
+
+	entry = {"path": "", "contents": {"data": "x" * 100}}
+	entry_size = len(json.dumps(entry))
+	cache = ipfs.IpfsCache(tmp_path, max_bytes=3 * entry_size)
+
+	for i, cid in enumerate(["QmA", "QmB", "QmC"]):
+		cache.put(cid, entry)
+		os.utime(tmp_path / f"{cid}.json", (1000 + i, 1000 + i))
+
+	# Reading QmA makes it the most recently used entry.
+	assert cache.get("QmA") == entry
+	cache.put("QmD", entry)
+
+	assert cache.get("QmB") is None
+	assert cache.get("QmC") is None
+	assert cache.get("QmA") == entry
+	assert cache.get("QmD") == entry
+	assert sum(p.stat().st_size for p in tmp_path.glob("*.json")) <= 3 * entry_size
+
+
+def test_cache_counts_existing_entries_on_first_write(tmp_path: Path) -> None:
+	"""Entries written by previous runs should count towards the size cap."""
+
+	entry = {"path": "", "contents": {"data": "x" * 100}}
+	entry_size = len(json.dumps(entry))
+	(tmp_path / "QmOld.json").write_text(json.dumps(entry), encoding="utf-8")
+	os.utime(tmp_path / "QmOld.json", (1000, 1000))
+	cache = ipfs.IpfsCache(tmp_path, max_bytes=int(entry_size * 1.5))
+
+	cache.put("QmNew", entry)
+
+	assert not (tmp_path / "QmOld.json").exists()
+	assert cache.get("QmNew") == entry
+
+
+def test_cache_scan_tolerates_concurrently_removed_entries(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+	"""Entries removed by another process while scanning should be skipped."""
+
+	cache = ipfs.IpfsCache(tmp_path)
+	(tmp_path / "QmA.json").write_text("{}", encoding="utf-8")
+	original_glob = Path.glob
+
+	def _glob(self: Path, pattern: str) -> Any:
+		yield from original_glob(self, pattern)
+		yield self / "QmGone.json"
+
+	monkeypatch.setattr(Path, "glob", _glob)
+
+	assert [entry[1].name for entry in cache._scan()] == ["QmA.json"]
+
+
+class _Response:
+	"""Fake gateway response."""
+
+	def __init__(self, payload: Any) -> None:
+		self._payload = payload
+
+	def raise_for_status(self) -> None:
+		"""Raise the payload if it is an HTTP error."""
+		if isinstance(self._payload, ipfs.requests.HTTPError):
+			raise self._payload
+
+	def json(self) -> Any:
+		"""Return the payload or raise it if it is a decoding error."""
+		if isinstance(self._payload, ValueError):
+			raise self._payload
+		return self._payload
+
+
+GATEWAYS = ["https://a/ipfs/", "https://b/ipfs/", "https://c/ipfs/"]
+
+
+def test_gateways_return_first_answer_without_hedging(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""A fast healthy gateway should be the only one queried."""
+
+	urls: list[str] = []
+
+	def _fake_get(url: str, timeout: int) -> _Response:
+		urls.append(url)
+		return _Response({"url": url})
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+
+	assert gateways.fetch_json("QmA/metadata.json") == (
+		"https://a/ipfs/QmA/metadata.json",
+		{"url": "https://a/ipfs/QmA/metadata.json"},
+	)
+	assert urls == ["https://a/ipfs/QmA/metadata.json"]
+	assert gateways.summary()["https://a/ipfs/"]["requests"] == 1
+
+
+def test_gateways_fail_over_and_demote_failing_gateways(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""A failing gateway should be replaced at once, and ranked last afterwards."""
+
+	urls: list[str] = []
+
+	def _fake_get(url: str, timeout: int) -> _Response:
+		urls.append(url)
+		if url.startswith("https://a/"):
+			raise ipfs.requests.ConnectionError("down")
+		return _Response({"ok": True})
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	monkeypatch.setattr(ipfs, "IPFS_HEDGE_DEFAULT_DELAY", 10.0)
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+
+	assert gateways.fetch_json("QmA") == ("https://b/ipfs/QmA", {"ok": True})
+	assert urls == ["https://a/ipfs/QmA", "https://b/ipfs/QmA"]
+	assert gateways.ranked() == ["https://b/ipfs/", "https://c/ipfs/", "https://a/ipfs/"]
+	assert gateways.summary()["https://a/ipfs/"]["errors"] == 1
+
+
+def test_gateways_hedge_slow_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""A request pending past the hedging delay should be raced by the next gateway."""
+
+	release = threading.Event()
+
+	def _fake_get(url: str, timeout: int) -> _Response:
+		if url.startswith("https://a/"):
+			release.wait(5)
+			return _Response({"slow": True})
+		return _Response({"fast": True})
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	monkeypatch.setattr(ipfs, "IPFS_HEDGE_DEFAULT_DELAY", 0.01)
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+
+	try:
+		assert gateways.fetch_json("QmA") == ("https://b/ipfs/QmA", {"fast": True})
+	finally:
+		release.set()
+
+
+def test_gateways_raise_when_no_gateway_returns_json(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Every gateway should be tried before giving up; non-JSON answers are not gateway errors."""
+
+	def _fake_get(url: str, timeout: int) -> _Response:
+		if url.startswith("https://a/"):
+			return _Response(json.JSONDecodeError("bad", "doc", 0))
+		return _Response(ipfs.requests.HTTPError("502 Bad Gateway"))
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+
+	with pytest.raises(ipfs.IpfsFetchError) as error:
+		gateways.fetch_json("QmA")
+
+	assert not error.value.not_found
+	assert "https://a/ipfs/QmA is not a JSON document." in str(error.value)
+	assert "https://c/ipfs/QmA could not be fetched: 502 Bad Gateway" in str(error.value)
+	assert {gateway: stats["errors"] for gateway, stats in gateways.summary().items()} == {
+		"https://a/ipfs/": 0,
+		"https://b/ipfs/": 1,
+		"https://c/ipfs/": 1,
+	}
+
+
+def test_gateway_stats_percentiles(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Latency percentiles should only be derived from enough successful samples."""
+
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+	stats = gateways.stats["https://a/ipfs/"]
+	assert gateways.hedge_delay("https://a/ipfs/") == ipfs.IPFS_HEDGE_DEFAULT_DELAY
+
+	for latency in [0.5, 0.1, 0.4, 0.2, 0.3]:
+		stats.record(latency, ok=True)
+	stats.record(9.0, ok=False)
+
+	assert stats.latency_percentile(0.5) == 0.3
+	assert stats.latency_percentile(1.0) == 0.5
+	assert gateways.hedge_delay("https://a/ipfs/") == 0.5
+	assert stats.error_rate() == pytest.approx(1 / 6)
+	assert gateways.summary()["https://a/ipfs/"] == {
+		"requests": 6,
+		"errors": 1,
+		"latency_p50": 0.3,
+		"latency_p90": 0.5,
+	}
+
+
+def test_gateways_report_documents_not_found(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Not found statuses and non-JSON answers from every gateway mean there is no such document."""
+
+	def _fake_get(url: str, timeout: int) -> _Response:
+		if url.startswith("https://a/"):
+			return _Response(json.JSONDecodeError("bad", "doc", 0))
+		response = ipfs.requests.Response()
+		response.status_code = 404
+		return _Response(ipfs.requests.HTTPError("404 Not Found", response=response))
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	gateways = ipfs.IpfsGateways(GATEWAYS)
+
+	with pytest.raises(ipfs.IpfsFetchError) as error:
+		gateways.fetch_json("QmA/metadata.json")
+
+	assert error.value.not_found
+	assert all(stats["errors"] == 0 for stats in gateways.summary().values())
@@ -2,11 +2,32 @@
 
 import builtins
 import json
+import os
+import runpy
+import sys
+import threading
+import time
 from typing import Any
 
 import pytest
 
-from scripts.predict_trader import mech_events
+from scripts.predict_trader import ipfs, mech_events, mech_events_db
+
+
+@pytest.fixture(autouse=True)
+def isolated_ipfs_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> ipfs.IpfsCache:
+	"""Keep the IPFS cache of every test inside its own temporary directory."""
+	cache = ipfs.IpfsCache(tmp_path / "ipfs_cache")
+	monkeypatch.setattr(ipfs, "ipfs_cache", cache)
+	return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_ipfs_gateways(monkeypatch: pytest.MonkeyPatch) -> ipfs.IpfsGateways:
+	"""Start every test with IPFS gateways without any recorded stats."""
+	gateways = ipfs.IpfsGateways()
+	monkeypatch.setattr(ipfs, "ipfs_gateways", gateways)
+	return gateways
 
 
 class _Response:
@@ -32,13 +53,13 @@ class _DummyEvent(mech_events.MechBaseEvent):
 	subgraph_event_name = "dummy"
 
 
-def _make_subgraph_event(event_id: str) -> dict[str, Any]:
+def _make_subgraph_event(event_id: str, block_number: int = 1) -> dict[str, Any]:
 	"""Create a minimal subgraph event payload for MechRequest."""
 	return {
 		"id": event_id,
 		"sender": {"id": "0xabc"},
 		"transactionHash": f"0xtx{event_id}",
-		"blockNumber": "1",
+		"blockNumber": str(block_number),
 		"blockTimestamp": "100",
 		"mechRequest": {"ipfsHash": "QmHash"},
 		"marketplaceRequest": {"ipfsHashBytes": "0x1234"},
@@ -62,7 +83,7 @@ def test_populate_ipfs_contents_falls_back_to_non_metadata_url(monkeypatch: pyte
 			return _Response(json.JSONDecodeError("bad", "doc", 0))
 		return _Response({"ok": True})
 
-	monkeypatch.setattr(mech_events.requests, "get", _fake_get)
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
 
 	event = mech_events.MechBaseEvent(
 		event_id="1",
@@ -72,92 +93,298 @@ def test_populate_ipfs_contents_falls_back_to_non_metadata_url(monkeypatch: pyte
 		block_timestamp=100,
 		ipfs_hash="QmHash",
 	)
+	event._populate_ipfs_contents()
 
 	assert calls[0].endswith("/metadata.json")
 	assert event.ipfs_contents == {"ok": True}
 	assert event.ipfs_link.endswith("QmHash")
 
 
-def test_read_mech_events_file_not_found_sets_default_version(
-	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
-) -> None:
-	"""Missing DB file should initialize default DB structure."""
+def test_event_construction_does_not_fetch_ipfs(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Building an event from subgraph data must not hit the IPFS gateway."""
 
-	db_path = tmp_path / "mech_events.json"
-	monkeypatch.setattr(mech_events, "MECH_EVENTS_JSON_PATH", db_path)
+	monkeypatch.setattr(
+		ipfs.requests,
+		"get",
+		lambda *_args, **_kwargs: pytest.fail("IPFS fetched during construction"),
+	)
 
-	data = mech_events._read_mech_events_data_from_file()
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
 
-	assert data == {"db_version": mech_events.MECH_EVENTS_DB_VERSION}
+	assert event.ipfs_contents == {}
+	assert event.ipfs_link == ""
 
 
-def test_read_mech_events_old_version_renames_and_resets(
-	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
-) -> None:
-	"""Old DB version should be moved aside and recreated."""
+def test_populate_ipfs_contents_concurrently_bounds_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""All events should be resolved, never with more workers in flight than allowed."""
+
+	lock = threading.Lock()
+	state = {"active": 0, "peak": 0}
+	resolved: list[str] = []
+
+	def _fake_populate(self: mech_events.MechBaseEvent) -> None:
+		with lock:
+			state["active"] += 1
+			state["peak"] = max(state["peak"], state["active"])
+		time.sleep(0.01)
+		self.ipfs_contents = {"id": self.event_id}
+		with lock:
+			state["active"] -= 1
+
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", _fake_populate)
+	events = [mech_events.MechRequest(_make_subgraph_event(str(i))) for i in range(10)]
+
+	for event in mech_events._populate_ipfs_contents_concurrently([events[:4], events[4:]], max_workers=3):
+		resolved.append(event.event_id)
+
+	assert sorted(resolved) == sorted(str(i) for i in range(10))
+	assert all(event.ipfs_contents == {"id": event.event_id} for event in events)
+	assert 1 < state["peak"] <= 3
+
 
-	db_path = tmp_path / "mech_events.json"
-	db_path.write_text(json.dumps({"db_version": 1}), encoding="utf-8")
-	monkeypatch.setattr(mech_events, "MECH_EVENTS_JSON_PATH", db_path)
-	monkeypatch.setattr(mech_events.time, "strftime", lambda _: "2026-03-10_10-00-00")
+def test_populate_ipfs_contents_concurrently_propagates_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Errors raised by a fetch should surface to the caller."""
 
-	data = mech_events._read_mech_events_data_from_file()
+	def _fail(self: mech_events.MechBaseEvent) -> None:
+		raise RuntimeError("boom")
 
-	assert data == {"db_version": mech_events.MECH_EVENTS_DB_VERSION}
-	assert (tmp_path / "mech_events.2026-03-10_10-00-00.old.json").exists()
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", _fail)
+	events = [mech_events.MechRequest(_make_subgraph_event("1"))]
 
+	with pytest.raises(RuntimeError, match="boom"):
+		list(mech_events._populate_ipfs_contents_concurrently([events], max_workers=0))
 
-def test_read_mech_events_corrupted_json_exits(
-	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+
+def test_populate_ipfs_contents_concurrently_overlaps_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""A batch should be resolved while the next one is produced, holding at most two batches."""
+
+	log: list[str] = []
+
+	def _fake_populate(self: mech_events.MechBaseEvent) -> None:
+		self.ipfs_contents = {"id": self.event_id}
+
+	def _batches() -> Any:
+		for page in range(3):
+			log.append(f"page {page}")
+			yield [mech_events.MechRequest(_make_subgraph_event(f"{page}-{i}")) for i in range(2)]
+
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", _fake_populate)
+
+	for event in mech_events._populate_ipfs_contents_concurrently(_batches(), max_workers=2):
+		log.append(event.event_id)
+
+	assert log == ["page 0", "page 1", "0-0", "0-1", "page 2", "1-0", "1-1", "2-0", "2-1"]
+
+
+def test_populate_ipfs_contents_stores_and_reuses_cached_contents(
+	monkeypatch: pytest.MonkeyPatch, isolated_ipfs_cache: ipfs.IpfsCache
 ) -> None:
-	"""Corrupted DB JSON should trigger process exit."""
+	"""A resolved CID should be cached and never fetched again, even for another sender."""
 
-	db_path = tmp_path / "mech_events.json"
-	db_path.write_text("{invalid", encoding="utf-8")
-	monkeypatch.setattr(mech_events, "MECH_EVENTS_JSON_PATH", db_path)
+	calls: list[str] = []
 
-	with pytest.raises(SystemExit):
-		mech_events._read_mech_events_data_from_file()
+	def _fake_get(url: str, timeout: int, **_kwargs: Any) -> _Response:  # noqa: ARG001
+		calls.append(url)
+		return _Response({"tool": "t", "prompt": "p"})
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+
+	first = mech_events.MechRequest(_make_subgraph_event("1"))
+	first._populate_ipfs_contents()
+	second_event = _make_subgraph_event("2")
+	second_event["sender"] = {"id": "0xdef"}
+	second = mech_events.MechRequest(second_event)
+	second._populate_ipfs_contents()
+
+	assert calls == [f"{mech_events.IPFS_ADDRESS}QmHash/metadata.json"]
+	assert isolated_ipfs_cache.get("QmHash") == {
+		"path": "metadata.json",
+		"contents": {"tool": "t", "prompt": "p"},
+	}
+	assert second.ipfs_contents == {"tool": "t", "prompt": "p"}
+	assert second.ipfs_link == f"{mech_events.IPFS_ADDRESS}QmHash/metadata.json"
 
 
-def test_write_mech_events_data_respects_delay_and_force_write(
-	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+def test_populate_ipfs_contents_cached_bare_cid_link(
+	monkeypatch: pytest.MonkeyPatch, isolated_ipfs_cache: ipfs.IpfsCache
 ) -> None:
-	"""Writes should be delayed unless force_write is enabled."""
+	"""Cached contents found at the bare CID should rebuild the bare link."""
 
-	db_path = tmp_path / "mech_events.json"
-	monkeypatch.setattr(mech_events, "MECH_EVENTS_JSON_PATH", db_path)
-	monkeypatch.setattr(mech_events, "last_write_time", 100.0)
-	monkeypatch.setattr(mech_events.time, "time", lambda: 110.0)
+	isolated_ipfs_cache.put("QmHash", {"path": "", "contents": {"ok": True}})
+	monkeypatch.setattr(
+		ipfs.requests,
+		"get",
+		lambda *_args, **_kwargs: pytest.fail("cached CID fetched again"),
+	)
 
-	mech_events._write_mech_events_data_to_file({"db_version": 3})
-	assert not db_path.exists()
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
+	event._populate_ipfs_contents()
 
-	mech_events._write_mech_events_data_to_file({"db_version": 3}, force_write=True)
-	assert db_path.exists()
+	assert event.ipfs_contents == {"ok": True}
+	assert event.ipfs_link == f"{mech_events.IPFS_ADDRESS}QmHash"
 
 
-def test_query_mech_events_subgraph_paginates(monkeypatch: pytest.MonkeyPatch) -> None:
-	"""Subgraph query should request all pages until an empty page."""
+def test_iter_mech_events_subgraph_pages_paginates(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Subgraph pages should be yielded one by one until an empty page."""
 
 	calls: list[dict[str, Any]] = []
 
-	class _FakeClient:
-		def execute(self, _query: Any, variable_values: dict[str, Any]) -> dict[str, Any]:
+	queries: list[Any] = []
+
+	class _FakeSession:
+		def execute(self, query: Any, variable_values: dict[str, Any]) -> dict[str, Any]:
+			queries.append(query)
 			calls.append(variable_values)
+			assert variable_values["senders"] == ["0xabc"]
 			if variable_values["id_gt"] == "":
 				return {"requests": [{"id": "1"}, {"id": "2"}]}
 			return {"requests": []}
 
-	monkeypatch.setattr(mech_events, "RequestsHTTPTransport", lambda *_args, **_kwargs: object())
-	monkeypatch.setattr(mech_events, "Client", lambda **_kwargs: _FakeClient())
-	monkeypatch.setattr(mech_events, "gql", lambda q: q)
+	monkeypatch.setattr(mech_events, "_get_mech_subgraph_session", _FakeSession)
 
-	result = mech_events._query_mech_events_subgraph("0xabc", mech_events.MechRequest)
+	pages = mech_events._iter_mech_events_subgraph_pages(["0xabc"], mech_events.MechRequest)
 
-	assert result == {"data": {"requests": [{"id": "1"}, {"id": "2"}]}}
+	assert next(pages) == [{"id": "1"}, {"id": "2"}]
+	assert len(calls) == 1
+	assert list(pages) == []
 	assert calls[0]["id_gt"] == ""
 	assert calls[1]["id_gt"] == "2"
+	assert calls[0]["block_number_gte"] == "0"
+
+	calls.clear()
+	list(mech_events._iter_mech_events_subgraph_pages(["0xabc"], mech_events.MechRequest, from_block=42))
+
+	assert [call["block_number_gte"] for call in calls] == ["42", "42"]
+	assert (calls[0]["block_timestamp_gte"], calls[0]["block_timestamp_lte"]) == ("0", str(mech_events.DEFAULT_TO_TIMESTAMP))
+
+	calls.clear()
+	list(mech_events._iter_mech_events_subgraph_pages(["0xabc"], mech_events.MechRequest, from_timestamp=10.5, to_timestamp=20.9))
+
+	assert (calls[0]["block_timestamp_gte"], calls[0]["block_timestamp_lte"]) == ("10", "20")
+	# The query document is parsed once and reused for every page and call.
+	assert all(query is queries[0] for query in queries)
+
+
+@pytest.fixture
+def subgraph_client(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> Any:
+	"""Record the subgraph clients built, with the schema cached in a temporary directory."""
+
+	clients: list[dict[str, Any]] = []
+
+	class _FakeClient:
+		def __init__(self, **kwargs: Any) -> None:
+			clients.append(kwargs)
+			self.introspection = kwargs["introspection"]
+
+		def connect_sync(self) -> str:
+			if self.introspection is None:
+				self.introspection = {"__schema": {"fetched": True}}
+			return f"session-{len(clients)}"
+
+	monkeypatch.setattr(mech_events, "MECH_SUBGRAPH_SCHEMA_PATH", tmp_path / "schema.json")
+	monkeypatch.setattr(mech_events, "RequestsHTTPTransport", lambda url: url)
+	monkeypatch.setattr(mech_events, "Client", _FakeClient)
+	mech_events._get_mech_subgraph_session.cache_clear()
+	yield clients
+	mech_events._get_mech_subgraph_session.cache_clear()
+
+
+def test_mech_subgraph_session_is_shared_and_caches_schema(subgraph_client: list[dict[str, Any]]) -> None:
+	"""The session should be built once, and the introspected schema saved to disk."""
+
+	assert mech_events._get_mech_subgraph_session() == "session-1"
+	assert mech_events._get_mech_subgraph_session() == "session-1"
+
+	assert subgraph_client == [
+		{
+			"transport": mech_events.MECH_SUBGRAPH_URL_TEMPLATE,
+			"introspection": None,
+			"fetch_schema_from_transport": True,
+		}
+	]
+	assert json.loads(mech_events.MECH_SUBGRAPH_SCHEMA_PATH.read_text(encoding="utf-8")) == {
+		"__schema": {"fetched": True}
+	}
+
+
+def test_mech_subgraph_session_uses_fresh_cached_schema(subgraph_client: list[dict[str, Any]]) -> None:
+	"""A cached schema within its TTL should spare the introspection query."""
+
+	mech_events.MECH_SUBGRAPH_SCHEMA_PATH.write_text(json.dumps({"__schema": {"cached": True}}), encoding="utf-8")
+
+	mech_events._get_mech_subgraph_session()
+
+	assert subgraph_client[0]["introspection"] == {"__schema": {"cached": True}}
+	assert subgraph_client[0]["fetch_schema_from_transport"] is False
+
+
+@pytest.mark.parametrize("cached_schema", ["expired", "corrupted"])
+def test_mech_subgraph_session_refetches_unusable_schema(
+	subgraph_client: list[dict[str, Any]], cached_schema: str
+) -> None:
+	"""Expired or corrupted cached schemas should be fetched again and replaced."""
+
+	schema_path = mech_events.MECH_SUBGRAPH_SCHEMA_PATH
+	if cached_schema == "expired":
+		schema_path.write_text(json.dumps({"__schema": {"cached": True}}), encoding="utf-8")
+		expired = time.time() - mech_events.MECH_SUBGRAPH_SCHEMA_TTL - 1
+		os.utime(schema_path, (expired, expired))
+	else:
+		schema_path.write_text("{", encoding="utf-8")
+
+	mech_events._get_mech_subgraph_session()
+
+	assert subgraph_client[0]["fetch_schema_from_transport"] is True
+	assert json.loads(schema_path.read_text(encoding="utf-8")) == {"__schema": {"fetched": True}}
+
+
+class _MemoryStore(mech_events_db.MechEventsStore):
+	"""In-memory store recording upserts and flushes."""
+
+	def __init__(self, events: dict[str, dict[str, Any]] | None = None) -> None:
+		self.events: dict[str, Any] = {}
+		for sender_event_name, sender_events in (events or {}).items():
+			self.events[sender_event_name] = dict(sender_events)
+		self.cursors: dict[str, int] = {}
+		self.flushes = 0
+		self.closed = False
+
+	def get_events(self, sender: str, event_name: str) -> dict[str, Any]:
+		return self.events.get(f"{sender}/{event_name}", {})
+
+	def get_events_in_range(
+		self, sender: str, event_name: str, from_timestamp: float, to_timestamp: float
+	) -> dict[str, Any]:
+		return {
+			event_id: event
+			for event_id, event in self.get_events(sender, event_name).items()
+			if from_timestamp <= int(event["block_timestamp"]) <= to_timestamp
+		}
+
+	def get_resolved_ids(self, sender: str, event_name: str, event_ids: Any) -> set[str]:
+		events = self.get_events(sender, event_name)
+		return {event_id for event_id in event_ids if mech_events_db.is_resolved_event(events.get(event_id, {}))}
+
+	def get_unresolved_events(self, sender: str, event_name: str) -> list[dict[str, Any]]:
+		return [event for event in self.get_events(sender, event_name).values() if not mech_events_db.is_resolved_event(event)]
+
+	def get_unresolved_fee_events(self, sender: str, event_name: str) -> list[dict[str, Any]]:
+		return [event for event in self.get_events(sender, event_name).values() if not event.get("fee_resolved")]
+
+	def upsert_event(self, sender: str, event_name: str, event_data: dict[str, Any]) -> None:
+		self.events.setdefault(f"{sender}/{event_name}", {})[event_data["event_id"]] = event_data
+
+	def get_cursor(self, sender: str, event_name: str) -> int | None:
+		return self.cursors.get(f"{sender}/{event_name}")
+
+	def set_cursor(self, sender: str, event_name: str, cursor: int) -> None:
+		self.cursors[f"{sender}/{event_name}"] = cursor
+
+	def flush(self) -> None:
+		self.flushes += 1
+
+	def close(self) -> None:
+		self.closed = True
 
 
 def test_update_mech_events_db_updates_missing_and_incomplete_events(
@@ -166,89 +393,396 @@ def test_update_mech_events_db_updates_missing_and_incomplete_events(
 	"""Only missing events or events without IPFS contents should be refreshed."""
 
 	sender = "0xabc"
-	db = {
-		"db_version": mech_events.MECH_EVENTS_DB_VERSION,
-		sender: {
-			"Request": {
-				"1": {"event_id": "1", "ipfs_contents": {"done": True}},
-				"2": {"event_id": "2", "ipfs_contents": {}},
-			}
-		},
-	}
-
-	query_result = {
-		"data": {
-			"requests": [
-				_make_subgraph_event("1"),
-				_make_subgraph_event("2"),
-				_make_subgraph_event("3"),
-			]
+	store = _MemoryStore({
+		f"{sender}/Request": {
+			"1": {"event_id": "1", "block_number": 1, "ipfs_contents": {"done": True}},
+			"2": {"event_id": "2", "block_number": 1, "ipfs_contents": {}},
 		}
-	}
+	})
 
-	writes: list[bool] = []
+	pages = [
+		[_make_subgraph_event("1"), _make_subgraph_event("2")],
+		[_make_subgraph_event("3", block_number=7)],
+	]
 
-	monkeypatch.setattr(mech_events, "_query_mech_events_subgraph", lambda *_args, **_kwargs: query_result)
-	monkeypatch.setattr(mech_events, "_read_mech_events_data_from_file", lambda: db)
-	monkeypatch.setattr(
-		mech_events,
-		"_write_mech_events_data_to_file",
-		lambda mech_events_data, force_write=False: writes.append(force_write),
-	)
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_args, **_kwargs: iter(pages))
 	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", lambda self: None)
 
-	mech_events._update_mech_events_db(sender, mech_events.MechRequest)
+	mech_events._update_mech_events_db([sender], mech_events.MechRequest, store)
 
-	stored = db[sender]["Request"]
+	stored = store.get_events(sender, "Request")
 	assert "3" in stored
 	assert stored["2"]["event_id"] == "2"
+	assert stored["2"]["transaction_hash"] == "0xtx2"
 	assert stored["1"]["ipfs_contents"] == {"done": True}
-	assert writes[-1] is True
+	assert store.cursors == {f"{sender}/Request": 7}
+	assert store.flushes == 1
+
+
+def test_update_mech_events_db_resumes_from_cursor(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Only events from the cursor onwards should be queried, and unresolved older ones retried."""
+
+	sender = "0xabc"
+	store = _MemoryStore({
+		f"{sender}/Request": {
+			"old": {"event_id": "old", "sender": sender, "ipfs_hash": "QmOld", "block_number": 9, "block_timestamp": 90, "ipfs_contents": {}},
+			"last": {"event_id": "last", "sender": sender, "ipfs_hash": "QmLast", "block_number": 10, "ipfs_contents": {}},
+			"done": {"event_id": "done", "block_number": 8, "ipfs_contents": {"done": True}},
+		}
+	})
+	store.cursors[f"{sender}/Request"] = 10
+	from_blocks: list[int] = []
+	resolved: list[str] = []
+
+	def _pages(_senders: list[str], _event_cls: Any, from_block: int = 0, **_kwargs: Any) -> Any:
+		from_blocks.append(from_block)
+		yield [_make_subgraph_event("new", block_number=12)]
+
+	def _populate(self: mech_events.MechBaseEvent) -> None:
+		resolved.append(self.event_id)
+		self.ipfs_contents = {"cid": self.cid}
+
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", _pages)
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", _populate)
 
+	mech_events._update_mech_events_db([sender], mech_events.MechRequest, store)
 
-def test_get_mech_events_updates_then_returns_sender_events(monkeypatch: pytest.MonkeyPatch) -> None:
-	"""_get_mech_events should update database and return sender event bucket."""
+	assert from_blocks == [10]
+	assert sorted(resolved) == ["new", "old"]
+	assert store.get_events(sender, "Request")["old"]["ipfs_contents"] == {"cid": "QmOld"}
+	assert store.cursors == {f"{sender}/Request": 12}
 
-	updated: list[tuple[str, type[mech_events.MechBaseEvent]]] = []
+	mech_events._update_mech_events_db([sender], mech_events.MechRequest, store, full_resync=True)
+
+	assert from_blocks == [10, 0]
+
+
+def test_update_mech_events_db_retries_older_events_page_by_page(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Unresolved events before the cursor should be retried in pages, and resolved ones checked per page."""
+
+	sender = "0xabc"
+	store = _MemoryStore({
+		f"{sender}/Request": {
+			str(i): {"event_id": str(i), "sender": sender, "ipfs_hash": f"Qm{i}", "block_number": i, "block_timestamp": i, "ipfs_contents": {}}
+			for i in range(5)
+		}
+	})
+	store.cursors[f"{sender}/Request"] = 10
+	batch_sizes: list[int] = []
+	looked_up: list[list[str]] = []
+	populate = mech_events._populate_ipfs_contents_concurrently
+
+	def _populate_concurrently(batches: Any, max_workers: int) -> Any:
+		return populate((batch_sizes.append(len(batch)) or batch for batch in batches), max_workers)
+
+	def _get_resolved_ids(sender: str, event_name: str, event_ids: list[str]) -> set[str]:
+		looked_up.append(event_ids)
+		return {"4"} & set(event_ids)
+
+	monkeypatch.setattr(mech_events, "QUERY_BATCH_SIZE", 2)
+	monkeypatch.setattr(mech_events, "_populate_ipfs_contents_concurrently", _populate_concurrently)
+	monkeypatch.setattr(store, "get_events", lambda *_args: pytest.fail("The whole history should not be loaded"))
+	monkeypatch.setattr(store, "get_unresolved_events", lambda *_args: list(store.events[f"{sender}/Request"].values()))
+	monkeypatch.setattr(store, "get_resolved_ids", _get_resolved_ids)
 	monkeypatch.setattr(
 		mech_events,
-		"_update_mech_events_db",
-		lambda sender, event_cls: updated.append((sender, event_cls)),
+		"_iter_mech_events_subgraph_pages",
+		lambda *_args, **_kwargs: iter([[_make_subgraph_event("4", 4), _make_subgraph_event("new", 12)]]),
 	)
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", lambda self: None)
+
+	mech_events._update_mech_events_db([sender], mech_events.MechRequest, store, from_timestamp=0, to_timestamp=3)
+
+	# Events 0 to 3 are within the window, in two pages; event 4 is already resolved.
+	assert batch_sizes == [2, 2, 1]
+	assert looked_up == [["4", "new"]]
+	assert set(store.events[f"{sender}/Request"]) == {"0", "1", "2", "3", "4", "new"}
+
+
+def test_update_mech_events_db_syncs_several_senders_in_one_pass(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Events of all the senders should be queried together and stored per sender."""
+
+	store = _MemoryStore({"0xABC/Request": {"a": {"event_id": "a", "block_number": 3, "ipfs_contents": {"ok": True}}}})
+	store.cursors["0xABC/Request"] = 3
+	store.cursors["0xdef/Request"] = 8
+	queries: list[tuple[list[str], int]] = []
+
+	def _event(event_id: str, sender: str, block_number: int) -> dict[str, Any]:
+		event = _make_subgraph_event(event_id, block_number=block_number)
+		event["sender"] = {"id": sender}
+		return event
+
+	def _pages(senders: list[str], _event_cls: Any, from_block: int = 0, **_kwargs: Any) -> Any:
+		queries.append((senders, from_block))
+		yield [_event("a", "0xabc", 3), _event("b", "0xabc", 5), _event("c", "0xdef", 9)]
+
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", _pages)
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", lambda self: None)
+
+	mech_events._update_mech_events_db(["0xABC", "0xdef", "0x123"], mech_events.MechRequest, store)
+
+	# A sender without a cursor needs its whole history.
+	assert queries == [(["0xABC", "0xdef", "0x123"], 0)]
+	assert set(store.get_events("0xABC", "Request")) == {"a", "b"}
+	assert store.get_events("0xABC", "Request")["a"] == {"event_id": "a", "block_number": 3, "ipfs_contents": {"ok": True}}
+	assert set(store.get_events("0xdef", "Request")) == {"c"}
+	assert store.cursors == {"0xABC/Request": 9, "0xdef/Request": 9, "0x123/Request": 9}
+
+
+def test_sync_mech_requests_updates_all_senders(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""sync_mech_requests should update the senders together in one store."""
+
+	store = _MemoryStore()
+	updated: list[tuple[Any, ...]] = []
+	monkeypatch.setattr(mech_events, "open_mech_events_store", lambda backend, read_only=False: store)
+	monkeypatch.setattr(mech_events, "_update_mech_events_db", lambda *args: updated.append(args))
+
+	mech_events.sync_mech_requests(["0xabc", "0xdef"], ipfs_max_workers=2, full_resync=True)
+
+	assert updated == [(["0xabc", "0xdef"], mech_events.MechRequest, store, 2, True, False, True)]
+	assert store.closed
+
+
+def test_update_mech_events_db_stores_compact_projections(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Compact syncs should store the tool and question instead of the IPFS payload."""
+
+	store = _MemoryStore({
+		"0xabc/Request": {"1": {"event_id": "1", "block_number": 1, "tool": "t", "question": "q"}},
+	})
+
+	def _populate(self: mech_events.MechBaseEvent) -> None:
+		if self.event_id == "2":
+			self.ipfs_contents = {"tool": "t", "prompt": '  Will "it\n  rain?" happen', "nonce": "x" * 100}
+
 	monkeypatch.setattr(
 		mech_events,
-		"_read_mech_events_data_from_file",
-		lambda: {"0xabc": {"Request": {"evt": {"event_id": "evt"}}}},
+		"_iter_mech_events_subgraph_pages",
+		lambda *_args, **_kwargs: iter([[_make_subgraph_event(str(i)) for i in range(1, 4)]]),
 	)
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", _populate)
+
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, store, compact=True)
+
+	stored = store.get_events("0xabc", "Request")
+	assert stored["1"] == {"event_id": "1", "block_number": 1, "tool": "t", "question": "q"}
+	assert "ipfs_contents" not in stored["2"]
+	assert (stored["2"]["tool"], stored["2"]["question"], stored["2"]["relevant"]) == ("t", "it rain?", True)
+	assert stored["2"]["fee"] == mech_events.DEFAULT_MECH_FEE
+	assert stored["2"]["block_timestamp"] == 100
+	# Unresolved events keep their empty contents, to be retried later.
+	assert stored["3"]["ipfs_contents"] == {}
+	assert "question" not in stored["3"]
+
 
-	result = mech_events._get_mech_events("0xabc", mech_events.MechRequest)
+def test_project_mech_event_data_drops_ipfs_contents() -> None:
+	"""Compact records should keep everything but the IPFS payload, and stay resolved."""
 
-	assert updated == [("0xabc", mech_events.MechRequest)]
-	assert result == {"evt": {"event_id": "evt"}}
+	record = mech_events_db.add_mech_request_keys({"event_id": "1", "ipfs_contents": {"prompt": 42}})
+	projected = mech_events._project_mech_event_data(record)
 
+	assert projected == {"event_id": "1", "tool": None, "question": None, "relevant": False}
+	assert mech_events_db.is_resolved_event(projected)
+	assert not mech_events_db.is_resolved_event({"event_id": "1", "ipfs_contents": {}})
 
-def test_get_mech_requests_filters_by_timestamp(monkeypatch: pytest.MonkeyPatch) -> None:
-	"""get_mech_requests should include events within inclusive bounds only."""
 
+def test_update_mech_events_db_keeps_cursor_without_new_events(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""An empty sync should leave the cursor untouched."""
+
+	store = _MemoryStore()
+	cursors: list[int] = []
+	monkeypatch.setattr(store, "set_cursor", lambda *args: cursors.append(args[-1]))
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_args, **_kwargs: iter([]))
+
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, store)
+
+	assert cursors == []
+
+
+def test_mech_event_from_dict_round_trips_records() -> None:
+	"""Events rebuilt from their database record should match the original event."""
+
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
+
+	rebuilt = mech_events.MechRequest.from_dict(dict(event.__dict__))
+
+	assert isinstance(rebuilt, mech_events.MechRequest)
+	assert rebuilt.__dict__ == event.__dict__
+	assert rebuilt.cid == "QmHash"
+
+
+def test_get_mech_requests_updates_then_filters_by_timestamp(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""get_mech_requests should sync the store and include events within inclusive bounds only."""
+
+	store = _MemoryStore({
+		"0xabc/Request": {
+			"a": {"event_id": "a", "block_timestamp": "9"},
+			"b": {"event_id": "b", "block_timestamp": "10"},
+			"c": {"event_id": "c", "block_timestamp": "20"},
+			"d": {"event_id": "d", "block_timestamp": "21"},
+		}
+	})
+	backends: list[Any] = []
+	updated: list[tuple[list[str], type[mech_events.MechBaseEvent], Any, int, bool, bool]] = []
+
+	def _open(backend: Any, read_only: bool = False) -> _MemoryStore:
+		backends.append((backend, read_only))
+		return store
+
+	monkeypatch.setattr(mech_events, "open_mech_events_store", _open)
 	monkeypatch.setattr(
 		mech_events,
-		"_get_mech_events",
-		lambda *_args, **_kwargs: {
-			"a": {"block_timestamp": "9"},
-			"b": {"block_timestamp": "10"},
-			"c": {"block_timestamp": "20"},
-			"d": {"block_timestamp": "21"},
-		},
+		"_update_mech_events_db",
+		lambda sender, event_cls, store, ipfs_max_workers, full_resync, compact, **_kwargs: updated.append(
+			(sender, event_cls, store, ipfs_max_workers, full_resync, compact)
+		),
 	)
 
-	result = mech_events.get_mech_requests("0xabc", from_timestamp=10, to_timestamp=20)
+	result = mech_events.get_mech_requests(
+		"0xabc",
+		from_timestamp=10,
+		to_timestamp=20,
+		ipfs_max_workers=4,
+		backend="sqlite",
+		full_resync=True,
+		compact=True,
+	)
 
+	assert backends == [("sqlite", False)]
+	assert updated == [(["0xabc"], mech_events.MechRequest, store, 4, True, True)]
+	assert store.closed
 	assert result == {
-		"b": {"block_timestamp": "10"},
-		"c": {"block_timestamp": "20"},
+		"b": {"event_id": "b", "block_timestamp": "10"},
+		"c": {"event_id": "c", "block_timestamp": "20"},
 	}
 
 
+def _abi_bytes(data: str) -> str:
+	"""ABI-encode the tail of a hex `bytes` argument: its length and padded data."""
+	return f"{len(data) // 2:064x}" + data + "0" * (-len(data) % 64)
+
+
+def _safe_exec_transaction_input(value: int, data: str = "") -> str:
+	"""Build the calldata of a Safe execTransaction call forwarding the given value and data."""
+	return mech_events.SAFE_EXEC_TRANSACTION_SELECTOR + "00" * 32 + f"{value:064x}" + f"{0x80:064x}" + f"{1:064x}" + _abi_bytes(data)
+
+
+def _multi_send_input(*transactions: tuple[int, int, str]) -> str:
+	"""Build the calldata of a MultiSend call of (operation, value, data) transactions."""
+	packed = "".join(
+		f"{operation:02x}" + "11" * 20 + f"{value:064x}" + f"{len(data) // 2:064x}" + data
+		for operation, value, data in transactions
+	)
+	return mech_events.MULTI_SEND_SELECTOR + f"{0x20:064x}" + _abi_bytes(packed)
+
+
+def test_update_mech_fees_batches_transactions(monkeypatch: pytest.MonkeyPatch, requests_mock: Any) -> None:
+	"""Fees should be read once from batched transactions and split between their requests."""
+
+	transactions = {
+		"0xA": {"value": hex(100), "input": "0x"},
+		"0xB": {"value": "0x0", "input": _safe_exec_transaction_input(30)},
+		"0xC": {"value": "0x0", "input": "0xdeadbeef"},
+		"0xD": None,
+		"0xF": {"value": "0x0", "input": _safe_exec_transaction_input(0, _multi_send_input((0, 25, "abcd"), (1, 99, ""), (0, 0, "")))},
+		"0xG": {"value": "0x0", "input": _safe_exec_transaction_input(0, _multi_send_input((0, 25, "abcd"))[:-64])},
+		"0xH": {"value": "0x0", "input": _safe_exec_transaction_input(0, _multi_send_input())},
+		"0xI": {"value": "0x0", "input": _safe_exec_transaction_input(0, mech_events.MULTI_SEND_SELECTOR + f"{0x20:064x}" + _abi_bytes("00" * 21))},
+		# Another payment batched with the Mech request cannot be told apart from its fee.
+		"0xJ": {"value": "0x0", "input": _safe_exec_transaction_input(0, _multi_send_input((0, 25, "abcd"), (0, 5, "")))},
+	}
+	batches: list[list[str]] = []
+
+	def _rpc(request: Any, _context: Any) -> list[dict[str, Any]]:
+		calls = request.json()
+		assert {call["method"] for call in calls} == {"eth_getTransactionByHash"}
+		batches.append([call["params"][0] for call in calls])
+		return [
+			{"jsonrpc": "2.0", "id": call["id"], "result": transactions[call["params"][0]]}
+			for call in reversed(calls)
+		]
+
+	requests_mock.post("http://rpc", json=_rpc)
+	monkeypatch.setattr(mech_events, "MECH_FEES_RPC_BATCH_SIZE", 2)
+
+	def _request(event_id: str, transaction_hash: str, **extra: Any) -> dict[str, Any]:
+		return {"event_id": event_id, "transaction_hash": transaction_hash, "fee": mech_events.DEFAULT_MECH_FEE, **extra}
+
+	store = _MemoryStore({
+		"0xabc/Request": {
+			"a1": _request("a1", "0xA"),
+			"a2": _request("a2", "0xA"),
+			"b": _request("b", "0xB"),
+			"c": _request("c", "0xC"),
+			"d": _request("d", "0xD"),
+			"e": _request("e", "0xE", fee=7, fee_resolved=True),
+			"f": _request("f", "0xF"),
+			"g": _request("g", "0xG"),
+			"h": _request("h", "0xH"),
+			"i": _request("i", "0xI"),
+			"j": _request("j", "0xJ"),
+		}
+	})
+
+	mech_events._update_mech_fees(["0xabc"], store, "http://rpc")
+
+	assert sorted(sorted(batch) for batch in batches) == [["0xA", "0xB"], ["0xC", "0xD"], ["0xF", "0xG"], ["0xH", "0xI"], ["0xJ"]]
+	stored = store.get_events("0xabc", "Request")
+	assert {
+		event_id: (event["fee"], event.get("fee_resolved"), event.get("fee_source")) for event_id, event in stored.items()
+	} == {
+		"a1": (50, True, "transaction"),
+		"a2": (50, True, "transaction"),
+		"b": (30, True, "transaction"),
+		"c": (mech_events.DEFAULT_MECH_FEE, True, "prepaid"),
+		"d": (mech_events.DEFAULT_MECH_FEE, True, "unknown"),
+		"e": (7, True, None),
+		"f": (25, True, "transaction"),
+		"g": (mech_events.DEFAULT_MECH_FEE, True, "unknown"),
+		"h": (mech_events.DEFAULT_MECH_FEE, True, "prepaid"),
+		"i": (mech_events.DEFAULT_MECH_FEE, True, "unknown"),
+		"j": (mech_events.DEFAULT_MECH_FEE, True, "unknown"),
+	}
+	assert store.flushes == 1
+
+	batches.clear()
+	mech_events._update_mech_fees(["0xabc"], store, "http://rpc")
+
+	# Every fetched transaction is final.
+	assert batches == []
+
+
+def test_update_mech_fees_reports_rpc_errors(requests_mock: Any, capsys: pytest.CaptureFixture[str]) -> None:
+	"""RPC errors should leave the fees unresolved, without interrupting the caller."""
+
+	requests_mock.post("http://rpc", json={"jsonrpc": "2.0", "error": {"message": "batch not supported"}})
+	store = _MemoryStore({"0xabc/Request": {"a": {"event_id": "a", "transaction_hash": "0xA", "fee": 1}}})
+
+	mech_events._update_mech_fees(["0xabc"], store, "http://rpc")
+
+	assert "WARNING: Could not fetch the fees of the Mech requests" in capsys.readouterr().out
+	assert store.get_events("0xabc", "Request")["a"] == {"event_id": "a", "transaction_hash": "0xA", "fee": 1}
+
+	mech_events._update_mech_fees(["0xdef"], store, "http://rpc")
+	assert requests_mock.call_count == 1
+
+
+def test_mech_requests_fees_are_resolved_with_an_rpc(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""The fees should only be resolved when an RPC is given."""
+
+	store = _MemoryStore()
+	fees: list[tuple[list[str], str]] = []
+	monkeypatch.setattr(mech_events, "open_mech_events_store", lambda backend, read_only=False: store)
+	monkeypatch.setattr(mech_events, "_update_mech_events_db", lambda *args, **kwargs: None)
+	monkeypatch.setattr(mech_events, "_update_mech_fees", lambda senders, _store, rpc: fees.append((senders, rpc)))
+
+	mech_events.get_mech_requests("0xabc")
+	mech_events.get_mech_requests("0xabc", rpc="http://rpc")
+	mech_events.sync_mech_requests(["0xabc", "0xdef"])
+	mech_events.sync_mech_requests(["0xabc", "0xdef"], rpc="http://rpc")
+
+	assert fees == [(["0xabc"], "http://rpc"), (["0xabc", "0xdef"], "http://rpc")]
+
+
 def test_populate_ipfs_contents_warns_when_no_hash(capsys: pytest.CaptureFixture[str]) -> None:
 	"""No hash values should print warning and keep empty fields."""
 
@@ -259,6 +793,7 @@ def test_populate_ipfs_contents_warns_when_no_hash(capsys: pytest.CaptureFixture
 		block_number=1,
 		block_timestamp=100,
 	)
+	event._populate_ipfs_contents()
 
 	output = capsys.readouterr().out
 	assert "WARNING: No IPFS hash found" in output
@@ -281,7 +816,7 @@ def test_populate_ipfs_contents_uses_ipfs_hash_bytes(monkeypatch: pytest.MonkeyP
 		called.append(url)
 		return _Response({"ok": True})
 
-	monkeypatch.setattr(mech_events.requests, "get", _fake_get)
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
 
 	event = mech_events.MechBaseEvent(
 		event_id="1",
@@ -291,14 +826,15 @@ def test_populate_ipfs_contents_uses_ipfs_hash_bytes(monkeypatch: pytest.MonkeyP
 		block_timestamp=100,
 		ipfs_hash_bytes="0x1234",
 	)
+	event._populate_ipfs_contents()
 
 	assert event.ipfs_hash_bytes == "1234"
 	assert called[0].endswith(f"{mech_events.CID_PREFIX}1234/metadata.json")
 	assert event.ipfs_contents == {"ok": True}
 
 
-def test_populate_ipfs_contents_handles_generic_exception(monkeypatch: pytest.MonkeyPatch) -> None:
-	"""Unexpected request errors should print traceback and continue."""
+def test_populate_ipfs_contents_reports_failures_without_prompting(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Unexpected request errors should be reported, never wait for user input."""
 
 	class _BadResponse:
 		def raise_for_status(self) -> None:
@@ -308,22 +844,17 @@ def test_populate_ipfs_contents_handles_generic_exception(monkeypatch: pytest.Mo
 			return {"unused": True}
 
 	printed: list[str] = []
-	inputs: list[str] = []
-	# Accept `timeout=` (and any other production-added kwarg). Without
-	# this, the production `requests.get(_url, timeout=30)` call would
-	# raise TypeError before `_BadResponse.raise_for_status` ever fires
-	# — the test would pass for the wrong reason (TypeError, not the
-	# RuntimeError that hits the broad except branch we want to cover).
-	monkeypatch.setattr(
-		mech_events.requests,
-		"get",
-		lambda _url, timeout=None, **_kw: _BadResponse(),
-	)
-	monkeypatch.setattr(mech_events.traceback, "format_exc", lambda: "traceback-text")
+	urls: list[str] = []
+
+	def _fake_get(url: str, timeout: int, **_kwargs: Any) -> _BadResponse:  # noqa: ARG001
+		urls.append(url)
+		return _BadResponse()
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
 	monkeypatch.setattr(builtins, "print", lambda *args, **kwargs: printed.append(" ".join(str(a) for a in args)))
-	monkeypatch.setattr(builtins, "input", lambda prompt: inputs.append(prompt) or "")
+	monkeypatch.setattr(builtins, "input", lambda prompt: pytest.fail("unexpected prompt"))
 
-	_DummyEvent(
+	event = _DummyEvent(
 		event_id="1",
 		sender="0xabc",
 		transaction_hash="0xtx",
@@ -331,9 +862,115 @@ def test_populate_ipfs_contents_handles_generic_exception(monkeypatch: pytest.Mo
 		block_timestamp=100,
 		ipfs_hash="QmHash",
 	)
+	event._populate_ipfs_contents()
+
+	assert sorted(urls) == sorted(
+		f"{gateway}QmHash{path}" for gateway in ipfs.IPFS_GATEWAYS for path in ["/metadata.json", ""]
+	)
+	assert len(printed) == 1
+	assert "WARNING: Could not fetch the IPFS contents of Mech event Dummy with ID 1" in printed[0]
+	assert "boom" in printed[0]
+	assert event.ipfs_contents == {}
+	# Gateway failures say nothing about the CID: nothing is cached.
+	assert ipfs.ipfs_cache.get("QmHash") is None
+
+
+def test_populate_ipfs_contents_remembers_missing_layouts(
+	monkeypatch: pytest.MonkeyPatch, isolated_ipfs_cache: ipfs.IpfsCache
+) -> None:
+	"""A path answered not to hold JSON should never be probed again for the CID."""
+
+	urls: list[str] = []
+	bare_cid_down = True
+
+	def _fake_get(url: str, timeout: int, **_kwargs: Any) -> _Response:  # noqa: ARG001
+		urls.append(url)
+		if url.endswith("/metadata.json"):
+			return _Response(json.JSONDecodeError("bad", "doc", 0))
+		if bare_cid_down:
+			raise ipfs.requests.ConnectionError("down")
+		return _Response({"ok": True})
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	monkeypatch.setattr(builtins, "print", lambda *args, **kwargs: None)
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
+
+	event._populate_ipfs_contents()
+
+	assert isolated_ipfs_cache.get("QmHash") == {"missing": ["metadata.json"]}
+	assert event.ipfs_contents == {}
+
+	urls.clear()
+	bare_cid_down = False
+	event._populate_ipfs_contents()
+
+	assert urls == [f"{mech_events.IPFS_ADDRESS}QmHash"]
+	assert event.ipfs_contents == {"ok": True}
+	assert isolated_ipfs_cache.get("QmHash") == {"path": "", "contents": {"ok": True}}
+
+
+def test_populate_ipfs_contents_negative_caches_unresolvable_cids(
+	monkeypatch: pytest.MonkeyPatch, isolated_ipfs_cache: ipfs.IpfsCache, capsys: pytest.CaptureFixture[str]
+) -> None:
+	"""A CID without JSON at any path should be probed once, and then never again."""
+
+	urls: list[str] = []
+
+	def _fake_get(url: str, timeout: int, **_kwargs: Any) -> _Response:  # noqa: ARG001
+		urls.append(url)
+		return _Response(json.JSONDecodeError("bad", "doc", 0))
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
+
+	event._populate_ipfs_contents()
+
+	assert "WARNING: Could not fetch the IPFS contents" in capsys.readouterr().out
+	assert isolated_ipfs_cache.get("QmHash") == {"missing": ["", "metadata.json"]}
+
+	urls.clear()
+	event._populate_ipfs_contents()
+
+	assert urls == []
+	assert capsys.readouterr().out == ""
+	assert event.ipfs_contents == {}
+
+
+def test_populate_ipfs_contents_does_not_cache_rate_limited_paths(
+	monkeypatch: pytest.MonkeyPatch,
+	isolated_ipfs_cache: ipfs.IpfsCache,
+	isolated_ipfs_gateways: ipfs.IpfsGateways,
+	capsys: pytest.CaptureFixture[str],
+) -> None:
+	"""Rate limited gateways say nothing about the CID: it should be fetched once they recover."""
+
+	urls: list[str] = []
+	rate_limited = True
 
-	assert any("traceback-text" in line for line in printed)
-	assert len(inputs) == 2
+	def _fake_get(url: str, timeout: int, **_kwargs: Any) -> Any:  # noqa: ARG001
+		urls.append(url)
+		response = ipfs.requests.Response()
+		response.status_code = 429 if rate_limited else 200
+		response._content = b'{"ok": true}'
+		response.url = url
+		return response
+
+	monkeypatch.setattr(ipfs.requests, "get", _fake_get)
+	event = mech_events.MechRequest(_make_subgraph_event("1"))
+
+	event._populate_ipfs_contents()
+
+	assert "WARNING: Could not fetch the IPFS contents" in capsys.readouterr().out
+	assert isolated_ipfs_cache.get("QmHash") is None
+	assert all(stats["errors"] == stats["requests"] for stats in isolated_ipfs_gateways.summary().values())
+
+	urls.clear()
+	rate_limited = False
+	event._populate_ipfs_contents()
+
+	assert urls == [f"{mech_events.IPFS_ADDRESS}QmHash/metadata.json"]
+	assert event.ipfs_contents == {"ok": True}
+	assert isolated_ipfs_cache.get("QmHash") == {"path": "metadata.json", "contents": {"ok": True}}
 
 
 def test_update_mech_events_db_handles_keyboard_interrupt(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -341,11 +978,11 @@ def test_update_mech_events_db_handles_keyboard_interrupt(monkeypatch: pytest.Mo
 
 	messages: list[str] = []
 	inputs: list[str] = []
-	monkeypatch.setattr(mech_events, "_query_mech_events_subgraph", lambda *_a, **_k: (_ for _ in ()).throw(KeyboardInterrupt()))
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_a, **_k: (_ for _ in ()).throw(KeyboardInterrupt()))
 	monkeypatch.setattr(builtins, "print", lambda *args, **kwargs: messages.append(" ".join(str(a) for a in args)))
 	monkeypatch.setattr(builtins, "input", lambda prompt: inputs.append(prompt) or "")
 
-	mech_events._update_mech_events_db("0xabc", mech_events.MechRequest)
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, _MemoryStore())
 
 	assert any("was cancelled" in msg for msg in messages)
 	assert inputs == ["Press Enter to continue..."]
@@ -356,13 +993,162 @@ def test_update_mech_events_db_handles_generic_exception(monkeypatch: pytest.Mon
 
 	messages: list[str] = []
 	inputs: list[str] = []
-	monkeypatch.setattr(mech_events, "_query_mech_events_subgraph", lambda *_a, **_k: (_ for _ in ()).throw(RuntimeError("boom")))
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_a, **_k: (_ for _ in ()).throw(RuntimeError("boom")))
 	monkeypatch.setattr(mech_events.traceback, "format_exc", lambda: "runtime-trace")
 	monkeypatch.setattr(builtins, "print", lambda *args, **kwargs: messages.append(" ".join(str(a) for a in args)))
 	monkeypatch.setattr(builtins, "input", lambda prompt: inputs.append(prompt) or "")
 
-	mech_events._update_mech_events_db("0xabc", mech_events.MechRequest)
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, _MemoryStore())
 
 	assert any("runtime-trace" in msg for msg in messages)
 	assert any("An error occurred while updating" in msg for msg in messages)
 	assert inputs == ["Press Enter to continue..."]
+
+
+def test_update_mech_events_db_non_interactive_never_prompts(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Non-interactive updates should report errors without prompting and raise cancellations."""
+
+	monkeypatch.setattr(builtins, "input", lambda prompt: pytest.fail("unexpected prompt"))
+	monkeypatch.setattr(mech_events.traceback, "format_exc", lambda: "runtime-trace")
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_a, **_k: (_ for _ in ()).throw(RuntimeError("boom")))
+
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, _MemoryStore(), interactive=False)
+
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", lambda *_a, **_k: (_ for _ in ()).throw(KeyboardInterrupt()))
+	with pytest.raises(KeyboardInterrupt):
+		mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, _MemoryStore(), interactive=False)
+
+
+def test_get_mech_requests_without_sync_reads_the_store(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""get_mech_requests should neither query the subgraph nor the RPC when sync is off."""
+
+	store = _MemoryStore({"0xabc/Request": {"a": {"event_id": "a", "block_timestamp": "10"}}})
+	monkeypatch.setattr(mech_events, "open_mech_events_store", lambda backend, read_only: read_only and store)
+	monkeypatch.setattr(mech_events, "_update_mech_events_db", lambda *_args: pytest.fail("unexpected sync"))
+	monkeypatch.setattr(mech_events, "_update_mech_fees", lambda *_args: pytest.fail("unexpected sync"))
+
+	result = mech_events.get_mech_requests("0xabc", rpc="http://rpc", sync=False)
+
+	assert result == {"a": {"event_id": "a", "block_timestamp": "10"}}
+
+
+def test_run_mech_sync_repeats_until_interrupted(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+	"""The sync loop should only fully resync once, sleep in between and stop on Ctrl+C."""
+
+	synced: list[tuple[Any, ...]] = []
+	sleeps: list[float] = []
+
+	def _sync(*args: Any, **kwargs: Any) -> None:
+		synced.append((*args, kwargs))
+		if len(synced) == 3:
+			raise KeyboardInterrupt
+
+	monkeypatch.setattr(mech_events, "sync_mech_requests", _sync)
+	monkeypatch.setattr(mech_events.time, "sleep", sleeps.append)
+
+	mech_events.run_mech_sync(["0xabc"], interval=7, backend="sqlite", full_resync=True, rpc="http://rpc")
+
+	assert [args[3] for args in synced] == [True, False, False]
+	assert all(args[-1] == {"interactive": False} for args in synced)
+	assert synced[0][:4] == (["0xabc"], mech_events.IPFS_FETCH_MAX_WORKERS, "sqlite", True)
+	assert sleeps == [7, 7]
+	assert "Mech events sync stopped." in capsys.readouterr().out
+
+
+def test_run_mech_sync_once(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> None:
+	"""A single update should return without sleeping, then emit the metrics."""
+
+	synced: list[Any] = []
+	monkeypatch.setattr(mech_events, "sync_mech_requests", lambda *args, **kwargs: synced.append(args))
+	monkeypatch.setattr(mech_events.time, "sleep", lambda _: pytest.fail("unexpected sleep"))
+
+	metrics_path = tmp_path / "mech_sync.prom"
+
+	mech_events.run_mech_sync(["0xabc"], once=True, metrics_path=metrics_path)
+
+	assert len(synced) == 1
+	assert "mech_sync_subgraph_pages_total" in metrics_path.read_text(encoding="utf-8")
+
+
+def test_mech_events_main_runs_the_sync(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Any, capsys: pytest.CaptureFixture[str]
+) -> None:
+	"""Running mech_events as a script should update the database once without prompting."""
+
+	import gql
+
+	class _UnreachableClient:
+		def __init__(self, **_kwargs: Any) -> None:
+			pass
+
+		def connect_sync(self) -> None:
+			raise ConnectionError("subgraph unreachable")
+
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", tmp_path / "mech_events.json")
+	monkeypatch.setattr(gql, "Client", _UnreachableClient)
+	monkeypatch.setattr(builtins, "input", lambda prompt: pytest.fail("unexpected prompt"))
+	monkeypatch.setattr(sys, "argv", ["mech_events.py", "--sender", "0x" + "a" * 40, "--once"])
+
+	runpy.run_module("scripts.predict_trader.mech_events", run_name="__main__")
+
+	output = capsys.readouterr().out
+	assert "Updating the local Mech events database" in output
+	assert "subgraph unreachable" in output
+	assert "An error occurred while updating" in output
+
+
+def test_mech_events_main_rejects_invalid_sender(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Invalid sender addresses should be rejected."""
+
+	monkeypatch.setattr(sys, "argv", ["mech_events.py", "--sender", "0x123"])
+
+	with pytest.raises(SystemExit):
+		mech_events._parse_args()
+
+
+def test_windowed_update_keeps_the_cursor(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""A window starting after the origin should only query and retry its events, leaving the cursor."""
+
+	store = _MemoryStore({
+		"0xabc/Request": {
+			"before": {"event_id": "before", "sender": "0xabc", "ipfs_hash": "Qm1", "block_number": 1, "block_timestamp": 5, "ipfs_contents": {}},
+			"inside": {"event_id": "inside", "sender": "0xabc", "ipfs_hash": "Qm2", "block_number": 2, "block_timestamp": 15, "ipfs_contents": {}},
+		}
+	})
+	store.cursors["0xabc/Request"] = 3
+	windows: list[tuple[float, float]] = []
+	resolved: list[str] = []
+
+	def _pages(_senders: list[str], _event_cls: Any, _from_block: int, from_timestamp: float, to_timestamp: float) -> Any:
+		windows.append((from_timestamp, to_timestamp))
+		yield [_make_subgraph_event("new", block_number=7)]
+
+	monkeypatch.setattr(mech_events, "_iter_mech_events_subgraph_pages", _pages)
+	monkeypatch.setattr(mech_events.MechBaseEvent, "_populate_ipfs_contents", lambda self: resolved.append(self.event_id))
+
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, store, from_timestamp=10, to_timestamp=200)
+
+	assert windows == [(10, 200)]
+	assert sorted(resolved) == ["inside", "new"]
+	assert store.cursors == {"0xabc/Request": 3}
+
+	mech_events._update_mech_events_db(["0xabc"], mech_events.MechRequest, store, to_timestamp=200)
+
+	assert store.cursors == {"0xabc/Request": 7}
+
+
+def test_get_mech_requests_pushes_the_window_down_when_windowed(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Only windowed calls should restrict the sync to the requested timestamps."""
+
+	windows: list[tuple[float, float]] = []
+	monkeypatch.setattr(mech_events, "open_mech_events_store", lambda backend, read_only=False: _MemoryStore())
+	monkeypatch.setattr(
+		mech_events,
+		"_update_mech_events_db",
+		lambda *_args, from_timestamp, to_timestamp: windows.append((from_timestamp, to_timestamp)),
+	)
+
+	mech_events.get_mech_requests("0xabc", 10, 20)
+	mech_events.get_mech_requests("0xabc", 10, 20, windowed=True)
+
+	assert windows == [(mech_events.DEFAULT_FROM_TIMESTAMP, mech_events.DEFAULT_TO_TIMESTAMP), (10, 20)]
@@ -0,0 +1,686 @@
+"""Unit tests for predict_trader.mech_events_db."""
+
+import argparse
+import json
+import multiprocessing
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from scripts.predict_trader import mech_events_db
+
+
+@pytest.fixture
+def db_paths(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> tuple[Path, Path]:
+	"""Point both database backends at temporary files."""
+	json_path = tmp_path / "mech_events.json"
+	sqlite_path = tmp_path / "mech_events.sqlite"
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", json_path)
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_SQLITE_PATH", sqlite_path)
+	return json_path, sqlite_path
+
+
+def _event(event_id: str, block_timestamp: int, **extra: Any) -> dict[str, Any]:
+	"""Create a stored event record."""
+	return {"event_id": event_id, "block_timestamp": block_timestamp, **extra}
+
+
+def test_read_mech_events_file_not_found_sets_default_version(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+	"""Missing DB file should initialize default DB structure."""
+
+	db_path = tmp_path / "mech_events.json"
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", db_path)
+
+	data = mech_events_db._read_mech_events_data_from_file()
+
+	assert data == {"db_version": mech_events_db.MECH_EVENTS_DB_VERSION}
+
+
+def test_read_mech_events_old_version_renames_and_resets(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+	"""Old DB version should be moved aside and recreated."""
+
+	db_path = tmp_path / "mech_events.json"
+	db_path.write_text(json.dumps({"db_version": 1}), encoding="utf-8")
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", db_path)
+	monkeypatch.setattr(mech_events_db.time, "strftime", lambda _: "2026-03-10_10-00-00")
+
+	data = mech_events_db._read_mech_events_data_from_file()
+
+	assert data == {"db_version": mech_events_db.MECH_EVENTS_DB_VERSION}
+	assert (tmp_path / "mech_events.2026-03-10_10-00-00.old.json").exists()
+
+
+def test_read_mech_events_old_version_archives_journals(
+	monkeypatch: pytest.MonkeyPatch, db_paths: tuple[Path, Path]
+) -> None:
+	"""Journals of an old DB version should be moved aside with the database."""
+
+	json_path, _ = db_paths
+	json_path.write_text(json.dumps({"db_version": 1}), encoding="utf-8")
+	json_path.with_name("mech_events.journal.4.jsonl").write_text(
+		json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event("a", 1)}) + "\n",
+		encoding="utf-8",
+	)
+	monkeypatch.setattr(mech_events_db.time, "strftime", lambda _: "2026-03-10_10-00-00")
+
+	data = mech_events_db._read_mech_events_data_from_file()
+
+	assert data == {"db_version": mech_events_db.MECH_EVENTS_DB_VERSION}
+	assert mech_events_db._journal_paths() == []
+	assert json_path.with_name("mech_events.2026-03-10_10-00-00.old.journal.4.jsonl").exists()
+
+
+def _add_field_migrations(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Pretend the current DB version is 5, with migrations from version 3."""
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_DB_VERSION", 5)
+	monkeypatch.setattr(
+		mech_events_db,
+		"MECH_EVENTS_DB_MIGRATIONS",
+		{
+			3: lambda event: {**event, "v4": True},
+			4: lambda event: {**event, "v5": event["v4"]},
+		},
+	)
+
+
+def test_read_mech_events_old_version_is_migrated_in_place(
+	monkeypatch: pytest.MonkeyPatch, db_paths: tuple[Path, Path], capsys: pytest.CaptureFixture[str]
+) -> None:
+	"""Old databases with a migration path should be upgraded, journals included, without any refetch."""
+
+	json_path, _ = db_paths
+	json_path.write_text(
+		json.dumps({"db_version": 3, "0xabc": {"Request": {"a": _event("a", 1)}}, "cursors": {"0xabc": {"Request": 9}}}),
+		encoding="utf-8",
+	)
+	json_path.with_name("mech_events.journal.2.jsonl").write_text(
+		json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event("b", 2)}) + "\n",
+		encoding="utf-8",
+	)
+	_add_field_migrations(monkeypatch)
+
+	data = mech_events_db._read_mech_events_data_from_file()
+
+	expected = {
+		"db_version": 5,
+		"0xabc": {
+			"Request": {
+				"a": _event("a", 1, v4=True, v5=True),
+				"b": _event("b", 2, v4=True, v5=True),
+			}
+		},
+		"cursors": {"0xabc": {"Request": 9}},
+	}
+	assert data == expected
+	assert "from version 3 to version 5" in capsys.readouterr().out
+	assert json.loads(json_path.read_text(encoding="utf-8")) == expected
+	assert mech_events_db._journal_paths() == []
+	assert not list(json_path.parent.glob("*.old.*"))
+
+
+def test_read_mech_events_migrates_without_journals(
+	monkeypatch: pytest.MonkeyPatch, db_paths: tuple[Path, Path]
+) -> None:
+	"""The upgraded database should be written back even if there were no journals."""
+
+	json_path, _ = db_paths
+	json_path.write_text(json.dumps({"db_version": 4, "0xabc": {"Request": {"a": _event("a", 1, v4=False)}}}), encoding="utf-8")
+	_add_field_migrations(monkeypatch)
+
+	mech_events_db._read_mech_events_data_from_file()
+
+	assert json.loads(json_path.read_text(encoding="utf-8"))["0xabc"]["Request"]["a"] == _event("a", 1, v4=False, v5=False)
+
+
+def test_sqlite_store_migrates_old_versions(monkeypatch: pytest.MonkeyPatch, db_paths: tuple[Path, Path]) -> None:
+	"""Rows of an old SQLite database should be migrated in place when possible, else reimported."""
+
+	json_path, sqlite_path = db_paths
+	with mech_events_db.SqliteMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", _event("a", 1))
+		store.set_cursor("0xabc", "Request", 3)
+	connection = sqlite3.connect(sqlite_path)
+	connection.execute("PRAGMA user_version=3")
+	connection.commit()
+	connection.close()
+	_add_field_migrations(monkeypatch)
+
+	with mech_events_db.SqliteMechEventsStore() as store:
+		assert store.get_events("0xabc", "Request") == {"a": _event("a", 1, v4=True, v5=True)}
+		assert store.get_cursor("0xabc", "Request") == 3
+
+	connection = sqlite3.connect(sqlite_path)
+	assert connection.execute("PRAGMA user_version").fetchone() == (5,)
+	connection.execute("PRAGMA user_version=2")
+	connection.commit()
+	connection.close()
+	json_path.write_text(json.dumps({"db_version": 5, "0xdef": {"Request": {"j": _event("j", 1)}}}), encoding="utf-8")
+
+	with mech_events_db.SqliteMechEventsStore() as store:
+		assert store.get_events("0xabc", "Request") == {}
+		assert store.get_cursor("0xabc", "Request") is None
+		assert store.get_events("0xdef", "Request") == {"j": _event("j", 1)}
+
+
+def test_read_mech_events_corrupted_json_exits(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+	"""Corrupted DB JSON should trigger process exit."""
+
+	db_path = tmp_path / "mech_events.json"
+	db_path.write_text("{invalid", encoding="utf-8")
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", db_path)
+
+	with pytest.raises(SystemExit):
+		mech_events_db._read_mech_events_data_from_file()
+
+
+def test_write_mech_events_data_replaces_file_atomically(db_paths: tuple[Path, Path]) -> None:
+	"""Writes should go through a temporary file renamed over the database."""
+
+	json_path, _ = db_paths
+	json_path.write_text("{}", encoding="utf-8")
+
+	mech_events_db._write_mech_events_data_to_file({"db_version": 3, "0xabc": {}})
+
+	assert json.loads(json_path.read_text(encoding="utf-8")) == {"db_version": 3, "0xabc": {}}
+	assert [p.name for p in json_path.parent.iterdir()] == ["mech_events.json"]
+
+
+def test_json_store_upserts_and_filters_by_timestamp(db_paths: tuple[Path, Path]) -> None:
+	"""The JSON store should keep events per sender and event name."""
+
+	json_path, _ = db_paths
+	with mech_events_db.JsonMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", _event("a", 9))
+		store.upsert_event("0xabc", "Request", _event("b", 10))
+		store.upsert_event("0xabc", "Request", _event("c", 20))
+		store.upsert_event("0xabc", "Request", _event("d", 21))
+		store.upsert_event("0xdef", "Request", _event("e", 15))
+
+		assert set(store.get_events("0xabc", "Request")) == {"a", "b", "c", "d"}
+		assert store.get_events("0xabc", "Deliver") == {}
+		assert store.get_events_in_range("0xabc", "Request", 10, 20) == {
+			"b": _event("b", 10),
+			"c": _event("c", 20),
+		}
+
+	data = mech_events_db._read_mech_events_data_from_file()
+	assert data["db_version"] == mech_events_db.MECH_EVENTS_DB_VERSION
+	assert set(data["0xabc"]["Request"]) == {"a", "b", "c", "d"}
+	assert data["0xdef"]["Request"]["e"] == _event("e", 15)
+
+
+def test_json_store_range_queries_reflect_upserts(db_paths: tuple[Path, Path]) -> None:
+	"""Range queries should reflect upserts made after an earlier query."""
+
+	with mech_events_db.JsonMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", _event("c", 20))
+		store.upsert_event("0xabc", "Request", _event("a", "9"))
+		assert len(store.get_events_in_range("0xabc", "Request", 0, 100)) == 2
+
+		store.upsert_event("0xabc", "Request", _event("b", 10))
+		store.upsert_event("0xabc", "Request", _event("d", 10))
+		store.upsert_event("0xabc", "Request", _event("c", 5))
+		store.upsert_event("0xabc", "Request", _event("d", 10, ipfs_contents={"x": 1}))
+
+		assert set(store.get_events_in_range("0xabc", "Request", 0, 100)) == {"a", "b", "c", "d"}
+		assert store.get_events_in_range("0xabc", "Request", 0, 5) == {"c": _event("c", 5)}
+		assert store.get_events_in_range("0xabc", "Request", 9.5, 10) == {
+			"b": _event("b", 10),
+			"d": _event("d", 10, ipfs_contents={"x": 1}),
+		}
+		assert store.get_events_in_range("0xabc", "Request", 11, 100) == {}
+		assert store.get_events_in_range("0xabc", "Deliver", 0, 100) == {}
+
+
+def test_json_store_appends_changes_to_journal(db_paths: tuple[Path, Path]) -> None:
+	"""Upserts should only append a record to the journal, never rewrite the database."""
+
+	json_path, _ = db_paths
+	store = mech_events_db.JsonMechEventsStore()
+	store.upsert_event("0xabc", "Request", _event("a", 1))
+	store.upsert_event("0xabc", "Request", _event("a", 1, ipfs_contents={"x": 1}))
+
+	journal = json_path.with_name("mech_events.journal.0.jsonl")
+	records = [json.loads(line) for line in journal.read_text(encoding="utf-8").splitlines()]
+	assert records == [
+		{"sender": "0xabc", "event_name": "Request", "event": _event("a", 1)},
+		{"sender": "0xabc", "event_name": "Request", "event": _event("a", 1, ipfs_contents={"x": 1})},
+	]
+	assert not json_path.exists()
+
+	# A killed process never reaches close(): the journal alone must suffice.
+	reader = mech_events_db.JsonMechEventsStore(read_only=True)
+	assert reader.get_events("0xabc", "Request") == {"a": _event("a", 1, ipfs_contents={"x": 1})}
+	reader.close()
+	store.close()
+
+	reopened = mech_events_db.JsonMechEventsStore()
+	reopened.upsert_event("0xabc", "Request", _event("b", 2))
+	reopened.close()
+
+	assert json_path.with_name("mech_events.journal.1.jsonl").exists()
+
+
+def test_journal_replay_skips_torn_records(db_paths: tuple[Path, Path]) -> None:
+	"""A partially written last record should be ignored on replay."""
+
+	json_path, _ = db_paths
+	json_path.with_name("mech_events.journal.0.jsonl").write_text(
+		json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event("a", 1)})
+		+ '\n{"sender": "0xabc", "event_na',
+		encoding="utf-8",
+	)
+	json_path.with_name("mech_events.journal.x.jsonl").write_text("ignored", encoding="utf-8")
+
+	data = mech_events_db._read_mech_events_data_from_file()
+
+	assert data == {
+		"db_version": mech_events_db.MECH_EVENTS_DB_VERSION,
+		"0xabc": {"Request": {"a": _event("a", 1)}},
+	}
+
+
+def test_json_store_compacts_journals_in_background(
+	db_paths: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch
+) -> None:
+	"""Passing the journal size threshold should fold the journals into the database."""
+
+	json_path, _ = db_paths
+	record_size = len(json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event("a", 1)})) + 1
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JOURNAL_COMPACTION_BYTES", 2 * record_size)
+
+	with mech_events_db.JsonMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", _event("a", 1))
+		store.upsert_event("0xabc", "Request", _event("b", 1))
+		store.upsert_event("0xabc", "Request", _event("c", 1))
+
+	base = json.loads(json_path.read_text(encoding="utf-8"))
+	assert set(base["0xabc"]["Request"]) == {"a", "b"}
+	assert [path.name for _, path in mech_events_db._journal_paths()] == ["mech_events.journal.1.jsonl"]
+	with mech_events_db.JsonMechEventsStore(read_only=True) as store:
+		assert set(store.get_events("0xabc", "Request")) == {"a", "b", "c"}
+
+
+def test_json_store_compacts_large_journals_on_open(
+	db_paths: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch
+) -> None:
+	"""Journals left over by previous runs should be compacted once they are too large."""
+
+	json_path, _ = db_paths
+	for generation in range(2):
+		json_path.with_name(f"mech_events.journal.{generation}.jsonl").write_text(
+			json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event(str(generation), 1)}) + "\n",
+			encoding="utf-8",
+		)
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JOURNAL_COMPACTION_BYTES", 10)
+
+	mech_events_db.JsonMechEventsStore().close()
+
+	assert mech_events_db._journal_paths() == []
+	assert set(json.loads(json_path.read_text(encoding="utf-8"))["0xabc"]["Request"]) == {"0", "1"}
+
+
+def test_json_store_runs_a_single_compaction_at_a_time(
+	db_paths: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch
+) -> None:
+	"""A compaction should not start while another one is still running."""
+
+	release = threading.Event()
+	compactions: list[int] = []
+
+	def _slow_compaction(_data: dict[str, Any], last_generation: int) -> None:
+		compactions.append(last_generation)
+		release.wait(5)
+
+	monkeypatch.setattr(mech_events_db, "_compact_mech_events_data", _slow_compaction)
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JOURNAL_COMPACTION_BYTES", 1)
+
+	store = mech_events_db.JsonMechEventsStore()
+	store.upsert_event("0xabc", "Request", _event("a", 1))
+	store.upsert_event("0xabc", "Request", _event("b", 1))
+	release.set()
+	store.close()
+
+	assert compactions == [0]
+
+
+def test_snapshot_shares_records_but_not_containers() -> None:
+	"""Snapshots should be safe to serialize while the database keeps changing."""
+
+	record = _event("a", 1)
+	data = {"db_version": 3, "0xabc": {"Request": {"a": record}}}
+
+	snapshot = mech_events_db._snapshot_mech_events_data(data)
+	data["0xabc"]["Request"]["b"] = _event("b", 2)
+
+	assert snapshot == {"db_version": 3, "0xabc": {"Request": {"a": record}}}
+	assert snapshot["0xabc"]["Request"]["a"] is record
+
+
+def test_sqlite_store_upserts_and_filters_by_timestamp(db_paths: tuple[Path, Path]) -> None:
+	"""The SQLite store should replace events by ID and answer range queries."""
+
+	_, sqlite_path = db_paths
+	with mech_events_db.SqliteMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", _event("a", 9))
+		store.upsert_event("0xabc", "Request", _event("b", 10, ipfs_contents={}))
+		store.upsert_event("0xabc", "Request", _event("b", 10, ipfs_contents={"x": 1}))
+		store.upsert_event("0xabc", "Request", _event("c", 20))
+		store.upsert_event("0xdef", "Request", _event("e", 15))
+
+		assert set(store.get_events("0xabc", "Request")) == {"a", "b", "c"}
+		assert list(store.get_events_in_range("0xabc", "Request", 10, 20).values()) == [
+			_event("b", 10, ipfs_contents={"x": 1}),
+			_event("c", 20),
+		]
+		assert store.get_events_in_range("0xabc", "Request", 21, 30) == {}
+
+	with mech_events_db.SqliteMechEventsStore(sqlite_path) as store:
+		assert set(store.get_events("0xdef", "Request")) == {"e"}
+
+
+def test_sqlite_store_range_queries_use_the_timestamp_index(db_paths: tuple[Path, Path]) -> None:
+	"""Range queries should be answered through the (sender, event, timestamp) index."""
+
+	_, sqlite_path = db_paths
+	mech_events_db.SqliteMechEventsStore().close()
+
+	connection = sqlite3.connect(sqlite_path)
+	plan = connection.execute(
+		"EXPLAIN QUERY PLAN SELECT event_id, data FROM mech_events "
+		"WHERE sender = ? AND event_name = ? AND block_timestamp BETWEEN ? AND ?",
+		("0xabc", "Request", 0, 1),
+	).fetchall()
+	connection.close()
+
+	assert "mech_events_by_timestamp" in str(plan)
+
+
+def test_sqlite_store_imports_json_database_once(db_paths: tuple[Path, Path]) -> None:
+	"""A new SQLite database should be seeded from the JSON database only once."""
+
+	json_path, sqlite_path = db_paths
+	json_path.write_text(
+		json.dumps({
+			"db_version": mech_events_db.MECH_EVENTS_DB_VERSION,
+			"0xabc": {"Request": {"a": _event("a", "5"), "b": _event("b", 6)}},
+			"cursors": {"0xabc": {"Request": 42}},
+		}),
+		encoding="utf-8",
+	)
+
+	json_path.with_name("mech_events.journal.0.jsonl").write_text(
+		json.dumps({"sender": "0xabc", "event_name": "Request", "event": _event("j", 8)}) + "\n",
+		encoding="utf-8",
+	)
+
+	with mech_events_db.SqliteMechEventsStore() as store:
+		assert store.get_events("0xabc", "Request") == {
+			"a": _event("a", "5"),
+			"b": _event("b", 6),
+			"j": _event("j", 8),
+		}
+		assert store.get_cursor("0xabc", "Request") == 42
+
+	json_path.write_text(
+		json.dumps({
+			"db_version": mech_events_db.MECH_EVENTS_DB_VERSION,
+			"0xabc": {"Request": {"c": _event("c", 7)}},
+		}),
+		encoding="utf-8",
+	)
+
+	with mech_events_db.SqliteMechEventsStore() as store:
+		assert set(store.get_events("0xabc", "Request")) == {"a", "b", "j"}
+
+	connection = sqlite3.connect(sqlite_path)
+	assert connection.execute("PRAGMA user_version").fetchone() == (mech_events_db.MECH_EVENTS_DB_VERSION,)
+	connection.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_store_persists_sync_cursors(db_paths: tuple[Path, Path], backend: str) -> None:
+	"""Sync cursors should be kept per sender and event, separately from the events."""
+
+	with mech_events_db.open_mech_events_store(backend) as store:
+		assert store.get_cursor("0xabc", "Request") is None
+		store.upsert_event("0xabc", "Request", _event("a", 1))
+		store.set_cursor("0xabc", "Request", 10)
+		store.set_cursor("0xabc", "Request", 12)
+		store.set_cursor("0xdef", "Request", 5)
+
+	with mech_events_db.open_mech_events_store(backend) as store:
+		assert store.get_cursor("0xabc", "Request") == 12
+		assert store.get_cursor("0xdef", "Request") == 5
+		assert store.get_cursor("0xabc", "Deliver") is None
+		assert store.get_events("0xabc", "Request") == {"a": _event("a", 1)}
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_store_tells_resolved_events_apart(db_paths: tuple[Path, Path], backend: str) -> None:
+	"""Resolved events should be looked up by ID, and unresolved ones listed, without loading the others."""
+
+	with mech_events_db.open_mech_events_store(backend) as store:
+		store.upsert_event("0xabc", "Request", _event("a", 1, ipfs_contents={"x": 1}))
+		store.upsert_event("0xabc", "Request", _event("b", 2, tool="t", question=None))
+		store.upsert_event("0xabc", "Request", _event("c", 3, ipfs_contents={}))
+		store.upsert_event("0xabc", "Request", _event("d", 4))
+		store.upsert_event("0xdef", "Request", _event("e", 5, ipfs_contents={"x": 1}))
+
+		assert store.get_resolved_ids("0xabc", "Request", ["a", "b", "c", "d", "e", "z"]) == {"a", "b"}
+		assert store.get_resolved_ids("0xabc", "Request", []) == set()
+		assert sorted(event["event_id"] for event in store.get_unresolved_events("0xabc", "Request")) == ["c", "d"]
+		assert store.get_unresolved_events("0xdef", "Request") == []
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_store_lists_events_with_unresolved_fees(db_paths: tuple[Path, Path], backend: str) -> None:
+	"""Only the events whose fee is not resolved should be listed."""
+
+	with mech_events_db.open_mech_events_store(backend) as store:
+		store.upsert_event("0xabc", "Request", _event("a", 1, fee_resolved=True, fee_source="prepaid"))
+		store.upsert_event("0xabc", "Request", _event("b", 2, fee_resolved=False))
+		store.upsert_event("0xabc", "Request", _event("c", 3, ipfs_contents={"x": 1}))
+		store.upsert_event("0xdef", "Request", _event("d", 4))
+
+		assert sorted(event["event_id"] for event in store.get_unresolved_fee_events("0xabc", "Request")) == ["b", "c"]
+		assert store.get_unresolved_fee_events("0xabc", "Deliver") == []
+
+
+def test_sqlite_store_lists_unresolved_events_through_their_index(db_paths: tuple[Path, Path]) -> None:
+	"""Events with unresolved contents or fees should be listed through partial indexes, without scanning the others."""
+
+	_, sqlite_path = db_paths
+	mech_events_db.SqliteMechEventsStore().close()
+
+	connection = sqlite3.connect(sqlite_path)
+	plan = connection.execute(
+		"EXPLAIN QUERY PLAN SELECT data FROM mech_events "
+		f"WHERE sender = ? AND event_name = ? AND {mech_events_db._SQLITE_UNRESOLVED}",
+		("0xabc", "Request"),
+	).fetchall()
+	connection.close()
+
+	assert "mech_events_unresolved" in str(plan)
+
+	connection = sqlite3.connect(sqlite_path)
+	plan = connection.execute(
+		"EXPLAIN QUERY PLAN SELECT data FROM mech_events "
+		f"WHERE sender = ? AND event_name = ? AND {mech_events_db._SQLITE_FEE_UNRESOLVED}",
+		("0xabc", "Request"),
+	).fetchall()
+	connection.close()
+
+	assert "mech_events_fee_unresolved" in str(plan)
+
+
+def test_iter_mech_events_data_skips_metadata() -> None:
+	"""The DB version and the sync cursors are not events."""
+
+	data = {
+		"db_version": 3,
+		"cursors": {"0xabc": {"Request": 1}},
+		"0xabc": {"Request": {"a": _event("a", 1)}},
+	}
+
+	assert list(mech_events_db._iter_mech_events_data(data)) == [("0xabc", "Request", _event("a", 1))]
+
+
+def test_open_mech_events_store_selects_backend(db_paths: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch) -> None:
+	"""The default backend should be used unless another one is requested."""
+
+	with mech_events_db.open_mech_events_store() as store:
+		assert isinstance(store, mech_events_db.JsonMechEventsStore)
+
+	with mech_events_db.open_mech_events_store("sqlite") as store:
+		assert isinstance(store, mech_events_db.SqliteMechEventsStore)
+
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_DB_BACKEND", "sqlite")
+	with mech_events_db.open_mech_events_store() as store:
+		assert isinstance(store, mech_events_db.SqliteMechEventsStore)
+
+	with pytest.raises(ValueError, match="Unknown Mech events database backend"):
+		mech_events_db.open_mech_events_store("parquet")
+
+
+def _upsert_events_in_process(prefix: str, count: int) -> None:
+	"""Upsert events from a separate process."""
+	with mech_events_db.JsonMechEventsStore() as store:
+		for i in range(count):
+			store.upsert_event("0xabc", "Request", _event(f"{prefix}{i}", i))
+
+
+def test_add_mech_db_arguments_shares_the_flags_of_the_scripts() -> None:
+	"""The database flags should be parsed alike by every script, with --no-mech-sync optional."""
+
+	parser = argparse.ArgumentParser()
+	mech_events_db.add_mech_db_arguments(parser)
+	args = parser.parse_args(["--mech-db-backend", "sqlite", "--full-resync", "--no-mech-sync", "--sync-metrics-file", "m.prom"])
+
+	assert (args.mech_db_backend, args.full_resync, args.compact_mech_db, args.no_mech_sync) == ("sqlite", True, False, True)
+	assert (args.sync_metrics, args.sync_metrics_file) == (False, Path("m.prom"))
+	assert parser.parse_args([]).mech_db_backend == mech_events_db.MECH_EVENTS_DB_BACKEND
+
+	parser = argparse.ArgumentParser()
+	mech_events_db.add_mech_db_arguments(parser, mech_sync=False)
+	assert not hasattr(parser.parse_args([]), "no_mech_sync")
+
+
+def test_json_store_is_safe_across_processes(db_paths: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Concurrent writer processes and compactions should never lose events."""
+
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JOURNAL_COMPACTION_BYTES", 500)
+	context = multiprocessing.get_context("fork")
+	processes = [context.Process(target=_upsert_events_in_process, args=(prefix, 50)) for prefix in "ab"]
+	for process in processes:
+		process.start()
+	for process in processes:
+		process.join(30)
+
+	assert [process.exitcode for process in processes] == [0, 0]
+	with mech_events_db.JsonMechEventsStore(read_only=True) as store:
+		assert len(store.get_events("0xabc", "Request")) == 100
+
+
+def test_writer_waits_for_the_writer_lock(db_paths: tuple[Path, Path], capsys: pytest.CaptureFixture[str]) -> None:
+	"""A second writer should wait, while readers are never blocked by writers."""
+
+	opened = threading.Event()
+
+	def _open_writer() -> None:
+		with mech_events_db.JsonMechEventsStore():
+			opened.set()
+
+	with mech_events_db._mech_events_lock("writer"):
+		writer = threading.Thread(target=_open_writer)
+		writer.start()
+		assert not opened.wait(0.5)
+		with mech_events_db.JsonMechEventsStore(read_only=True):
+			pass
+	writer.join(5)
+
+	assert opened.is_set()
+	assert "Waiting for another process" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_read_only_store_rejects_changes(db_paths: tuple[Path, Path], backend: str) -> None:
+	"""Read-only stores should refuse to change the database."""
+
+	with mech_events_db.open_mech_events_store(backend, read_only=True) as store:
+		with pytest.raises((PermissionError, sqlite3.OperationalError)):
+			store.upsert_event("0xabc", "Request", _event("a", 1))
+
+
+def test_upgrade_skips_databases_upgraded_by_another_process(db_paths: tuple[Path, Path]) -> None:
+	"""A database upgraded while waiting for the lock should be read as is."""
+
+	json_path, _ = db_paths
+	mech_events_db._write_mech_events_data_to_file(
+		{"db_version": mech_events_db.MECH_EVENTS_DB_VERSION, "0xabc": {"Request": {"a": _event("a", 1)}}}
+	)
+
+	data = mech_events_db._upgrade_mech_events_data()
+
+	assert data["0xabc"] == {"Request": {"a": _event("a", 1)}}
+	assert json_path.exists()
+
+
+def test_normalize_mech_question() -> None:
+	"""The quoted question should be extracted, with whitespace collapsed."""
+
+	assert mech_events_db.normalize_mech_question('Ask "What\n  is this?" please') == "What is this?"
+	assert mech_events_db.normalize_mech_question("  Simple\t prompt \n") == "Simple prompt"
+
+
+def test_add_mech_request_keys() -> None:
+	"""Resolved records should get their tool, question and relevance, once."""
+
+	irrelevant_tool = next(iter(mech_events_db.IRRELEVANT_TOOLS))
+
+	assert mech_events_db.add_mech_request_keys(
+		{"event_id": "1", "ipfs_contents": {"tool": "t", "prompt": 'Ask "What is this?"'}}
+	) == {
+		"event_id": "1",
+		"ipfs_contents": {"tool": "t", "prompt": 'Ask "What is this?"'},
+		"tool": "t",
+		"question": "What is this?",
+		"relevant": True,
+	}
+	assert mech_events_db.add_mech_request_keys({"ipfs_contents": {"tool": irrelevant_tool, "prompt": "q"}})["relevant"] is False
+	assert mech_events_db.add_mech_request_keys({"ipfs_contents": {"prompt": 42}})["question"] is None
+	assert mech_events_db.add_mech_request_keys({"ipfs_contents": ["not", "a", "dict"]})["relevant"] is False
+	# Compact records of previous versions only lack the relevance flag.
+	assert mech_events_db.add_mech_request_keys({"tool": "t", "question": None}) == {
+		"tool": "t",
+		"question": None,
+		"relevant": False,
+	}
+	assert mech_events_db.add_mech_request_keys({"event_id": "1", "ipfs_contents": {}}) == {
+		"event_id": "1",
+		"ipfs_contents": {},
+	}
+
+
+def test_version_3_databases_get_the_statistics_keys(db_paths: tuple[Path, Path]) -> None:
+	"""Version 3 databases should be upgraded with the precomputed statistics keys."""
+
+	json_path, _ = db_paths
+	json_path.write_text(
+		json.dumps({"db_version": 3, "0xabc": {"Request": {"a": _event("a", 1, ipfs_contents={"tool": "t", "prompt": "q"})}}}),
+		encoding="utf-8",
+	)
+
+	with mech_events_db.JsonMechEventsStore(read_only=True) as store:
+		event = store.get_events("0xabc", "Request")["a"]
+
+	assert (event["tool"], event["question"], event["relevant"]) == ("t", "q", True)
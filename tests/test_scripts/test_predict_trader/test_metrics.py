@@ -0,0 +1,128 @@
+"""Unit tests for predict_trader.metrics."""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from scripts.predict_trader import ipfs, mech_events, mech_events_db, metrics
+
+
+@pytest.fixture
+def sync_metrics(monkeypatch: pytest.MonkeyPatch) -> metrics.SyncMetrics:
+	"""Record the metrics of each test from scratch."""
+	fresh = metrics.SyncMetrics()
+	monkeypatch.setattr(metrics, "sync_metrics", fresh)
+	return fresh
+
+
+def test_summary_derives_rates() -> None:
+	"""The JSON summary should include the rates derived from the counters."""
+
+	sync_metrics = metrics.SyncMetrics()
+	sync_metrics.record_subgraph_page(rows=1000, seconds=0.5)
+	sync_metrics.record_subgraph_page(rows=0, seconds=0.5)
+	sync_metrics.record_ipfs_cache(hit=True)
+	sync_metrics.record_ipfs_cache(hit=True)
+	sync_metrics.record_ipfs_cache(hit=False)
+	sync_metrics.record_ipfs_request("https://gw/", 0.2, ok=True)
+	sync_metrics.record_ipfs_request("https://gw/", 40, ok=False)
+	sync_metrics.record_db_write(100, 0.01)
+
+	summary = sync_metrics.summary()
+
+	assert summary["subgraph"] == {"pages": 2, "rows": 1000, "seconds": 1.0, "pages_per_second": 2.0, "rows_per_page": 500.0}
+	assert summary["ipfs"]["cache_hit_ratio"] == pytest.approx(2 / 3)
+	gateway = summary["ipfs"]["gateways"]["https://gw/"]
+	assert (gateway["requests"], gateway["errors"], gateway["latency_seconds_sum"]) == (2, 1, 40.2)
+	assert gateway["latency_buckets"]["0.1"] == 0
+	assert gateway["latency_buckets"]["0.25"] == 1
+	assert gateway["latency_buckets"]["30.0"] == 1
+	assert summary["db"] == {"writes": 1, "bytes": 100, "seconds": 0.01}
+
+
+def test_summary_without_samples_has_no_rates() -> None:
+	"""Rates of empty counters should be null rather than a division error."""
+
+	summary = metrics.SyncMetrics().summary()
+
+	assert summary["subgraph"]["pages_per_second"] is None
+	assert summary["subgraph"]["rows_per_page"] is None
+	assert summary["ipfs"]["cache_hit_ratio"] is None
+	assert summary["ipfs"]["gateways"] == {}
+
+
+def test_to_prometheus_exposes_counters_and_histograms() -> None:
+	"""The text exposition should hold typed counters and cumulative histograms per gateway."""
+
+	sync_metrics = metrics.SyncMetrics()
+	sync_metrics.record_subgraph_page(rows=3, seconds=0.5)
+	sync_metrics.record_ipfs_request('https://g"w/', 0.3, ok=False)
+
+	lines = sync_metrics.to_prometheus().splitlines()
+
+	assert "# TYPE mech_sync_subgraph_pages_total counter" in lines
+	assert "mech_sync_subgraph_rows_total 3" in lines
+	assert "# TYPE mech_sync_ipfs_request_seconds histogram" in lines
+	label = 'gateway="https://g\\"w/"'
+	assert f'mech_sync_ipfs_request_seconds_bucket{{{label},le="0.25"}} 0' in lines
+	assert f'mech_sync_ipfs_request_seconds_bucket{{{label},le="0.5"}} 1' in lines
+	assert f'mech_sync_ipfs_request_seconds_bucket{{{label},le="+Inf"}} 1' in lines
+	assert f"mech_sync_ipfs_request_seconds_count{{{label}}} 1" in lines
+	assert f"mech_sync_ipfs_request_errors_total{{{label}}} 1" in lines
+
+
+def test_emit_prints_json_and_writes_prometheus_file(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+	"""Emitting should print the JSON summary and replace the text file, each only if requested."""
+
+	sync_metrics = metrics.SyncMetrics()
+	sync_metrics.record_db_write(10, 0.5)
+	path = tmp_path / "textfile" / "mech_sync.prom"
+
+	sync_metrics.emit()
+	assert capsys.readouterr().out == ""
+
+	sync_metrics.emit(json_summary=True, prometheus_path=path)
+
+	assert json.loads(capsys.readouterr().out)["db"]["bytes"] == 10
+	assert path.read_text(encoding="utf-8") == sync_metrics.to_prometheus()
+	assert not list(path.parent.glob("*.tmp"))
+
+
+def test_sync_pipeline_records_metrics(
+	sync_metrics: metrics.SyncMetrics, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+	"""Subgraph pages, IPFS requests, cache lookups and database writes should all be recorded."""
+
+	class _Session:
+		def execute(self, _query: Any, variable_values: dict[str, Any]) -> dict[str, Any]:
+			return {"requests": [{"id": "1"}, {"id": "2"}] if variable_values["id_gt"] == "" else []}
+
+	class _Response:
+		def raise_for_status(self) -> None:
+			"""No-op successful status."""
+
+		def json(self) -> Any:
+			return {"tool": "t", "prompt": "q"}
+
+	monkeypatch.setattr(mech_events, "_get_mech_subgraph_session", _Session)
+	monkeypatch.setattr(ipfs, "ipfs_cache", ipfs.IpfsCache(tmp_path / "ipfs_cache"))
+	monkeypatch.setattr(ipfs, "ipfs_gateways", ipfs.IpfsGateways(["https://gw/"]))
+	monkeypatch.setattr(ipfs.requests, "get", lambda *_args, **_kwargs: _Response())
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", tmp_path / "mech_events.json")
+
+	list(mech_events._iter_mech_events_subgraph_pages(["0xabc"], mech_events.MechRequest))
+	for _ in range(2):
+		event = mech_events.MechRequest.from_dict({"event_id": "1", "event_name": "Request", "ipfs_hash": "QmA", "ipfs_hash_bytes": None})
+		event._populate_ipfs_contents()
+	with mech_events_db.JsonMechEventsStore() as store:
+		store.upsert_event("0xabc", "Request", {"event_id": "1", "block_timestamp": 1})
+
+	summary = sync_metrics.summary()
+	assert (summary["subgraph"]["pages"], summary["subgraph"]["rows"]) == (2, 2)
+	assert summary["ipfs"]["gateways"]["https://gw/"]["requests"] == 1
+	assert (summary["ipfs"]["cache_hits"], summary["ipfs"]["cache_misses"]) == (1, 1)
+	# The journal append, then its fsync on close.
+	assert summary["db"]["writes"] == 2
+	assert summary["db"]["bytes"] > 0
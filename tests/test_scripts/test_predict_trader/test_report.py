@@ -100,19 +100,6 @@ def test_retrade_average_and_max_messages(monkeypatch: pytest.MonkeyPatch) -> No
 	assert report._max_trades_per_market_since_message({}) == "0 trades per market"
 
 
-def test_get_mech_requests_count(monkeypatch: pytest.MonkeyPatch) -> None:
-	"""Should count only requests above the timestamp threshold."""
-	report = _load_report_module(monkeypatch)
-
-	mech_requests = {
-		"a": {"block_timestamp": 100},
-		"b": {"block_timestamp": 200},
-		"c": {"block_timestamp": 50},
-	}
-
-	assert report._get_mech_requests_count(mech_requests, timestamp=100) == 1
-
-
 def test_warning_message(monkeypatch: pytest.MonkeyPatch) -> None:
 	"""Should emit warning text only when current value is below threshold."""
 	report = _load_report_module(monkeypatch)
@@ -263,7 +250,7 @@ def _run_report_main(
 	}
 	monkeypatch.setattr(trades_module, "get_mech_requests", lambda *_args, **_kwargs: {})
 	monkeypatch.setattr(trades_module, "get_mech_statistics", lambda *_args, **_kwargs: {})
-	monkeypatch.setattr(trades_module, "_query_omen_xdai_subgraph", lambda *_args, **_kwargs: trades_json)
+	monkeypatch.setattr(trades_module, "get_omen_trades", lambda *_args, **_kwargs: trades_json)
 	monkeypatch.setattr(trades_module, "parse_user", lambda *_args, **_kwargs: ("ok", stats_table))
 
 	balance_calls = {"count": 0}
@@ -0,0 +1,221 @@
+"""Unit tests for predict_trader.standin_server."""
+
+import json
+import runpy
+import socketserver
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+import requests
+
+from scripts.predict_trader import ipfs, mech_events, mech_events_db, standin_server, trades
+
+SENDER = "0x00000000000000000000000000000000000000aa"
+OTHER_SENDER = "0x00000000000000000000000000000000000000bb"
+
+
+@pytest.fixture
+def serve(monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+	"""Start stand-in servers on free ports, with the scripts pointed at the last one."""
+
+	servers = []
+
+	def _serve(dataset: dict[str, Any], **kwargs: Any) -> standin_server.StandinServer:
+		server = standin_server.StandinServer(dataset, ("127.0.0.1", 0), **kwargs)
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		servers.append(server)
+		for env_var, url in server.env_overrides().items():
+			monkeypatch.setenv(env_var, url)
+		return server
+
+	mech_events._get_mech_subgraph_session.cache_clear()
+	yield _serve
+	mech_events._get_mech_subgraph_session.cache_clear()
+	for server in servers:
+		server.shutdown()
+		server.server_close()
+
+
+def test_execute_query_filters_sorts_and_paginates() -> None:
+	"""The Graph filters, ordering and pagination should be applied to the entities."""
+
+	entities = {
+		"fpmmTrades": [
+			{"id": "0x3", "creationTimestamp": "30", "creator": {"id": "0xaa"}, "fpmm": {"id": "m1", "creator": "0xc1"}},
+			{"id": "0x1", "creationTimestamp": "100", "creator": {"id": "0xaa"}, "fpmm": {"id": "m2", "creator": "0xc2"}},
+			{"id": "0x2", "creationTimestamp": "9", "creator": {"id": "0xaa"}, "fpmm": {"id": "m3", "creator": "0xc1"}},
+			{"id": "0x4", "creationTimestamp": "50", "creator": {"id": "0xbb"}, "fpmm": {"id": "m4", "creator": "0xc1"}},
+		]
+	}
+	query = """
+		query trades($creator: ID, $skip: Int) {
+			trades: fpmmTrades(
+				where: {creator: $creator, creationTimestamp_gt: "8", id_not_in: ["0x9"], fpmm_: {creator_in: ["0xC1"]}}
+				orderBy: creationTimestamp
+				orderDirection: desc
+				first: 1
+				skip: $skip
+			) {
+				id
+				market: fpmm { id }
+				__typename
+			}
+		}
+	"""
+
+	assert standin_server.execute_query(entities, query, {"creator": "0xAA", "skip": 0}) == {
+		"trades": [{"id": "0x3", "market": {"id": "m1"}}]
+	}
+	assert standin_server.execute_query(entities, query, {"creator": "0xaa", "skip": 1})["trades"][0]["id"] == "0x2"
+	assert standin_server.execute_query(entities, query, {"creator": "0xaa", "skip": 2}) == {"trades": []}
+	assert standin_server.execute_query(entities, '{ fpmmTrades(where: {fpmm_: {missing: "x"}}) { id } }') == {"fpmmTrades": []}
+	assert [
+		trade["id"]
+		for trade in standin_server.execute_query(
+			entities, '{ fpmmTrades(where: {creationTimestamp_gte: 30, creationTimestamp_lte: 50, id_not: "0x4", id_gt: null}) { id } }'
+		)["fpmmTrades"]
+	] == ["0x3"]
+	assert standin_server.execute_query(entities, '{ fpmmTrades(where: {creationTimestamp_lt: 10}) { id } }') == {
+		"fpmmTrades": [{"id": "0x2"}]
+	}
+
+
+def test_execute_query_looks_up_single_entities_with_nested_collections() -> None:
+	"""A singular root field should look the entity up by id, and query its nested collections."""
+
+	entities = {
+		"users": [
+			{
+				"id": "0xaa",
+				"userPositions": [{"id": f"p{i}", "balance": str(i), "position": {"id": f"c{i}"}} for i in range(5)],
+			}
+		]
+	}
+	query = trades.conditional_tokens_gc_user_query.substitute(id="0xaa", first=2, userPositions_id_gt="p1")
+
+	result = standin_server.execute_query(entities, query)
+
+	assert [position["id"] for position in result["user"]["userPositions"]] == ["p2", "p3"]
+	assert result["user"]["userPositions"][0]["totalBalance"] is None
+	assert standin_server.execute_query(entities, '{ user(id: "0xbb") { id } }') == {"user": None}
+
+
+def test_server_serves_subgraphs_and_ipfs_documents(serve: Any) -> None:
+	"""Known subgraphs and documents should be served, and anything else rejected."""
+
+	server = serve({"subgraphs": {"mech": {"requests": [{"id": "1"}]}}, "ipfs": {"QmA/metadata.json": {"tool": "t"}}})
+
+	response = requests.post(f"{server.url}/subgraphs/mech", json={"query": "{ requests { id } }"}, timeout=5)
+	assert response.json() == {"data": {"requests": [{"id": "1"}]}}
+	assert requests.post(f"{server.url}/subgraphs/omen", json={"query": "{ a { id } }"}, timeout=5).status_code == 404
+	assert requests.post(f"{server.url}/subgraphs/mech", json={"query": "{ requests {"}, timeout=5).status_code == 400
+	assert requests.post(f"{server.url}/subgraphs/mech", data="not json", timeout=5).status_code == 400
+	assert requests.get(f"{server.url}/ipfs/QmA/metadata.json", timeout=5).json() == {"tool": "t"}
+	assert requests.get(f"{server.url}/ipfs/QmB", timeout=5).status_code == 404
+	assert requests.get(f"{server.url}/other", timeout=5).status_code == 404
+
+
+def test_server_injects_seeded_errors(serve: Any) -> None:
+	"""Errors should be injected at the configured rate, reproducibly for a seed."""
+
+	def _statuses(server: standin_server.StandinServer) -> list[int]:
+		return [requests.get(f"{server.url}/ipfs/QmA", timeout=5).status_code for _ in range(20)]
+
+	dataset = {"ipfs": {"QmA": {}}}
+	first = _statuses(serve(dataset, error_rate=0.5, seed=7))
+	second = _statuses(serve(dataset, error_rate=0.5, seed=7))
+
+	assert first == second
+	assert set(first) == {200, 500}
+	assert requests.post(f"{serve(dataset, error_rate=1.0).url}/subgraphs/mech", json={}, timeout=5).status_code == 500
+
+
+def test_mech_sync_against_the_stand_in(serve: Any, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+	"""The Mech events sync should page through the stand-in subgraph and fetch its IPFS documents."""
+
+	dataset = standin_server.synthetic_mech_dataset([SENDER, OTHER_SENDER], 25)
+	del dataset["ipfs"][f"Qm{2:044d}/metadata.json"]
+	serve(dataset, latency=0.001)
+	monkeypatch.setattr(mech_events, "QUERY_BATCH_SIZE", 4)
+	monkeypatch.setattr(mech_events_db, "MECH_EVENTS_JSON_PATH", tmp_path / "mech_events.json")
+	monkeypatch.setattr(ipfs, "ipfs_cache", ipfs.IpfsCache(tmp_path / "ipfs_cache"))
+	monkeypatch.setattr(ipfs, "ipfs_gateways", ipfs.IpfsGateways())
+
+	mech_events.sync_mech_requests([SENDER, OTHER_SENDER], interactive=False)
+
+	requests_by_id = mech_events.get_mech_requests(SENDER, sync=False)
+	assert len(requests_by_id) == 13
+	assert len(mech_events.get_mech_requests(OTHER_SENDER, sync=False)) == 12
+	assert requests_by_id["0x" + "0" * 64]["question"] == "Will event 0 happen?"
+	assert requests_by_id["0x" + "0" * 63 + "2"]["ipfs_contents"] == {}
+	assert len(mech_events.get_mech_requests(SENDER, from_timestamp=1700000040, sync=False)) == 9
+
+
+def test_subgraph_urls_are_overridden_by_the_environment(serve: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+	"""An overridden subgraph should be queried without a subgraph API key."""
+
+	positions = [{"id": f"p{i}", "position": {"id": f"c{i}", "conditionIds": [f"0x{i}"]}} for i in range(3)]
+	serve({"subgraphs": {"conditional-tokens": {"users": [{"id": SENDER, "userPositions": positions}]}}})
+	monkeypatch.setattr(trades, "QUERY_BATCH_SIZE", 2)
+	monkeypatch.setattr(trades, "get_subgraph_api_key", lambda: pytest.fail("The API key should not be read"))
+
+	result = trades._query_conditional_tokens_gc_subgraph(SENDER)
+
+	assert [position["id"] for position in result["data"]["user"]["userPositions"]] == ["p0", "p1", "p2"]
+
+	monkeypatch.delenv(trades.OMEN_SUBGRAPH_URL_ENV_VAR)
+	monkeypatch.setattr(trades, "get_subgraph_api_key", lambda: "k")
+	assert trades._get_subgraph_url(trades.OMEN_SUBGRAPH_URL_ENV_VAR, trades.OMEN_SUBGRAPH_ID).endswith(
+		"/api/k/subgraphs/id/9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
+	)
+
+
+def test_ipfs_gateways_are_overridden_by_the_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""The environment should override the default gateways, but not explicit ones."""
+
+	monkeypatch.setenv(ipfs.IPFS_GATEWAYS_ENV_VAR, "http://a/ipfs/,http://b/ipfs/")
+
+	assert ipfs.IpfsGateways().gateways == ["http://a/ipfs/", "http://b/ipfs/"]
+	assert ipfs.IpfsGateways(["http://c/ipfs/"]).gateways == ["http://c/ipfs/"]
+
+
+def test_main_serves_recorded_and_synthetic_data(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+	"""The CLI should merge the recorded and synthetic data, print the overrides and stop on Ctrl+C."""
+
+	served = {}
+
+	def _serve_forever(server: Any, *_args: Any) -> None:
+		served.update(subgraphs=server.subgraphs, ipfs=server.ipfs)
+		raise KeyboardInterrupt
+
+	data_path = tmp_path / "recorded.json"
+	data_path.write_text(json.dumps({"subgraphs": {"omen": {"fpmmTrades": []}}, "ipfs": {"QmA": {}}}), encoding="utf-8")
+	monkeypatch.setattr(socketserver.BaseServer, "serve_forever", _serve_forever)
+	monkeypatch.setattr(
+		sys,
+		"argv",
+		["standin_server", "--port", "0", "--data", str(data_path), "--synthetic-mech-requests", "2", "--sender", SENDER],
+	)
+	monkeypatch.delitem(sys.modules, "scripts.predict_trader.standin_server")
+
+	runpy.run_module("scripts.predict_trader.standin_server", run_name="__main__")
+
+	assert set(served["subgraphs"]) == {"omen", "mech"}
+	assert len(served["ipfs"]) == 3
+	output = capsys.readouterr().out
+	assert "export MECH_SUBGRAPH_URL=http://127.0.0.1:" in output
+	assert output.endswith("Stand-in server stopped.\n")
+
+
+def test_main_requires_senders_of_synthetic_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Synthetic Mech requests should not be generated without a sender."""
+
+	monkeypatch.setattr(sys, "argv", ["standin_server", "--synthetic-mech-requests", "2"])
+
+	with pytest.raises(SystemExit):
+		standin_server.main()
@@ -3,6 +3,7 @@
 import datetime
 import runpy
 import sys
+import threading
 import traceback
 from pathlib import Path
 from typing import Any
@@ -10,7 +11,7 @@ from typing import Any
 import pytest
 import requests
 
-from scripts.predict_trader import trades
+from scripts.predict_trader import standin_server, trades, trades_db
 from scripts import utils as scripts_utils
 
 
@@ -111,12 +112,15 @@ def test_query_omen_xdai_subgraph_paginates(
 	"""Should paginate by creationTimestamp for each FPMM creator."""
 
 	creator = "0x" + "c" * 40
-	calls: list[dict[str, Any]] = []
-	responses = [
-		{"data": {"fpmmTrades": [{"id": "1", "creationTimestamp": "10", "fpmm": {"id": "m1"}}]}},
-		{"data": {"fpmmTrades": []}},
-		{"data": {"fpmmTrades": []}},
-	]
+	first_fpmm_creator = trades.FPMM_CREATORS[0].lower()
+	queries: list[str] = []
+
+	def _respond(request: Any, _context: Any) -> dict[str, Any]:
+		query = request.json()["query"]
+		queries.append(query)
+		if f'creator: "{first_fpmm_creator}"' in query and 'creationTimestamp_gt: "0"' in query:
+			return {"data": {"fpmmTrades": [{"id": "1", "creationTimestamp": "10", "fpmm": {"id": "m1"}}]}}
+		return {"data": {"fpmmTrades": []}}
 
 	operate_home = tmp_path / ".operate"
 	operate_home.mkdir(parents=True)
@@ -124,23 +128,151 @@ def test_query_omen_xdai_subgraph_paginates(
 	monkeypatch.setattr(scripts_utils, "OPERATE_HOME", operate_home)
 
 	url = "https://gateway-arbitrum.network.thegraph.com/api/k/subgraphs/id/9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
-	requests_mock.post(url, [{"json": responses[0]}, {"json": responses[1]}, {"json": responses[2]}])
+	requests_mock.post(url, json=_respond)
+
+	result = trades._query_omen_xdai_subgraph(creator, 1, 2, 3, 4)
 
-	original_to_content = trades._to_content
+	# A page shorter than QUERY_BATCH_SIZE is the last one.
+	assert len(queries) == 2
+	assert all('creationTimestamp_gt: "0"' in query for query in queries)
+	assert result["data"]["fpmmTrades"] == [{"id": "1", "creationTimestamp": "10", "fpmm": {"id": "m1"}}]
+	assert result["cursors"] == {first_fpmm_creator: (10, "1")}
 
-	def _capture(query: str) -> dict[str, Any]:
-		payload = original_to_content(query)
-		calls.append(payload)
-		return payload
 
-	monkeypatch.setattr(trades, "_to_content", _capture)
+def test_query_omen_xdai_subgraph_paginates_fpmm_creators_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""The FPMM creators should be paginated at the same time, and merged in their order."""
 
-	result = trades._query_omen_xdai_subgraph(creator, 1, 2, 3, 4)
+	both_started = threading.Barrier(len(trades.FPMM_CREATORS), timeout=5)
+	pages = {
+		fpmm_creator.lower(): [{"id": f"{i}", "creationTimestamp": "10", "fpmm": {"id": f"m{i}"}}]
+		for i, fpmm_creator in enumerate(trades.FPMM_CREATORS)
+	}
+
+	def _post(_url: str, payload: dict[str, Any], label: str) -> dict[str, Any]:
+		query = payload["query"]
+		fpmm_creator = next(fpmm_creator for fpmm_creator in pages if f'creator: "{fpmm_creator}"' in query)
+		# Only returns once every FPMM creator is being queried.
+		both_started.wait()
+		return {"data": {"fpmmTrades": pages[fpmm_creator]}}
 
-	assert len(calls) == 3
-	assert 'creationTimestamp_gt: "0"' in calls[0]["query"]
-	assert 'creationTimestamp_gt: "10"' in calls[1]["query"]
-	assert result["data"]["fpmmTrades"][0]["id"] == "1"
+	monkeypatch.setattr(trades, "_get_subgraph_url", lambda *_args: "http://omen")
+	monkeypatch.setattr(trades, "_post_subgraph_query", _post)
+
+	result = trades._query_omen_xdai_subgraph("0x" + "c" * 40)
+
+	assert [trade["id"] for trade in result["data"]["fpmmTrades"]] == ["0", "1"]
+
+
+def _omen_trade(trade_id: str, timestamp: int, fpmm_creator: str = trades.FPMM_CREATORS[0]) -> dict[str, Any]:
+	"""Build an Omen trade of the creator 0xcc..., as stored by the subgraph."""
+	return {
+		"id": trade_id,
+		"type": "Buy",
+		"creator": {"id": "0x" + "c" * 40},
+		"creationTimestamp": str(timestamp),
+		"fpmm": {"id": f"m{trade_id}", "creator": fpmm_creator.lower(), "creationTimestamp": "1"},
+	}
+
+
+def test_query_omen_xdai_subgraph_does_not_skip_trades_of_the_same_second(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Trades sharing a second across page boundaries should all be queried once, and resumed from the cursor."""
+
+	# Seven trades in the same second, more than a page, listed out of id order.
+	entities = {
+		"fpmmTrades": [_omen_trade("0x05", 5)]
+		+ [_omen_trade(f"0x2{i}", 20) for i in (6, 1, 4, 0, 3, 5, 2)]
+		+ [_omen_trade("0x30", 30), _omen_trade("0x31", 31, trades.FPMM_CREATORS[1])]
+	}
+	queries: list[str] = []
+
+	def _post(_url: str, payload: dict[str, Any], label: str) -> dict[str, Any]:
+		queries.append(payload["query"])
+		return {"data": standin_server.execute_query(entities, payload["query"])}
+
+	monkeypatch.setattr(trades, "QUERY_BATCH_SIZE", 3)
+	monkeypatch.setattr(trades, "_get_subgraph_url", lambda *_args: "http://omen")
+	monkeypatch.setattr(trades, "_post_subgraph_query", _post)
+
+	result = trades._query_omen_xdai_subgraph("0x" + "c" * 40)
+
+	ids = [trade["id"] for trade in result["data"]["fpmmTrades"]]
+	assert sorted(ids) == sorted(trade["id"] for trade in entities["fpmmTrades"])
+	assert len(ids) == len(set(ids))
+	first, second = (fpmm_creator.lower() for fpmm_creator in trades.FPMM_CREATORS)
+	assert result["cursors"] == {first: (30, "0x30"), second: (31, "0x31")}
+
+	entities["fpmmTrades"] += [_omen_trade("0x3f", 30), _omen_trade("0x40", 40)]
+	queries.clear()
+	resumed = trades._query_omen_xdai_subgraph("0x" + "c" * 40, cursors=result["cursors"])
+
+	assert [trade["id"] for trade in resumed["data"]["fpmmTrades"]] == ["0x3f", "0x40"]
+	assert resumed["cursors"] == {first: (40, "0x40"), second: (31, "0x31")}
+	assert 'creationTimestamp: "30", id_gt: "0x30"' in queries[0] + queries[1]
+
+
+def test_get_omen_trades_syncs_new_trades_and_caches_closed_markets(
+	monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+	"""Only trades after the stored cursors should be queried, and only new or open markets refreshed."""
+
+	closed = {"currentAnswer": "0x0", "isPendingArbitration": False, "answerFinalizedTimestamp": "1", "openingTimestamp": "1"}
+	opening = {"currentAnswer": None, "isPendingArbitration": False, "answerFinalizedTimestamp": None, "openingTimestamp": "4000000000"}
+
+	def _market(fpmm_id: str, state: dict[str, Any]) -> dict[str, Any]:
+		return {"id": fpmm_id, "creationTimestamp": "1", "outcomes": ["Yes", "No"], "condition": {"id": f"c{fpmm_id}"}, **state}
+
+	entities = {
+		"fpmmTrades": [_omen_trade("1", 10), _omen_trade("2", 20)],
+		"fixedProductMarketMakers": [_market("m1", closed), _market("m2", opening)],
+	}
+	queries: list[str] = []
+
+	def _post(_url: str, payload: dict[str, Any], label: str) -> dict[str, Any]:
+		queries.append(payload["query"])
+		return {"data": standin_server.execute_query(entities, payload["query"])}
+
+	monkeypatch.setattr(trades_db, "OMEN_TRADES_SQLITE_PATH", tmp_path / "omen_trades.sqlite")
+	monkeypatch.setattr(trades, "_get_subgraph_url", lambda *_args: "http://omen")
+	monkeypatch.setattr(trades, "_post_subgraph_query", _post)
+	creator = "0x" + "C" * 40
+
+	first = trades.get_omen_trades(creator)
+
+	assert [(trade["fpmm"]["id"], trade["fpmm"]["condition"]["id"]) for trade in first["data"]["fpmmTrades"]] == [
+		("m1", "cm1"),
+		("m2", "cm2"),
+	]
+	(markets_query,) = [query for query in queries if "fixedProductMarketMakers" in query]
+	assert 'id_in: ["m1", "m2"]' in markets_query
+
+	entities["fpmmTrades"].append(_omen_trade("3", 30))
+	entities["fixedProductMarketMakers"] = [
+		_market("m1", {**closed, "currentAnswer": "0x1"}),
+		_market("m2", {**opening, "currentAnswer": "0x1", "answerFinalizedTimestamp": "4000000000"}),
+		_market("m3", opening),
+	]
+	queries.clear()
+
+	second = trades.get_omen_trades(creator, from_timestamp=15)
+
+	assert [(trade["id"], trade["fpmm"]["currentAnswer"]) for trade in second["data"]["fpmmTrades"]] == [
+		("2", "0x1"),
+		("3", None),
+	]
+	assert any('creationTimestamp: "20", id_gt: "2"' in query for query in queries)
+	# The closed market is served from the database.
+	(markets_query,) = [query for query in queries if "fixedProductMarketMakers" in query]
+	assert 'id_in: ["m2", "m3"]' in markets_query
+	assert trades.get_omen_trades(creator)["data"]["fpmmTrades"][0]["fpmm"]["currentAnswer"] == "0x0"
+
+
+def test_subgraph_queries_share_a_pooled_session() -> None:
+	"""All the subgraph queries should reuse the same session and its connections."""
+
+	session = trades._get_subgraph_session()
+
+	assert trades._get_subgraph_session() is session
+	assert session.get_adapter("https://gateway").poolmanager.connection_pool_kw["maxsize"] == trades.SUBGRAPH_POOL_MAXSIZE
 
 
 def test_query_conditional_tokens_gc_subgraph(
@@ -337,9 +469,32 @@ def test_is_redeemed_paths() -> None:
 	}
 	unknown = {"data": {"user": {"userPositions": []}}}
 
-	assert trades._is_redeemed(not_redeemed, fpmm_trade) is False
-	assert trades._is_redeemed(redeemed, fpmm_trade) is True
-	assert trades._is_redeemed(unknown, fpmm_trade) is False
+	assert trades._is_redeemed(trades._index_user_positions(not_redeemed), fpmm_trade) is False
+	assert trades._is_redeemed(trades._index_user_positions(redeemed), fpmm_trade) is True
+	assert trades._is_redeemed(trades._index_user_positions(unknown), fpmm_trade) is False
+
+
+def test_index_user_positions_by_condition() -> None:
+	"""Every condition of a position should index its balance, and held tokens should win over an empty position."""
+
+	user_json = {
+		"data": {
+			"user": {
+				"userPositions": [
+					{"balance": "0", "position": {"conditionIds": ["cond-1", "cond-2"]}},
+					{"balance": "10", "position": {"conditionIds": ["cond-1"]}},
+					{"balance": "5", "position": {"conditionIds": ["cond-2"]}},
+				]
+			}
+		}
+	}
+
+	position_balances = trades._index_user_positions(user_json)
+
+	assert position_balances == {"cond-1": {0, 10}, "cond-2": {0, 5}}
+	assert trades._index_user_positions({"data": {"user": None}}) == {}
+	assert trades._is_redeemed(position_balances, {"outcomeTokensTraded": "10", "fpmm": {"condition": {"id": "cond-1"}}}) is False
+	assert trades._is_redeemed(position_balances, {"outcomeTokensTraded": "10", "fpmm": {"condition": {"id": "cond-2"}}}) is True
 
 
 def test_compute_roi() -> None:
@@ -398,9 +553,9 @@ def test_format_table_and_mech_statistics() -> None:
 	assert "TOTAL" in rendered
 
 	mech_requests = {
-		"a": {"ipfs_contents": {"tool": "foo", "prompt": 'Ask "What is this?"'}, "fee": 10},
-		"b": {"ipfs_contents": {"tool": "foo", "prompt": "Simple prompt"}, "fee": 5},
-		"c": {"ipfs_contents": {"tool": trades.IRRELEVANT_TOOLS[0], "prompt": "skip"}, "fee": 99},
+		"a": {"tool": "foo", "question": "What is this?", "relevant": True, "fee": 10},
+		"b": {"tool": "foo", "question": "Simple prompt", "relevant": True, "fee": 5},
+		"c": {"tool": "openai-gpt-4", "question": "skip", "relevant": False, "fee": 99},
 	}
 	stats = trades.get_mech_statistics(mech_requests)
 
@@ -538,16 +693,20 @@ def test_parse_user_covers_status_branches(monkeypatch: pytest.MonkeyPatch) -> N
 	assert table[trades.MarketAttribute.NUM_REDEEMED][trades.MarketState.CLOSED] == 1
 
 
-def test_get_mech_statistics_skips_missing_ipfs_fields() -> None:
-	"""Missing ipfs tool/prompt keys should be ignored."""
+def test_get_mech_statistics_skips_irrelevant_and_unresolved_requests() -> None:
+	"""Only the requests flagged as relevant when stored should be aggregated."""
 
 	stats = trades.get_mech_statistics({
 		"a": {"fee": 1},
-		"b": {"ipfs_contents": {"tool": "x"}, "fee": 2},
-		"c": {"ipfs_contents": {"prompt": "q"}, "fee": 3},
+		"b": {"ipfs_contents": {}, "fee": 2},
+		"c": {"tool": None, "question": "q", "relevant": False, "fee": 3},
+		"d": {"tool": "foo", "question": "What is this?", "relevant": True, "fee": 10},
+		"e": {"ipfs_contents": {"tool": "foo"}, "tool": "foo", "question": "What is this?", "relevant": True, "fee": 5},
 	})
 
-	assert dict(stats) == {}
+	assert {question: dict(values) for question, values in stats.items()} == {
+		"What is this?": {"count": 2, "fees": 15}
+	}
 
 
 def test_main_execution_path(
@@ -579,6 +738,7 @@ def test_main_execution_path(
 	(operate_home / "subgraph_api_key.txt").write_text("dummy_key", encoding="utf-8")
 	monkeypatch.setattr(utils_module, "OPERATE_HOME", operate_home)
 	monkeypatch.setattr(mech_events, "get_mech_requests", lambda *_args, **_kwargs: {})
+	monkeypatch.setattr(trades_db, "OMEN_TRADES_SQLITE_PATH", tmp_path / "omen_trades.sqlite")
 
 	subgraph_url_a = "https://gateway-arbitrum.network.thegraph.com/api/dummy_key/subgraphs/id/9fUVQpFwzpdWS9bq5WkAnmKbNNcoBwatMR4yZq81pbbz"
 	subgraph_url_b = "https://gateway-arbitrum.network.thegraph.com/api/dummy_key/subgraphs/id/7s9rGBffUTL8kDZuxvvpuc46v44iuDarbrADBFw5uVp2"
@@ -0,0 +1,77 @@
+"""Unit tests for predict_trader.trades_db."""
+
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+from scripts.predict_trader import trades_db
+
+CREATOR = "0x" + "c" * 40
+
+
+def _trade(trade_id: str, timestamp: int, fpmm_id: str = "m1") -> dict[str, Any]:
+	"""Build a trade, as queried from the subgraph."""
+	return {"id": trade_id, "creationTimestamp": str(timestamp), "fpmm": {"id": fpmm_id}}
+
+
+def _market(fpmm_id: str, timestamp: int = 1, current_answer: Any = None) -> dict[str, Any]:
+	"""Build a market, as queried from the subgraph."""
+	return {"id": fpmm_id, "creationTimestamp": str(timestamp), "currentAnswer": current_answer}
+
+
+def test_store_keeps_trades_markets_and_cursors(tmp_path: Path) -> None:
+	"""Trades should be read back with their market, within the ranges."""
+
+	path = tmp_path / "omen_trades.sqlite"
+	with trades_db.OmenTradesStore(path) as store:
+		store.add_trades(CREATOR, [_trade("t1", 10), _trade("t2", 20, "m2")], {"0xf1": (20, "t2")})
+		store.add_trades(CREATOR, [_trade("t3", 30)], {"0xf1": (30, "t3"), "0xf2": (7, "x")})
+		store.add_trades("0x" + "d" * 40, [_trade("t4", 40, "m4")], {})
+		store.upsert_markets([(_market("m1"), False), (_market("m2", 5), False), (_market("m4"), False)])
+
+	with trades_db.OmenTradesStore(path) as store:
+		assert store.get_cursors(CREATOR) == {"0xf1": (30, "t3"), "0xf2": (7, "x")}
+		assert [trade["id"] for trade in store.get_trades(CREATOR, 0, 100, 0, 100)] == ["t1", "t2", "t3"]
+		assert store.get_trades(CREATOR, 0, 100, 0, 100)[0] == {"id": "t1", "creationTimestamp": "10", "fpmm": _market("m1")}
+		# Trades within the inclusive range, in markets created from 5 and before 6.
+		assert [trade["id"] for trade in store.get_trades(CREATOR, 10, 20, 5, 6)] == ["t2"]
+		assert store.get_trades(CREATOR, 10, 20, 5, 5) == []
+
+
+def test_only_missing_or_open_markets_are_unresolved(tmp_path: Path) -> None:
+	"""Closed markets should be final, and refreshing a market should update all its trades."""
+
+	with trades_db.OmenTradesStore(tmp_path / "omen_trades.sqlite") as store:
+		store.add_trades(CREATOR, [_trade("t1", 10), _trade("t2", 20), _trade("t3", 30, "m2"), _trade("t4", 40, "m3")], {})
+		assert store.get_unresolved_market_ids(CREATOR) == ["m1", "m2", "m3"]
+		# Trades whose market is not stored yet are left out.
+		assert store.get_trades(CREATOR, 0, 100, 0, 100) == []
+
+		store.upsert_markets([(_market("m1"), False), (_market("m2", current_answer="0x0"), True)])
+		assert store.get_unresolved_market_ids(CREATOR) == ["m1", "m3"]
+
+		store.upsert_markets([(_market("m1", current_answer="0x1"), True)])
+		assert store.get_unresolved_market_ids(CREATOR) == ["m3"]
+		assert [trade["fpmm"]["currentAnswer"] for trade in store.get_trades(CREATOR, 0, 100, 0, 100)] == ["0x1", "0x1", "0x0"]
+
+
+def test_store_of_another_version_is_emptied(tmp_path: Path) -> None:
+	"""A database of another version should be synced again from scratch."""
+
+	path = tmp_path / "omen_trades.sqlite"
+	with trades_db.OmenTradesStore(path) as store:
+		store.add_trades(CREATOR, [_trade("t1", 10)], {"0xf1": (10, "t1")})
+		store.upsert_markets([(_market("m1"), True)])
+	connection = sqlite3.connect(path)
+	connection.execute(f"PRAGMA user_version={trades_db.OMEN_TRADES_DB_VERSION - 1}")
+	connection.close()
+
+	with trades_db.OmenTradesStore(path) as store:
+		assert store.get_cursors(CREATOR) == {}
+		assert store.get_trades(CREATOR, 0, 100, 0, 100) == []
+
+	with trades_db.OmenTradesStore(path) as store:
+		store.add_trades(CREATOR, [_trade("t1", 10)], {})
+		store.upsert_markets([(_market("m1"), True)])
+	with trades_db.OmenTradesStore(path) as store:
+		assert len(store.get_trades(CREATOR, 0, 100, 0, 100)) == 1